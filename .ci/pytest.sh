@@ -68,5 +68,5 @@ pytest \
 	-x \
 	$cov_arg \
 	test \
-		-m "not skip_ci" \
+		-m "not skip_ci and not benchmark" \
 		"$@"
@@ -16,6 +16,7 @@ from .helpers import frontend
 from .helpers import logging as pmb_logging
 from .helpers import mount
 from .helpers import other
+from .helpers import shared_cache
 
 # pmbootstrap version
 __version__ = "2.3.1"
@@ -70,6 +71,7 @@ def main():
         # Migrate work folder if necessary
         if args.action not in ["shutdown", "zap", "log"]:
             other.migrate_work_folder(args)
+            shared_cache.link_dirs(args)
 
         # Run the function with the action's name (in pmb/helpers/frontend.py)
         if args.action:
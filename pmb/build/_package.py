@@ -4,6 +4,7 @@ import datetime
 import enum
 import logging
 import os
+import time
 
 import pmb.build
 import pmb.build.autodetect
@@ -221,6 +222,19 @@ def init_buildenv(args, apkbuild, arch, strict=False, force=False, cross=None,
     if not is_necessary_warn_depends(args, apkbuild, arch, force, built):
         return False
 
+    setup_buildenv(args, apkbuild, arch, depends, strict, cross, suffix,
+                   skip_init_buildenv, src)
+    return True
+
+
+def setup_buildenv(args, apkbuild, arch, depends, strict=False, cross=None,
+                   suffix="native", skip_init_buildenv=False, src=None):
+    """Setup the build environment for a package, after its dependencies
+    have been built (abuild, gcc, dependencies, cross-compiler).
+
+    :param depends: from get_depends()
+    See init_buildenv() for the other parameters.
+    """
     # Install and configure abuild, ccache, gcc, dependencies
     if not skip_init_buildenv:
         pmb.build.init(args, suffix)
@@ -236,12 +250,11 @@ def init_buildenv(args, apkbuild, arch, strict=False, force=False, cross=None,
 
     # Cross-compiler init
     if cross:
-        pmb.build.init_compiler(args, depends, cross, arch)
+        suffix_native = suffix if cross == "native" else "native"
+        pmb.build.init_compiler(args, depends, cross, arch, suffix_native)
     if cross == "crossdirect":
         pmb.chroot.mount_native_into_foreign(args, suffix)
 
-    return True
-
 
 def get_pkgver(original_pkgver, original_source=False, now=None):
     """Get the original pkgver when using the original source.
@@ -371,20 +384,14 @@ def link_to_git_dir(args, suffix):
                            "/home/pmos/build/.git"], suffix)
 
 
-def run_abuild(args, apkbuild, arch, strict=False, force=False, cross=None,
-               suffix="native", src=None, bootstrap_stage=BootstrapStage.NONE):
+def prepare_abuild(args, apkbuild, arch, strict=False, force=False,
+                   cross=None, suffix="native", src=None,
+                   bootstrap_stage=BootstrapStage.NONE, repodest=None):
     """
     Set up all environment variables and construct the abuild command (all
-    depending on the cross-compiler method and target architecture), copy
-    the aport to the chroot and execute abuild.
-
-    :param cross: None, "native", or "crossdirect"
-    :param src: override source used to build the package with a local folder
-    :param bootstrap_stage: pass a BOOTSTRAP= env var with the value to abuild
-    :returns: (output, cmd, env), output is the destination apk path relative
-              to the package folder ("x86_64/hello-1-r2.apk"). cmd and env are
-              used by the test case, and they are the full abuild command and
-              the environment variables dict generated in this function.
+    depending on the cross-compiler method and target architecture) and copy
+    the aport to the chroot. See run_abuild() for the parameters and the
+    return value.
     """
     # Sanity check
     if cross == "native" and "!tracedeps" not in apkbuild["options"]:
@@ -433,6 +440,9 @@ def run_abuild(args, apkbuild, arch, strict=False, force=False, cross=None,
     if bootstrap_stage:
         env["BOOTSTRAP"] = str(bootstrap_stage)
 
+    if repodest:
+        env["REPODEST"] = repodest
+
     # Build the abuild command
     cmd = ["abuild", "-D", "postmarketOS"]
     if strict or "pmb:strict" in apkbuild["options"]:
@@ -445,11 +455,49 @@ def run_abuild(args, apkbuild, arch, strict=False, force=False, cross=None,
     if force:
         cmd += ["-f"]
 
-    # Copy the aport to the chroot and build it
+    # Copy the aport to the chroot
     pmb.build.copy_to_buildpath(args, apkbuild["pkgname"], suffix)
     override_source(args, apkbuild, pkgver, src, suffix)
     link_to_git_dir(args, suffix)
+    return (output, cmd, env)
+
+
+def build_duration_save(apkbuild, arch, time_start):
+    """Remember how long a build took, for estimates in
+    pmb.build.scheduler.plan().
+
+    :param time_start: time.time() from before running abuild
+    """
+    pmb.helpers.other.persistent_cache_save(
+        "build_duration", f"{arch}/{apkbuild['pkgname']}", None,
+        round(time.time() - time_start))
+
+
+def run_abuild(args, apkbuild, arch, strict=False, force=False, cross=None,
+               suffix="native", src=None, bootstrap_stage=BootstrapStage.NONE,
+               repodest=None):
+    """
+    Set up all environment variables and construct the abuild command (all
+    depending on the cross-compiler method and target architecture), copy
+    the aport to the chroot and execute abuild.
+
+    :param cross: None, "native", or "crossdirect"
+    :param src: override source used to build the package with a local folder
+    :param bootstrap_stage: pass a BOOTSTRAP= env var with the value to abuild
+    :param repodest: let abuild write the packages and the index to this path
+                     inside the chroot instead of the local binary repository
+                     (used by pmb.build.scheduler to index it separately)
+    :returns: (output, cmd, env), output is the destination apk path relative
+              to the package folder ("x86_64/hello-1-r2.apk"). cmd and env are
+              used by the test case, and they are the full abuild command and
+              the environment variables dict generated in this function.
+    """
+    (output, cmd, env) = prepare_abuild(args, apkbuild, arch, strict, force,
+                                        cross, suffix, src, bootstrap_stage,
+                                        repodest)
+    time_start = time.time()
     pmb.chroot.user(args, cmd, suffix, "/home/pmos/build", env=env)
+    build_duration_save(apkbuild, arch, time_start)
     return (output, cmd, env)
 
 
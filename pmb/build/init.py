@@ -107,7 +107,11 @@ def init(args, suffix="native"):
     pathlib.Path(marker).touch()
 
 
-def init_compiler(args, depends, cross, arch):
+def init_compiler(args, depends, cross, arch, suffix="native"):
+    """Install the cross-compiler for arch.
+
+    :param suffix: native chroot to install it into
+    """
     cross_pkgs = ["ccache-cross-symlinks", "abuild"]
     if "gcc4" in depends:
         cross_pkgs += ["gcc4-" + arch]
@@ -127,4 +131,4 @@ def init_compiler(args, depends, cross, arch):
             # native macros / build scripts
             cross_pkgs += depends
 
-    pmb.chroot.apk.install(args, cross_pkgs)
+    pmb.chroot.apk.install(args, cross_pkgs, suffix)
@@ -4,9 +4,11 @@ import glob
 import logging
 import os
 import shlex
+import sys
 import datetime
 
 import pmb.chroot
+import pmb.config
 import pmb.helpers.file
 import pmb.helpers.git
 import pmb.helpers.pmaports
@@ -22,24 +24,23 @@ def copy_to_buildpath(args, package, suffix="native"):
         raise ValueError("Path does not contain an APKBUILD file:" +
                          aport)
 
-    # Clean up folder
-    build = args.work + "/chroot_" + suffix + "/home/pmos/build"
-    if os.path.exists(build):
-        pmb.chroot.root(args, ["rm", "-rf", "/home/pmos/build"], suffix)
-
-    # Copy aport contents with resolved symlinks
-    pmb.helpers.run.root(args, ["mkdir", "-p", build])
-    for entry in os.listdir(aport):
-        # Don't copy those dirs, as those have probably been generated by running `abuild`
-        # on the host system directly and not cleaning up after itself.
-        # Those dirs might contain broken symlinks and cp fails resolving them.
-        if entry in ["src", "pkg"]:
+    # Don't copy those dirs, as those have probably been generated by running `abuild`
+    # on the host system directly and not cleaning up after itself.
+    # Those dirs might contain broken symlinks and resolving them fails.
+    exclude = ["src", "pkg"]
+    for entry in exclude:
+        if os.path.lexists(f"{aport}/{entry}"):
             logging.warn(f"WARNING: Not copying {entry}, looks like a leftover from abuild")
-            continue
-        pmb.helpers.run.root(args, ["cp", "-rL", f"{aport}/{entry}", f"{build}/{entry}"])
 
-    pmb.chroot.root(args, ["chown", "-R", "pmos:pmos",
-                           "/home/pmos/build"], suffix)
+    # Replace the build folder with the aport contents (resolved symlinks,
+    # owned by pmos) in one privileged call. Files left from the previous
+    # build of the same aport don't get copied again if they are unchanged.
+    pmb.chroot.init(args, suffix)
+    home = f"{args.work}/chroot_{suffix}/home/pmos"
+    owner = os.stat(home)
+    script = f"{pmb.config.pmb_src}/pmb/data/sync-aport.py"
+    pmb.helpers.run.root(args, [sys.executable, script, aport, f"{home}/build",
+                                str(owner.st_uid), str(owner.st_gid)] + exclude)
 
 
 def is_necessary(args, arch, apkbuild, indexes=None):
@@ -52,6 +53,17 @@ def is_necessary(args, arch, apkbuild, indexes=None):
     :param indexes: list of APKINDEX.tar.gz paths
     :returns: boolean
     """
+    return is_necessary_reason(args, arch, apkbuild, indexes) is not None
+
+
+def is_necessary_reason(args, arch, apkbuild, indexes=None):
+    """Check why the package needs to be built.
+
+    See is_necessary() for the parameters.
+
+    :returns: None if the build is not necessary, otherwise the reason, e.g.
+              "No binary package available"
+    """
     package = apkbuild["pkgname"]
     version_pmaports = apkbuild["pkgver"] + "-r" + apkbuild["pkgrel"]
     msg = "Build is necessary for package '" + package + "': "
@@ -60,15 +72,16 @@ def is_necessary(args, arch, apkbuild, indexes=None):
     index_data = pmb.parse.apkindex.package(args, package, arch, False,
                                             indexes)
     if not index_data:
-        logging.debug(msg + "No binary package available")
-        return True
+        reason = "No binary package available"
+        logging.debug(msg + reason)
+        return reason
 
     # Can't build pmaport for arch: use Alpine's package (#1897)
     if arch and not pmb.helpers.pmaports.check_arches(apkbuild["arch"], arch):
         logging.verbose(f"{package}: build is not necessary, because pmaport"
                         " can't be built for {arch}. Using Alpine's binary"
                         " package.")
-        return False
+        return None
 
     # a) Binary repo has a newer version
     version_binary = index_data["version"]
@@ -76,16 +89,17 @@ def is_necessary(args, arch, apkbuild, indexes=None):
         logging.warning(f"WARNING: about to install {package} {version_binary}"
                         f" (local pmaports: {version_pmaports}, consider"
                         " 'pmbootstrap pull')")
-        return False
+        return None
 
     # b) Local pmaports has a newer version
     if version_pmaports != version_binary:
-        logging.debug(f"{msg}binary package out of date (binary: "
-                      f"{version_binary}, local pmaports: {version_pmaports})")
-        return True
+        reason = (f"binary package out of date (binary: {version_binary},"
+                  f" local pmaports: {version_pmaports})")
+        logging.debug(msg + reason)
+        return reason
 
     # Local pmaports and binary repo have the same version
-    return False
+    return None
 
 
 def index_repo(args, arch=None):
@@ -0,0 +1,399 @@
+# Copyright 2023 Oliver Smith
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Build multiple packages in parallel.
+
+The dependency graph of all packages gets resolved up front (like
+pmb.build.package() does it recursively while building), then independent
+packages get built at the same time, each one in its own build chroot
+("native", "native_2", "native_3", ...). Instead of letting abuild update the
+local binary repository, each build writes to a separate directory inside its
+chroot, and the packages get moved to the repository and indexed one build
+at a time with pmb.build.index_repo().
+
+Only abuild itself runs at the same time in multiple threads. Everything else
+(installing packages into the chroots, copying the aport, indexing) changes
+the caches of the session in pmb.helpers.other.cache, and runs one job at a
+time while holding the lock of packages().
+
+The same dependency graph is used by plan() to tell what would be built,
+without building anything ('pmbootstrap build --plan').
+"""
+import concurrent.futures
+import logging
+import threading
+import time
+
+import pmb.build
+import pmb.build._package
+import pmb.build.autodetect
+import pmb.build.other
+import pmb.chroot
+import pmb.config
+import pmb.config.pmaports
+import pmb.helpers.other
+from pmb.build._package import BootstrapStage
+from pmb.helpers.exceptions import BuildFailedError
+
+# Path inside the build chroots where abuild writes the packages to, before
+# they get moved to the local binary repository
+repodest = "/home/pmos/packages-scheduler"
+
+# Chroots that build jobs are currently installing packages into,
+# {suffix: job} (see job_setting_up())
+jobs_setup = {}
+
+
+def suffix_job(suffix, job):
+    """Get the chroot suffix for a parallel build job.
+
+    :param suffix: chroot suffix from pmb.build.autodetect.suffix()
+    :param job: number of the job, starting at 1
+    :returns: the suffix for the first job, e.g. "native", and the suffix with
+              the job number appended for all other jobs, e.g. "native_2"
+    """
+    if job == 1:
+        return suffix
+    return f"{suffix}_{job}"
+
+
+def job_setting_up(suffix):
+    """Find the build job that is installing packages into a chroot, so
+    pmb.chroot.apk.install() can build missing dependencies in the chroots of
+    that job.
+
+    :param suffix: chroot suffix, e.g. "native_2"
+    :returns: number of the job or None
+    """
+    return jobs_setup.get(suffix)
+
+
+def resolve(args, nodes, aliases, pkgname, arch=None, force=False,
+            strict=False, mark_built=True):
+    """Add a package and all its dependencies to the dependency graph.
+
+    This does the same checks as pmb.build.package(), but doesn't build
+    anything. Dependencies on packages that are currently being resolved
+    (circular dependencies) get ignored, just like pmb.build.package() stops
+    recursing when it reaches a package it has already seen in the session.
+
+    :param nodes: dict of the dependency graph, gets filled by this function:
+                  {(pkgname, arch): {"apkbuild": ..., "arch": ...,
+                                     "suffix": ..., "cross": ...,
+                                     "depends": [...],
+                                     "depends_nodes": [(pkgname, arch), ...],
+                                     "force": True/False,
+                                     "src": None,
+                                     "necessary": True/False,
+                                     "resolving": True/False}, ...}
+    :param aliases: dict of already resolved (pkgname, arch) pairs, with
+                    subpackage names pointing to the key of their aport in
+                    nodes (or None if nothing needs to be built)
+    :param mark_built: skip packages that were already built in this session
+                       and mark the resolved packages as built (like
+                       pmb.build.package() does it)
+    :returns: key of the node in nodes, or None if the package can't or
+              doesn't need to be built
+    """
+    arch = arch or pmb.config.arch_native
+    if (pkgname, arch) in aliases:
+        key = aliases[(pkgname, arch)]
+        if key is None or nodes[key]["resolving"]:
+            return None
+        return key
+
+    # Once per session is enough
+    aliases[(pkgname, arch)] = None
+    if mark_built and pmb.build._package.skip_already_built(pkgname, arch) \
+            and not force:
+        return None
+
+    # Only build when APKBUILD exists
+    apkbuild = pmb.build._package.get_apkbuild(args, pkgname, arch)
+    if not apkbuild:
+        return None
+    if not pmb.build._package.check_build_for_arch(args, pkgname, arch):
+        return None
+
+    # Subpackage of an aport that is already in the graph
+    key = (apkbuild["pkgname"], arch)
+    aliases[(pkgname, arch)] = key
+    if key in nodes:
+        if force:
+            nodes[key]["force"] = nodes[key]["necessary"] = True
+        return None if nodes[key]["resolving"] else key
+
+    suffix = pmb.build.autodetect.suffix(apkbuild, arch)
+    cross = pmb.build.autodetect.crosscompile(args, apkbuild, arch, suffix)
+    node = {"apkbuild": apkbuild,
+            "arch": arch,
+            "suffix": suffix,
+            "cross": cross,
+            "depends": pmb.build._package.get_depends(args, apkbuild),
+            "depends_nodes": [],
+            "force": force,
+            "src": None,
+            "necessary": False,
+            "resolving": True}
+    nodes[key] = node
+
+    # Dependencies
+    depends_arch = arch
+    if cross == "native":
+        depends_arch = pmb.config.arch_native
+    depends_built = []
+    if "no_depends" in args and args.no_depends:
+        # Only check that binary packages exist
+        pmb.build._package.build_depends(args, apkbuild, depends_arch, strict)
+    else:
+        for depend in node["depends"]:
+            if depend.startswith("!"):
+                continue
+            key_depend = resolve(args, nodes, aliases, depend, depends_arch,
+                                 strict=strict, mark_built=mark_built)
+            if not key_depend:
+                continue
+            if nodes[key_depend]["necessary"]:
+                depends_built.append(depend)
+            if key_depend not in node["depends_nodes"]:
+                node["depends_nodes"].append(key_depend)
+
+    node["resolving"] = False
+    node["necessary"] = pmb.build._package.is_necessary_warn_depends(
+        args, apkbuild, arch, force, depends_built)
+    return key
+
+
+def build_node(args, node, job, strict=False,
+               bootstrap_stage=BootstrapStage.NONE, lock=None):
+    """Build one package of the dependency graph in the chroot of a job.
+
+    :param node: from resolve()
+    :param job: number of the job, starting at 1
+    :param lock: held for everything but running abuild, as the other steps
+                 use the caches of the session and the native chroot
+    :returns: output path relative to the packages folder
+              ("armhf/ab-1-r2.apk")
+    """
+    apkbuild = node["apkbuild"]
+    arch = node["arch"]
+    cross = node["cross"]
+    force = node["force"]
+    src = node["src"]
+    suffix = suffix_job(node["suffix"], job)
+
+    with lock:
+        job_previous = jobs_setup.get(suffix)
+        jobs_setup[suffix] = job
+        try:
+            pmb.build._package.setup_buildenv(args, apkbuild, arch,
+                                              node["depends"], strict, cross,
+                                              suffix, src=src)
+        finally:
+            if job_previous:
+                jobs_setup[suffix] = job_previous
+            else:
+                del jobs_setup[suffix]
+        pmb.chroot.user(args, ["rm", "-rf", repodest], suffix)
+        (output, cmd, env) = pmb.build._package.prepare_abuild(
+            args, apkbuild, arch, strict, force, cross, suffix, src,
+            bootstrap_stage, repodest)
+
+    # The chroot was initialized above, don't touch the caches here
+    time_start = time.time()
+    try:
+        pmb.chroot.user(args, cmd, suffix, "/home/pmos/build", env=env,
+                        auto_init=False)
+    except RuntimeError:
+        raise BuildFailedError(f"Build for {arch}/{apkbuild['pkgname']}"
+                               " failed!")
+
+    with lock:
+        pmb.build._package.build_duration_save(apkbuild, arch, time_start)
+        repo = f"/home/pmos/packages/pmos/{arch}"
+        pmb.chroot.user(args, ["mkdir", "-p", repo], suffix)
+        pmb.chroot.user(args, ["sh", "-c", f"mv {repodest}/pmos/{arch}/*.apk"
+                               f" {repo}/"], suffix)
+        pmb.build.index_repo(args, arch)
+        pmb.build._package.finish(args, apkbuild, arch, output, strict,
+                                  suffix)
+    return output
+
+
+def packages(args, packages, force=False, strict=False, src=None,
+             bootstrap_stage=BootstrapStage.NONE, jobs=None, progress=None,
+             job=None):
+    """Build packages and their dependencies, with multiple packages being
+    built at the same time.
+
+    :param packages: list of (pkgname, arch) tuples to build
+    :param force: always build the given packages (not their dependencies),
+                  even if not necessary
+    :param src: override source used to build the given packages (not their
+                dependencies) with a local folder
+    :param jobs: amount of packages to build at the same time (default:
+                 args.parallel_builds)
+    :param progress: function that gets called with a message whenever a
+                     build starts, e.g. "building hello-world"
+    :param job: build one package at a time in the chroots of this job (for
+                dependencies that are missing while the job sets up its
+                chroot, see job_setting_up())
+    See pmb.build.package() for the other parameters.
+    :returns: dict of the given packages and their output paths relative to
+              the packages folder, or None if the build was not necessary:
+              {(pkgname, arch): "armhf/ab-1-r2.apk", ...}
+    """
+    jobs = 1 if job else int(jobs or args.parallel_builds)
+
+    # Resolve the dependency graph
+    nodes = {}
+    aliases = {}
+    for pkgname, arch in packages:
+        key = resolve(args, nodes, aliases, pkgname, arch, force, strict)
+        if key and src:
+            nodes[key]["src"] = src
+    todo = [key for key, node in nodes.items() if node["necessary"]]
+    logging.info(f"Building {len(todo)} package(s) with {jobs} parallel"
+                 " job(s)")
+
+    # Build everything, once all dependencies of a package are done
+    done = set()
+    outputs = {}
+    failed = []
+    pending = list(nodes.keys())
+    jobs_free = [job] if job else list(range(1, jobs + 1))
+    running = {}
+    lock = threading.Lock()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            # Start all packages that can be built now
+            changed = True
+            while changed and not failed:
+                changed = False
+                for key in list(pending):
+                    node = nodes[key]
+                    if any(depend not in done
+                           for depend in node["depends_nodes"]):
+                        continue
+                    if not node["necessary"]:
+                        pending.remove(key)
+                        done.add(key)
+                        changed = True
+                        continue
+                    if not jobs_free:
+                        break
+                    job = jobs_free.pop(0)
+                    if progress:
+                        progress(f"building {key[0]}")
+                    future = executor.submit(build_node, args, node, job,
+                                             strict, bootstrap_stage, lock)
+                    running[future] = (key, job)
+                    pending.remove(key)
+
+            if not running:
+                break
+
+            # Wait for any build to finish
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                key, job = running.pop(future)
+                jobs_free.append(job)
+                jobs_free.sort()
+                try:
+                    outputs[key] = future.result()
+                except Exception as e:
+                    failed.append(e)
+                    continue
+                done.add(key)
+
+    if failed:
+        raise failed[0]
+
+    ret = {}
+    for pkgname, arch in packages:
+        key = aliases.get((pkgname, arch or pmb.config.arch_native))
+        ret[(pkgname, arch)] = outputs.get(key)
+    return ret
+
+
+def plan(args, packages, force=False, strict=False):
+    """Get the packages that packages() or pmb.build.package() would build,
+    without building anything or initializing any chroot.
+
+    :param packages: list of (pkgname, arch) tuples to build
+    See packages() for the other parameters.
+    :returns: list of builds, with dependencies before the packages that
+              depend on them, e.g.:
+              [{"pkgname": "hello-world",
+                "arch": "x86_64",
+                "version": "1-r6",
+                "suffix": "native",
+                "cross": None,
+                "reason": "No binary package available",
+                "depends": ["x86_64/hello-world-lib"],
+                "cost": 42}, ...]
+              depends lists all builds that need to be finished first, cost
+              is the duration of the previous build in seconds (or None)
+    """
+    nodes = {}
+    aliases = {}
+    keys = []
+    for pkgname, arch in packages:
+        key = resolve(args, nodes, aliases, pkgname, arch, force, strict,
+                      mark_built=False)
+        if key:
+            keys.append(key)
+
+    # Dependencies on packages that don't need to be built get replaced with
+    # the dependencies of these packages
+    depends_builds = {}
+
+    def get_depends_builds(key):
+        if key not in depends_builds:
+            ret = []
+            for depend in nodes[key]["depends_nodes"]:
+                if nodes[depend]["necessary"]:
+                    ret.append(depend)
+                else:
+                    ret += get_depends_builds(depend)
+            depends_builds[key] = list(dict.fromkeys(ret))
+        return depends_builds[key]
+
+    # Order by visiting dependencies first
+    order = []
+    visited = set()
+
+    def visit(key):
+        if key in visited:
+            return
+        visited.add(key)
+        for depend in nodes[key]["depends_nodes"]:
+            visit(depend)
+        if nodes[key]["necessary"]:
+            order.append(key)
+
+    for key in keys:
+        visit(key)
+
+    ret = []
+    for key in order:
+        node = nodes[key]
+        apkbuild = node["apkbuild"]
+        pkgname, arch = key
+        if node["force"]:
+            reason = "Forced"
+        else:
+            reason = pmb.build.other.is_necessary_reason(args, arch, apkbuild)
+        cost = pmb.helpers.other.persistent_cache_load("build_duration",
+                                                       f"{arch}/{pkgname}",
+                                                       None)
+        ret.append({"pkgname": pkgname,
+                    "arch": arch,
+                    "version": f"{apkbuild['pkgver']}-r{apkbuild['pkgrel']}",
+                    "suffix": node["suffix"],
+                    "cross": node["cross"],
+                    "reason": reason,
+                    "depends": [f"{depend[1]}/{depend[0]}"
+                                for depend in get_depends_builds(key)],
+                    "cost": cost})
+    return ret
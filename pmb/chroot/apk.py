@@ -4,9 +4,11 @@ import os
 import logging
 import shlex
 
+import pmb.build.scheduler
 import pmb.chroot
 import pmb.config
 import pmb.helpers.apk
+import pmb.helpers.other
 import pmb.helpers.pmaports
 import pmb.parse.apkindex
 import pmb.parse.arch
@@ -115,6 +117,58 @@ def install_build(args, package, arch):
     return pmb.build.package(args, package, arch)
 
 
+def install_build_all(args, packages, arch, suffix="native"):
+    """
+    Build all outdated packages, like calling install_build() for each
+    package, but faster for long package lists (e.g. a device rootfs): first
+    find the outdated pmaports in one sweep over the cached APKBUILDs and the
+    merged APKINDEX, then only call pmb.build for these. With
+    --parallel-builds, they get built with pmb.build.scheduler.
+
+    :param packages: list of pkgnames, including all dependencies
+    :param arch: architecture of the packages to build
+    :param suffix: chroot that the packages get installed to. If a job of
+                   pmb.build.scheduler is setting it up, the packages get
+                   built in the chroots of that job.
+    """
+    # User may have disabled building packages during "pmbootstrap install"
+    if args.action == "install" and not args.build_pkgs_on_install:
+        for package in packages:
+            install_build(args, package, arch)
+        return
+
+    # Find outdated pmaports (packages that were already checked in this
+    # session were built or found up to date by pmb.build.package)
+    pmb.helpers.repo.update(args, arch)
+    checked = pmb.helpers.other.cache["built"].get(arch, [])
+    aports = set()
+    outdated = []
+    for package in packages:
+        if package in checked:
+            continue
+        apkbuild = pmb.helpers.pmaports.get(args, package, False)
+        if not apkbuild or apkbuild["pkgname"] in aports:
+            continue
+        aports.add(apkbuild["pkgname"])
+        if pmb.build.is_necessary(args, arch, apkbuild):
+            outdated.append(package)
+    logging.verbose(f"{len(outdated)} of {len(packages)} package(s) for"
+                    f" {arch} need to be built: {', '.join(outdated)}")
+    if not outdated:
+        return
+
+    # Dependencies of a parallel build are built in the chroots of its job,
+    # the chroots of the other jobs are in use
+    job = pmb.build.scheduler.job_setting_up(suffix)
+    if job or int(args.parallel_builds) > 1:
+        pmb.build.scheduler.packages(args, [(package, arch)
+                                            for package in outdated],
+                                     job=job)
+        return
+    for package in outdated:
+        pmb.build.package(args, package, arch)
+
+
 def packages_split_to_add_del(packages):
     """
     Sort packages into "to_add" and "to_del" lists depending on their pkgname
@@ -150,13 +204,19 @@ def packages_get_locally_built_apks(args, packages, arch):
     channel = pmb.config.pmaports.read_config(args)["channel"]
     ret = []
 
+    # List the local packages once instead of checking each file
+    repo = f"{args.work}/packages/{channel}/{arch}"
+    if not os.path.isdir(repo):
+        return ret
+    local_files = set(os.listdir(repo))
+
     for package in packages:
         data_repo = pmb.parse.apkindex.package(args, package, arch, False)
         if not data_repo:
             continue
 
         apk_file = f"{package}-{data_repo['version']}.apk"
-        if not os.path.exists(f"{args.work}/packages/{channel}/{arch}/{apk_file}"):
+        if apk_file not in local_files:
             continue
 
         ret.append(f"/mnt/pmbootstrap/packages/{arch}/{apk_file}")
@@ -239,8 +299,7 @@ def install(args, packages, suffix="native", build=True):
     to_add, to_del = packages_split_to_add_del(packages_with_depends)
 
     if build:
-        for package in to_add:
-            install_build(args, package, arch)
+        install_build_all(args, to_add, arch, suffix)
 
     to_add_local = packages_get_locally_built_apks(args, to_add, arch)
     to_add_no_deps, _ = packages_split_to_add_del(packages)
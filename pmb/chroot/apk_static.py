@@ -13,6 +13,7 @@ import pmb.config
 import pmb.config.load
 import pmb.parse.apkindex
 import pmb.helpers.http
+import pmb.helpers.repo
 import pmb.parse.version
 
 
@@ -142,15 +143,20 @@ def download(args, file):
     channel_cfg = pmb.config.pmaports.read_config_channel(args)
     mirrordir = channel_cfg["mirrordir_alpine"]
     base_url = f"{args.mirror_alpine}{mirrordir}/main/{pmb.config.arch_native}"
-    return pmb.helpers.http.download(args, f"{base_url}/{file}", file)
+    return pmb.helpers.http.download(args, f"{base_url}/{file}", file,
+                                     progress=True)
 
 
 def init(args):
     """
     Download, verify, extract $WORK/apk.static.
     """
-    # Get and parse the APKINDEX
-    apkindex = pmb.helpers.repo.alpine_apkindex_path(args, "main")
+    # Get and parse the APKINDEX (of the offline mirror, if it was imported)
+    mirror = pmb.helpers.repo.mirror_path(args)
+    if mirror:
+        apkindex = f"{mirror}/{pmb.config.arch_native}/APKINDEX.tar.gz"
+    else:
+        apkindex = pmb.helpers.repo.alpine_apkindex_path(args, "main")
     index_data = pmb.parse.apkindex.package(args, "apk-tools-static",
                                             indexes=[apkindex])
     version = index_data["version"]
@@ -161,7 +167,10 @@ def init(args):
 
     # Download, extract, verify apk-tools-static
     apk_name = f"apk-tools-static-{version}.apk"
-    apk_static = download(args, apk_name)
+    if mirror:
+        apk_static = f"{mirror}/{pmb.config.arch_native}/{apk_name}"
+    else:
+        apk_static = download(args, apk_name)
     extract(args, version, apk_static)
 
 
@@ -10,6 +10,7 @@ import pmb.chroot
 import pmb.chroot.apk_static
 import pmb.config
 import pmb.config.workdir
+import pmb.helpers.other
 import pmb.helpers.repo
 import pmb.helpers.run
 import pmb.parse.arch
@@ -121,6 +122,19 @@ def init(args, suffix="native", usr_merge=UsrMerge.AUTO,
                       pmbootstrap init.
     :param postmarketos_mirror: add postmarketos mirror URLs
     """
+    # Already prepared in this session (until shutdown, zap or umount_all).
+    # Calls with the default arguments (e.g. from pmb.chroot.root()) accept
+    # the configuration that the chroot was prepared with.
+    ready = pmb.helpers.other.cache["chroot_ready"]
+    config = (usr_merge, postmarketos_mirror)
+    if suffix in ready:
+        if ready[suffix] == config or config == (UsrMerge.AUTO, True):
+            return
+        # Prepared with other arguments: update the repository list again
+        updated = pmb.helpers.other.cache["apk_repository_list_updated"]
+        if suffix in updated:
+            updated.remove(suffix)
+
     # When already initialized: just prepare the chroot
     chroot = f"{args.work}/chroot_{suffix}"
     arch = pmb.parse.arch.from_chroot_suffix(args, suffix)
@@ -133,6 +147,7 @@ def init(args, suffix="native", usr_merge=UsrMerge.AUTO,
         copy_resolv_conf(args, suffix)
         pmb.chroot.apk.update_repository_list(args, suffix, postmarketos_mirror)
         warn_if_chroot_is_outdated(args, suffix)
+        ready[suffix] = config
         return
 
     # Require apk-tools-static
@@ -184,3 +199,4 @@ def init(args, suffix="native", usr_merge=UsrMerge.AUTO,
     # Upgrade packages in the chroot, in case alpine-base, apk, etc. have been
     # built from source with pmbootstrap
     pmb.chroot.root(args, ["apk", "--no-network", "upgrade", "-a"], suffix)
+    ready[suffix] = config
@@ -6,6 +6,7 @@ import os
 import pmb.config
 import pmb.parse
 import pmb.helpers.mount
+import pmb.helpers.repo
 
 
 def create_device_nodes(args, suffix):
@@ -16,16 +17,19 @@ def create_device_nodes(args, suffix):
         chroot = args.work + "/chroot_" + suffix
 
         # Create all device nodes as specified in the config
+        cmds = []
         for dev in pmb.config.chroot_device_nodes:
             path = chroot + "/dev/" + str(dev[4])
             if not os.path.exists(path):
-                pmb.helpers.run.root(args, ["mknod",
-                                            "-m", str(dev[0]),  # permissions
-                                            path,  # name
-                                            str(dev[1]),  # type
-                                            str(dev[2]),  # major
-                                            str(dev[3]),  # minor
-                                            ])
+                cmds.append(["mknod",
+                             "-m", str(dev[0]),  # permissions
+                             path,  # name
+                             str(dev[1]),  # type
+                             str(dev[2]),  # major
+                             str(dev[3]),  # minor
+                             ])
+        if cmds:
+            pmb.helpers.run.root_batch(args, cmds)
 
         # Verify major and minor numbers of created nodes
         for dev in pmb.config.chroot_device_nodes:
@@ -59,17 +63,17 @@ def mount_dev_tmpfs(args, suffix="native"):
     if pmb.helpers.mount.ismount(dev):
         return
 
-    # Create the $chroot/dev folder and mount tmpfs there
-    pmb.helpers.run.root(args, ["mkdir", "-p", dev])
-    pmb.helpers.run.root(args, ["mount", "-t", "tmpfs",
-                                "-o", "size=1M,noexec,dev",
-                                "tmpfs", dev])
-
-    # Create pts, shm folders and device nodes
-    pmb.helpers.run.root(args, ["mkdir", "-p", dev + "/pts", dev + "/shm"])
-    pmb.helpers.run.root(args, ["mount", "-t", "tmpfs",
-                                "-o", "nodev,nosuid,noexec",
-                                "tmpfs", dev + "/shm"])
+    # Create the $chroot/dev folder and mount tmpfs there, create pts and
+    # shm folders
+    pmb.helpers.run.root_batch(args, [
+        ["mkdir", "-p", dev],
+        ["mount", "-t", "tmpfs", "-o", "size=1M,noexec,dev", "tmpfs", dev],
+        ["mkdir", "-p", dev + "/pts", dev + "/shm"],
+        ["mount", "-t", "tmpfs", "-o", "nodev,nosuid,noexec", "tmpfs",
+         dev + "/shm"],
+    ])
+
+    # Create device nodes
     create_device_nodes(args, suffix)
 
     # Setup /dev/fd as a symlink
@@ -90,6 +94,11 @@ def mount(args, suffix="native"):
         source = source.replace("$CHANNEL", channel)
         mountpoints[source] = target
 
+    # Offline mirror, only if one was imported (see pmb.helpers.mirror)
+    mirror = pmb.helpers.repo.mirror_path(args)
+    if mirror:
+        mountpoints[mirror] = "/mnt/pmbootstrap/mirror"
+
     # Mount if necessary
     for source, target in mountpoints.items():
         target_full = args.work + "/chroot_" + suffix + target
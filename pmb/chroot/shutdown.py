@@ -8,6 +8,7 @@ from contextlib import closing
 
 import pmb.chroot
 import pmb.helpers.mount
+import pmb.helpers.other
 import pmb.install.losetup
 import pmb.parse.arch
 
@@ -89,6 +90,7 @@ def shutdown(args, only_install_related=False):
     # android recovery zip from its contents).
     for marker in glob.glob(f"{args.work}/chroot_*/in-pmbootstrap"):
         pmb.helpers.run.root(args, ["rm", marker])
+    pmb.helpers.other.cache["chroot_ready"].clear()
 
     if not only_install_related:
         # Umount all folders inside args.work
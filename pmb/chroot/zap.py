@@ -8,6 +8,7 @@ import os
 import pmb.chroot
 import pmb.config.pmaports
 import pmb.config.workdir
+import pmb.helpers.other
 import pmb.helpers.pmaports
 import pmb.helpers.run
 import pmb.parse.apkindex
@@ -15,7 +16,7 @@ import pmb.parse.apkindex
 
 def zap(args, confirm=True, dry=False, pkgs_local=False, http=False,
         pkgs_local_mismatch=False, pkgs_online_mismatch=False, distfiles=False,
-        rust=False, netboot=False):
+        rust=False, netboot=False, parse_cache=False):
     """
     Shutdown everything inside the chroots (e.g. adb), umount
     everything and then safely remove folders from the work-directory.
@@ -30,6 +31,9 @@ def zap(args, confirm=True, dry=False, pkgs_local=False, http=False,
     :param distfiles: Clear the downloaded files cache
     :param rust: Remove rust related caches
     :param netboot: Remove images for netboot
+    :param parse_cache: Remove the persistent caches of parsed files (see
+        pmb.helpers.other.persistent_cache_names), e.g. when one of them got
+        corrupted. The recorded build durations are kept.
 
     NOTE: This function gets called in pmb/config/init.py, with only args.work
     and args.device set!
@@ -54,6 +58,7 @@ def zap(args, confirm=True, dry=False, pkgs_local=False, http=False,
     # Deletion patterns for folders inside args.work
     patterns = [
         "chroot_native",
+        "chroot_native_*",
         "chroot_buildroot_*",
         "chroot_installer_*",
         "chroot_rootfs_*",
@@ -68,10 +73,14 @@ def zap(args, confirm=True, dry=False, pkgs_local=False, http=False,
         patterns += ["cache_rust"]
     if netboot:
         patterns += ["images_netboot"]
+    if parse_cache:
+        patterns += [f"cache_{name}"
+                     for name in pmb.helpers.other.persistent_cache_names]
 
     # Delete everything matching the patterns
     for pattern in patterns:
-        pattern = os.path.realpath(f"{args.work}/{pattern}")
+        # Only remove the symlinks to the shared cache, not its content
+        pattern = f"{os.path.realpath(args.work)}/{pattern}"
         matches = glob.glob(pattern)
         for match in matches:
             if (not confirm or
@@ -85,6 +94,7 @@ def zap(args, confirm=True, dry=False, pkgs_local=False, http=False,
 
     # Chroots were zapped, so no repo lists exist anymore
     pmb.helpers.other.cache["apk_repository_list_updated"].clear()
+    pmb.helpers.other.cache["chroot_ready"].clear()
 
     # Print amount of cleaned up space
     if dry:
@@ -91,7 +91,10 @@ config_keys = [
     "locale",
     "mirror_alpine",
     "mirrors_postmarketos",
+    "parallel_builds",
     "qemu_redir_stdio",
+    "root_helper",
+    "shared_cache",
     "ssh_key_glob",
     "ssh_keys",
     "sudo_timer",
@@ -127,7 +130,10 @@ defaults = {
     # NOTE: mirrors_postmarketos variable type is supposed to be
     #       comma-separated string, not a python list or any other type!
     "mirrors_postmarketos": "http://mirror.postmarketos.org/postmarketos/",
+    "parallel_builds": "1",
     "qemu_redir_stdio": False,
+    "root_helper": False,
+    "shared_cache": "",
     "ssh_key_glob": "~/.ssh/id_*.pub",
     "ssh_keys": False,
     "sudo_timer": False,
@@ -269,6 +275,17 @@ chroot_device_nodes = [
 # You can force-update them with 'pmbootstrap update'.
 apkindex_retention_time = 4
 
+# Maximum amount of files that get downloaded at the same time, e.g. when
+# updating all APKINDEX files
+http_download_jobs = 8
+
+# Size of the chunks that the output of commands gets read in, how often (in
+# seconds) it gets flushed to the log file while the command is running, and
+# how much of the output gets repeated in the log when the command fails
+run_output_chunk_size = 256 * 1024
+run_output_flush_interval = 0.5
+run_output_tail_size = 8 * 1024
+
 
 # When chroot is considered outdated (in seconds)
 chroot_outdated = 3600 * 24 * 2
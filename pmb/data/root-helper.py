@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# Copyright 2023 Oliver Smith
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Root helper of pmbootstrap (see pmb/helpers/root_helper.py), started
+once with sudo or doas to run commands as root without calling sudo or doas
+again for each command.
+
+Requests get read from stdin, one JSON object per line:
+    {"cmds": [["mkdir", "-p", "/some/path"], ...], "cwd": "/path" or null}
+The commands run in order until one of them fails. Then the results get
+written to stdout as one JSON object per line:
+    {"results": [[return code, "output"], ...]}
+
+This script must not import pmb, as it runs as root with the Python
+interpreter of the user. It exits when stdin gets closed.
+"""
+import json
+import subprocess
+import sys
+
+
+def main():
+    for line in sys.stdin:
+        request = json.loads(line)
+        results = []
+        for cmd in request["cmds"]:
+            try:
+                process = subprocess.run(cmd, cwd=request["cwd"],
+                                         stdin=subprocess.DEVNULL,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT)
+                results.append([process.returncode,
+                                process.stdout.decode("utf-8", "replace")])
+            except OSError as e:
+                results.append([127, f"{e}\n"])
+            if results[-1][0]:
+                break
+        sys.stdout.write(json.dumps({"results": results}) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
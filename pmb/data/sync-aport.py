@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Copyright 2023 Oliver Smith
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Copy an aport to the build folder of a chroot, called as root by
+pmb.build.other.copy_to_buildpath(). The result is the same as with:
+
+    rm -rf TARGET
+    cp -rL APORT TARGET
+    chown -R UID:GID TARGET
+
+But files in TARGET that are still the same as in APORT (same size and
+modification time, e.g. from the previous build attempt) don't get copied
+again.
+
+usage: sync-aport.py APORT TARGET UID GID [EXCLUDE...]
+EXCLUDE: top level entries of APORT that don't get copied
+"""
+import os
+import shutil
+import stat
+import sys
+
+
+# Open folders of the target without following symlinks
+O_DIR = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+
+
+def remove(dir_fd, name):
+    """Remove an entry of a folder of the target, without following
+    symlinks (unlike shutil.rmtree(), this works with python < 3.11)."""
+    if stat.S_ISDIR(os.lstat(name, dir_fd=dir_fd).st_mode):
+        fd = os.open(name, O_DIR, dir_fd=dir_fd)
+        try:
+            for entry in os.listdir(fd):
+                remove(fd, entry)
+        finally:
+            os.close(fd)
+        os.rmdir(name, dir_fd=dir_fd)
+    else:
+        os.unlink(name, dir_fd=dir_fd)
+
+
+def lstat(dir_fd, name):
+    try:
+        return os.lstat(name, dir_fd=dir_fd)
+    except FileNotFoundError:
+        return None
+
+
+def is_same(st_source, st_target, uid, gid):
+    return (stat.S_ISREG(st_target.st_mode) and
+            st_target.st_size == st_source.st_size and
+            st_target.st_mtime_ns == st_source.st_mtime_ns and
+            stat.S_IMODE(st_target.st_mode) == stat.S_IMODE(st_source.st_mode)
+            and st_target.st_uid == uid and st_target.st_gid == gid)
+
+
+def copy(path_source, st_source, dir_fd, name, uid, gid):
+    """Copy a file to a folder of the target. Write it to a new temp file
+    first, so a symlink that the build user placed in the target can't
+    redirect the write to a file outside of the chroot."""
+    temp = f".{name}.sync-aport"
+    if lstat(dir_fd, temp):
+        remove(dir_fd, temp)
+    fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW,
+                 0o600, dir_fd=dir_fd)
+    with open(fd, "wb") as handle, open(path_source, "rb") as handle_source:
+        shutil.copyfileobj(handle_source, handle)
+        handle.flush()
+        os.fchown(fd, uid, gid)
+        os.fchmod(fd, stat.S_IMODE(st_source.st_mode))
+        os.utime(fd, ns=(st_source.st_atime_ns, st_source.st_mtime_ns))
+    os.replace(temp, name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+
+
+def sync_fd(source, parent_fd, name, uid, gid, exclude=None):
+    """:returns: amount of copied files"""
+    # Create the target folder
+    st_target = lstat(parent_fd, name)
+    if st_target and not stat.S_ISDIR(st_target.st_mode):
+        os.unlink(name, dir_fd=parent_fd)
+        st_target = None
+    if not st_target:
+        os.mkdir(name, stat.S_IMODE(os.stat(source).st_mode),
+                 dir_fd=parent_fd)
+    fd = os.open(name, O_DIR, dir_fd=parent_fd)
+    try:
+        os.fchown(fd, uid, gid)
+
+        # Remove what is not in the source anymore
+        names = [entry for entry in os.listdir(source)
+                 if entry not in (exclude or [])]
+        for entry in os.listdir(fd):
+            if entry not in names:
+                remove(fd, entry)
+
+        # Copy with resolved symlinks
+        ret = 0
+        for entry in sorted(names):
+            path_source = f"{source}/{entry}"
+            st_source = os.stat(path_source)
+            if stat.S_ISDIR(st_source.st_mode):
+                ret += sync_fd(path_source, fd, entry, uid, gid)
+                continue
+
+            st_target = lstat(fd, entry)
+            if st_target:
+                if is_same(st_source, st_target, uid, gid):
+                    continue
+                if stat.S_ISDIR(st_target.st_mode):
+                    remove(fd, entry)
+
+            copy(path_source, st_source, fd, entry, uid, gid)
+            ret += 1
+        return ret
+    finally:
+        os.close(fd)
+
+
+def sync(source, target, uid, gid, exclude=None):
+    """The build user may modify the target folder, therefore all changes in
+    it are done relative to file descriptors of its folders, and symlinks in
+    it never get followed.
+
+    :returns: amount of copied files"""
+    parent_fd = os.open(os.path.dirname(os.path.abspath(target)),
+                        os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        return sync_fd(source, parent_fd, os.path.basename(target), uid, gid,
+                       exclude)
+    finally:
+        os.close(parent_fd)
+
+
+def main():
+    aport, target, uid, gid = sys.argv[1:5]
+    copied = sync(aport, target, int(uid), int(gid), sys.argv[5:])
+    print(f"sync-aport: {copied} file(s) copied to {target}")
+
+
+if __name__ == "__main__":
+    main()
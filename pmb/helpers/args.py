@@ -112,6 +112,7 @@ def init(args):
     pmb.config.merge_with_args(args)
     replace_placeholders(args)
     pmb.helpers.other.init_cache()
+    pmb.helpers.other.persistent_cache_work = args.work
 
     # Initialize logs (we could raise errors below)
     pmb.helpers.logging.init(args)
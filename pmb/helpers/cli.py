@@ -110,23 +110,28 @@ def confirm(args, question="Continue?", default=False, no_assumptions=False):
     return answer == "y"
 
 
-def progress_print(args, progress):
+def progress_print(args, progress, text=None):
     """Print a snapshot of a progress bar to STDOUT.
 
     Call progress_flush to end  printing progress and clear the line. No output is printed in
     non-interactive mode.
 
     :param progress: completion percentage as a number between 0 and 1
+    :param text: displayed after the progress bar, e.g. "1.2 MiB / 4.0 MiB"
     """
     width = 79
     try:
         width = os.get_terminal_size().columns - 6
     except OSError:
         pass
+    if text:
+        width = max(width - len(text) - 1, 0)
     chars = int(width * progress)
     filled = "\u2588" * chars
     empty = " " * (width - chars)
     percent = int(progress * 100)
+    if text:
+        empty += " " + text
     if pmb.config.is_interactive and not args.details_to_stdout:
         sys.stdout.write(f"\u001b7{percent:>3}% {filled}{empty}")
         sys.stdout.flush()
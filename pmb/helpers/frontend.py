@@ -9,6 +9,7 @@ import sys
 import pmb.aportgen
 import pmb.build
 import pmb.build.autodetect
+import pmb.build.scheduler
 import pmb.chroot
 import pmb.chroot.initfs
 import pmb.chroot.other
@@ -21,6 +22,7 @@ import pmb.helpers.devices
 import pmb.helpers.git
 import pmb.helpers.lint
 import pmb.helpers.logging
+import pmb.helpers.mirror
 import pmb.helpers.pkgrel_bump
 import pmb.helpers.pmaports
 import pmb.helpers.repo
@@ -96,6 +98,16 @@ def aportgen(args):
 
 
 def build(args):
+    # Only print what would be built
+    if args.plan:
+        packages = [(package, args.arch or
+                     pmb.build.autodetect.arch(args, package))
+                    for package in args.packages]
+        force = args.force or bool(args.src)
+        print(json.dumps(pmb.build.scheduler.plan(args, packages, force,
+                                                  args.strict), indent=4))
+        return
+
     # Strict mode: zap everything
     if args.strict:
         pmb.chroot.zap(args, False)
@@ -118,6 +130,19 @@ def build(args):
             f"build {package} for {arch_package}")
 
     # Build all packages
+    if int(args.parallel_builds) > 1:
+        packages = [(package, args.arch or
+                     pmb.build.autodetect.arch(args, package))
+                    for package in args.packages]
+        outputs = pmb.build.scheduler.packages(args, packages, force,
+                                               args.strict, src)
+        for (package, arch_package), output in outputs.items():
+            if not output:
+                logging.info("NOTE: Package '" + package + "' is up to date."
+                             " Use 'pmbootstrap build " + package +
+                             " --force' if needed.")
+        return
+
     for package in args.packages:
         arch_package = args.arch or pmb.build.autodetect.arch(args, package)
         if not pmb.build.package(args, package, arch_package, force,
@@ -153,6 +178,14 @@ def netboot(args):
         pmb.netboot.start_nbd_server(args)
 
 
+def mirror(args):
+    if args.action_mirror == "export":
+        pmb.helpers.mirror.export(args, args.bundle, args.mirror_device,
+                                  args.packages)
+    elif args.action_mirror == "import":
+        pmb.helpers.mirror.import_bundle(args, args.bundle)
+
+
 def chroot(args):
     # Suffix
     suffix = _parse_suffix(args)
@@ -574,7 +607,8 @@ def zap(args):
                    distfiles=args.distfiles, pkgs_local=args.pkgs_local,
                    pkgs_local_mismatch=args.pkgs_local_mismatch,
                    pkgs_online_mismatch=args.pkgs_online_mismatch,
-                   rust=args.rust, netboot=args.netboot)
+                   rust=args.rust, netboot=args.netboot,
+                   parse_cache=args.parse_cache)
 
     # Don't write the "Done" message
     pmb.helpers.logging.disable()
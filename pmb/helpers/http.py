@@ -1,67 +1,397 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
+import concurrent.futures
 import hashlib
+import http.client
 import json
 import logging
 import os
-import shutil
+import threading
+import time
+import urllib.error
+import urllib.parse
 import urllib.request
 
+import pmb.config
+import pmb.helpers.cli
 import pmb.helpers.run
+import pmb.helpers.shared_cache
+
+# Open connections of the current thread, {(scheme, netloc): connection}
+connections = threading.local()
+
+
+def connection(scheme, netloc, reconnect=False):
+    """Get a connection to a host that can be reused for multiple requests
+    from the same thread.
+
+    :param scheme: "http" or "https"
+    :param netloc: host and optionally port, e.g. "example.org:8080"
+    :param reconnect: close the existing connection and open a new one
+    """
+    if not hasattr(connections, "pool"):
+        connections.pool = {}
+    key = (scheme, netloc)
+    if reconnect and key in connections.pool:
+        connections.pool.pop(key).close()
+    if key not in connections.pool:
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(netloc, timeout=60)
+        else:
+            conn = http.client.HTTPConnection(netloc, timeout=60)
+        connections.pool[key] = conn
+    return connections.pool[key]
+
+
+def request(url, headers=None):
+    """Send a GET request.
+
+    Plain http(s) URLs are fetched through a connection that is kept open for
+    the next request to the same host. Everything else (other schemes,
+    proxies, redirects) is handled by urllib.
+
+    :param headers: dict of additional HTTP headers, e.g. for conditional
+                    requests: {"If-None-Match": etag}
+    :returns: the response with status 200 or 206 (read it until the end, so
+              the connection can be reused), or None if the server responded
+              with 304 Not Modified
+    :raises: urllib.error.HTTPError if the server responded with an error,
+             urllib.error.URLError if the connection failed
+    """
+    headers = {"User-Agent": f"pmbootstrap/{pmb.__version__}",
+               **(headers or {})}
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme not in ["http", "https"] or \
+            (urllib.request.getproxies().get(parsed.scheme) and
+             not urllib.request.proxy_bypass(parsed.hostname)):
+        return request_urllib(url, headers)
+
+    path = parsed.path or "/"
+    if parsed.query:
+        path += "?" + parsed.query
+
+    # Retry once with a new connection, the server may have closed it
+    for reconnect in [False, True]:
+        conn = connection(parsed.scheme, parsed.netloc, reconnect)
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            break
+        except (http.client.HTTPException, OSError) as e:
+            if reconnect:
+                connection(parsed.scheme, parsed.netloc, True)
+                # Same exception as urllib.request.urlopen() would raise
+                raise urllib.error.URLError(e)
+
+    if response.status in [301, 302, 303, 307, 308]:
+        response.read()
+        return request_urllib(url, headers)
+    if response.status == 304:
+        response.read()
+        return None
+    if response.status not in [200, 206]:
+        response.read()
+        raise urllib.error.HTTPError(url, response.status, response.reason,
+                                     response.headers, None)
+    return response
+
+
+def request_urllib(url, headers):
+    """Implementation of request() with urllib.request.urlopen()."""
+    try:
+        return urllib.request.urlopen(urllib.request.Request(url,
+                                                             headers=headers))
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+
+def validators_load(path):
+    """Get the validators of a file in the cache (see validators_save()).
+
+    :param path: path to the (partially) downloaded file in the cache
+    :returns: {"etag": ..., "last_modified": ..., "size": ...} or None
+    """
+    try:
+        with open(f"{path}.validators", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def validators_save(path, headers, size):
+    """Store the validators of a downloaded file next to it in the cache.
+
+    :param path: path to the (partially) downloaded file in the cache
+    :param headers: response headers
+    :param size: size of the complete file, None for partial downloads
+    """
+    validators = {"etag": headers.get("ETag"),
+                  "last_modified": headers.get("Last-Modified"),
+                  "size": size}
+    if not validators["etag"] and not validators["last_modified"]:
+        validators_delete(path)
+        return
+    with open(f"{path}.validators", "w", encoding="utf-8") as handle:
+        json.dump(validators, handle)
+
+
+def validators_delete(path):
+    if os.path.exists(f"{path}.validators"):
+        os.remove(f"{path}.validators")
+
+
+def part_remove(path_temp):
+    """Remove a partially downloaded file and its validators."""
+    if os.path.exists(path_temp):
+        os.remove(path_temp)
+    validators_delete(path_temp)
+
+
+def verify(path, size=None, sha256=None):
+    """Check the size and checksum of a downloaded file.
+
+    :returns: None if the file is valid, otherwise the reason why not
+    """
+    if size is not None and os.path.getsize(path) != size:
+        return f"expected size {size}, got {os.path.getsize(path)}"
+    if sha256:
+        digest = hashlib.sha256()
+        with open(path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+                digest.update(chunk)
+        if digest.hexdigest() != sha256:
+            return f"expected sha256 {sha256}, got {digest.hexdigest()}"
+    return None
 
 
 def download(args, url, prefix, cache=True, loglevel=logging.INFO,
-             allow_404=False):
+             allow_404=False, size=None, sha256=None, progress=False):
     """Download a file to disk.
 
+    The file gets downloaded to a .part file first, which is renamed once the
+    download is complete. If a previous download was interrupted, it gets
+    resumed from where it stopped (if the server still has the same file).
+
     :param url: the http(s) address of to the file to download
     :param prefix: for the cache, to make it easier to find (cache files
         get a hash of the URL after the prefix)
-    :param cache: if True, and url is cached, do not download it again
+    :param cache: if True, and url is cached, do not download it again. If
+        False, and url is cached, ask the server whether it has changed
+        (with the ETag and Last-Modified headers of the previous download)
+        and only download it again if it did.
     :param loglevel: change to logging.DEBUG to only display the download
         message in 'pmbootstrap log', not in stdout.
         We use this when downloading many APKINDEX files at once, no
         point in showing a dozen messages.
     :param allow_404: do not raise an exception when the server responds with a 404 Not Found error.
         Only display a warning on stdout (no matter if loglevel is changed).
+    :param size: expected size of the file in bytes
+    :param sha256: expected sha256 checksum of the file
+    :param progress: print the received bytes and the throughput with
+        pmb.helpers.cli.progress_print()
 
     :returns: path to the downloaded file in the cache or None on 404
     """
     # Create cache folder
-    if not os.path.exists(args.work + "/cache_http"):
-        pmb.helpers.run.user(args, ["mkdir", "-p", args.work + "/cache_http"])
+    os.makedirs(args.work + "/cache_http", exist_ok=True)
 
     # Check if file exists in cache
     prefix = prefix.replace("/", "_")
     path = (args.work + "/cache_http/" + prefix + "_" +
             hashlib.sha256(url.encode("utf-8")).hexdigest())
+    headers = {}
+    if not os.path.exists(path):
+        shared_cache_get(args, url, path)
     if os.path.exists(path):
-        if cache:
+        invalid = verify(path, size, sha256)
+        if invalid:
+            logging.verbose(f"Ignoring invalid file in cache ({invalid}):"
+                            f" {path}")
+        elif cache:
             return path
-        pmb.helpers.run.user(args, ["rm", path])
+        else:
+            validators = validators_load(path)
+            if validators and validators["size"] == os.path.getsize(path):
+                if validators["etag"]:
+                    headers["If-None-Match"] = validators["etag"]
+                if validators["last_modified"]:
+                    headers["If-Modified-Since"] = validators["last_modified"]
 
     # Offline and not cached
     if args.offline:
         raise RuntimeError("File not found in cache and offline flag is"
                            f" enabled: {url}")
 
+    # Resume an interrupted download, unless the file changed on the server
+    path_temp = f"{path}.part"
+    offset = os.path.getsize(path_temp) if os.path.exists(path_temp) else 0
+    validators = validators_load(path_temp) if offset else None
+    if validators and size is not None and offset >= size:
+        # Interrupted after the last write, but before it was moved
+        if not verify(path_temp, size, sha256):
+            logging.debug("Download was complete already: " + url)
+            return download_finish(args, url, path,
+                                   validators_headers(validators), size,
+                                   sha256)
+        part_remove(path_temp)
+        validators = None
+    if validators:
+        headers = {"Range": f"bytes={offset}-",
+                   "If-Range": validators["etag"] or
+                   validators["last_modified"]}
+
     # Download the file
-    logging.log(loglevel, "Download " + url)
+    logging.log(loglevel, "Download " + url +
+                (f" (resuming at {offset} bytes)" if validators else ""))
     try:
-        with urllib.request.urlopen(url) as response:
-            with open(path, "wb") as handle:
-                shutil.copyfileobj(response, handle)
-    # Handle 404
+        response = request(url, headers)
     except urllib.error.HTTPError as e:
+        if validators:
+            # 416 Range Not Satisfiable: the .part file may be complete
+            content_range = e.headers.get("Content-Range") if e.headers \
+                else None
+            if e.code == 416 and content_range == f"bytes */{offset}" and \
+                    not verify(path_temp, size, sha256):
+                logging.debug("Download was complete already: " + url)
+                return download_finish(args, url, path,
+                                       validators_headers(validators), size,
+                                       sha256)
+            logging.verbose(f"Failed to resume the download ({e}), starting"
+                            f" from the beginning: {url}")
+            part_remove(path_temp)
+            return download(args, url, prefix, cache, loglevel, allow_404,
+                            size, sha256, progress)
+        # Handle 404
         if e.code == 404 and allow_404:
             logging.warning("WARNING: file not found: " + url)
             return None
         raise
 
-    # Return path in cache
+    # Not modified: keep the file, but mark it as recent
+    if response is None:
+        logging.debug("Not modified since the last download: " + url)
+        os.utime(path)
+        return path
+
+    with response:
+        # Start from the beginning unless the server sent the missing part
+        if response.status != 206:
+            offset = 0
+        validators_save(path_temp, response.headers, None)
+        total = response.headers.get("Content-Length")
+        total = offset + int(total) if total else size
+        received = offset
+        time_start = time.monotonic()
+        with open(path_temp, "r+b" if offset else "wb") as handle:
+            handle.seek(offset)
+            handle.truncate()
+            for chunk in iter(lambda: response.read(64 * 1024), b""):
+                handle.write(chunk)
+                received += len(chunk)
+                if progress:
+                    download_progress(args, received, received - offset,
+                                      total, time_start)
+        if progress:
+            pmb.helpers.cli.progress_flush(args)
+        headers = response.headers
+
+    return download_finish(args, url, path, headers, size, sha256)
+
+
+def validators_headers(validators):
+    """:returns: validators of validators_load() as response headers"""
+    return {"ETag": validators["etag"],
+            "Last-Modified": validators["last_modified"]}
+
+
+def download_finish(args, url, path, headers, size, sha256):
+    """Verify a downloaded .part file and move it to the final path.
+
+    :param headers: response headers with the validators of the file
+    :returns: path to the downloaded file in the cache
+    """
+    path_temp = f"{path}.part"
+    invalid = verify(path_temp, size, sha256)
+    if invalid:
+        part_remove(path_temp)
+        raise RuntimeError(f"Download failed, {invalid}: {url}")
+    validators_delete(path_temp)
+    os.replace(path_temp, path)
+    validators_save(path, headers, os.path.getsize(path))
+    shared_cache_set(args, url, path)
     return path
 
 
+def shared_cache_get(args, url, path):
+    """Link a file that was downloaded by another work dir from the shared
+    cache (see pmb.helpers.shared_cache) into the cache of this work dir,
+    together with its validators.
+
+    :returns: True if the file was found in the shared cache
+    """
+    if not pmb.helpers.shared_cache.get_path(args):
+        return False
+    entry = pmb.helpers.shared_cache.url_get(args, url)
+    if not entry:
+        return False
+    logging.debug(f"Found in the shared cache: {url}")
+    pmb.helpers.shared_cache.clone(
+        pmb.helpers.shared_cache.blob_path(args, entry["sha256"]), path)
+    validators_save(path, validators_headers(entry), entry["size"])
+    return True
+
+
+def shared_cache_set(args, url, path):
+    """Add a downloaded file to the shared cache, if it is enabled."""
+    if not pmb.helpers.shared_cache.get_path(args):
+        return
+    sha256 = pmb.helpers.shared_cache.insert(args, path)
+    pmb.helpers.shared_cache.url_set(args, url, sha256, validators_load(path))
+
+
+def download_progress(args, received, received_now, total, time_start):
+    """Print the progress of a download.
+
+    :param received: bytes of the file that were downloaded so far
+    :param received_now: bytes that were downloaded in this session
+    :param total: size of the file in bytes or None if unknown
+    :param time_start: time.monotonic() of when the download started
+    """
+    elapsed = max(time.monotonic() - time_start, 0.001)
+    text = f"{received / 1024 / 1024:.1f} MiB"
+    if total:
+        text += f" / {total / 1024 / 1024:.1f} MiB"
+    text += f", {received_now / 1024 / 1024 / elapsed:.1f} MiB/s"
+    pmb.helpers.cli.progress_print(args, min(received / total, 1) if total
+                                   else 0, text)
+
+
+def download_many(args, urls, prefix, cache=True, loglevel=logging.INFO,
+                  allow_404=False, progress=True):
+    """Download multiple files to disk at the same time.
+
+    See download() for the parameters.
+
+    :param urls: list of http(s) addresses to download
+    :param progress: print a progress bar with pmb.helpers.cli.progress_print
+    :returns: {url: path to the downloaded file in the cache or None on 404}
+    """
+    ret = {}
+    jobs = min(pmb.config.http_download_jobs, len(urls)) or 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(download, args, url, prefix, cache,
+                                   loglevel, allow_404): url for url in urls}
+        for future in concurrent.futures.as_completed(futures):
+            ret[futures[future]] = future.result()
+            if progress:
+                pmb.helpers.cli.progress_print(args, len(ret) / len(urls))
+    if progress:
+        pmb.helpers.cli.progress_flush(args)
+    return {url: ret[url] for url in urls}
+
+
 def retrieve(url, headers=None, allow_404=False):
     """Fetch the content of a URL and returns it as string.
 
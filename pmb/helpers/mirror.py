@@ -0,0 +1,251 @@
+# Copyright 2023 Oliver Smith
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""
+Offline mirror: a self-contained binary package repository with all packages
+needed to install a device and to build packages for it, so pmbootstrap can
+be used without network access ('pmbootstrap mirror export/import').
+
+Bundle layout:
+- mirror.cfg: channel, architectures and device of the bundle
+- keys/: public key that the APKINDEX files are signed with
+- $ARCH/APKINDEX.tar.gz, $ARCH/*.apk: one repository per architecture
+
+An imported bundle is stored in $WORK/mirror/$CHANNEL, which gets mounted
+as /mnt/pmbootstrap/mirror in the chroots and added to the repository list
+(see pmb.helpers.repo.urls()).
+"""
+import configparser
+import datetime
+import glob
+import logging
+import os
+import shlex
+
+import pmb.build
+import pmb.chroot
+import pmb.config
+import pmb.config.other
+import pmb.config.pmaports
+import pmb.helpers.http
+import pmb.helpers.mount
+import pmb.helpers.repo
+import pmb.helpers.run
+import pmb.helpers.shared_cache
+import pmb.install._install
+import pmb.parse
+import pmb.parse.apkindex
+import pmb.parse.depends
+
+# Where the bundle gets mounted in the native chroot while exporting it
+path_chroot_export = "/mnt/pmbootstrap/mirror-export"
+
+
+def read_config(bundle):
+    """:returns: the [mirror] section of the mirror.cfg of a bundle"""
+    cfg_path = f"{bundle}/mirror.cfg"
+    if not os.path.exists(cfg_path):
+        raise RuntimeError(f"Not a pmbootstrap mirror bundle: {bundle}")
+    cfg = configparser.ConfigParser()
+    cfg.read(cfg_path)
+    return cfg["mirror"]
+
+
+def sources(args, arch):
+    """Get all binary repositories that packages can be copied from.
+
+    :returns: list of (APKINDEX path, repository) tuples, where the
+              repository is a local folder or a URL. The APKINDEX files are
+              in the same order as in pmb.helpers.repo.apkindex_files().
+    """
+    channel = pmb.config.pmaports.read_config(args)["channel"]
+    ret = [(f"{args.work}/packages/{channel}/{arch}/APKINDEX.tar.gz",
+            f"{args.work}/packages/{channel}")]
+    mirror = pmb.helpers.repo.mirror_path(args)
+    if mirror:
+        ret.append((f"{mirror}/{arch}/APKINDEX.tar.gz", mirror))
+    for url in pmb.helpers.repo.urls(args, False):
+        ret.append((f"{args.work}/cache_apk_{arch}/APKINDEX."
+                    f"{pmb.helpers.repo.hash(url)}.tar.gz", url))
+    return ret
+
+
+def find_files(args, pkgnames, arch):
+    """Find the binary packages for a list of pkgnames.
+
+    :param pkgnames: from pmb.parse.depends.recurse()
+    :returns: {"$pkgname-$pkgver-r$pkgrel.apk": path or URL, ...}
+    """
+    ret = {}
+    missing = []
+    repos = sources(args, arch)
+    for pkgname in pkgnames:
+        if pkgname.startswith("!"):
+            continue
+        block = pmb.parse.apkindex.package(args, pkgname, arch, False)
+        if not block:
+            missing.append(pkgname)
+            continue
+
+        # Find the repository with the same version
+        filename = f"{block['pkgname']}-{block['version']}.apk"
+        for index, repo in repos:
+            providers = pmb.parse.apkindex.parse(index).get(block["pkgname"])
+            if not providers or block["pkgname"] not in providers:
+                continue
+            if providers[block["pkgname"]]["version"] == block["version"]:
+                ret[filename] = f"{repo}/{arch}/{filename}"
+                break
+        else:
+            missing.append(pkgname)
+
+    if missing:
+        raise RuntimeError(f"No binary packages found for {arch}: "
+                           f"{', '.join(missing)}. Build them with"
+                           " 'pmbootstrap build', then try again.")
+    return ret
+
+
+def device_packages(args):
+    """Get the packages that 'pmbootstrap install' would install for the
+    device and UI selected in args (without the options of install).
+
+    :returns: list of pkgnames
+    """
+    ret = pmb.config.install_device_packages + [f"device-{args.device}"]
+    if args.ui.lower() != "none":
+        ret += [f"postmarketos-ui-{args.ui}"]
+        if args.ui_extras:
+            ret += [f"postmarketos-ui-{args.ui}-extras"]
+    if pmb.config.other.is_systemd_selected(args):
+        ret += ["postmarketos-base-systemd"]
+    ret += pmb.install._install.get_selected_providers(args, ret)
+    ret += pmb.install._install.get_kernel_package(args, args.device)
+    ret += pmb.install._install.get_nonfree_packages(args, args.device)
+    if args.extra_packages.lower() != "none":
+        ret += args.extra_packages.split(",")
+    if pmb.config.pmaports.read_config(args).get("supported_base_nofde"):
+        ret += ["postmarketos-base-nofde"]
+    ret += pmb.install._install.get_recommends(args, ret)
+    return ret
+
+
+def export(args, bundle, device=None, packages=None):
+    """Write a bundle with all packages needed to install a device and to
+    build packages for it (including all dependencies).
+
+    :param bundle: output folder
+    :param device: defaults to args.device
+    :param packages: additional packages to add to the bundle
+    """
+    if device and device != args.device:
+        args.device = device
+        args.deviceinfo = pmb.parse.deviceinfo(args, device)
+    arch_native = pmb.config.arch_native
+    arch_device = args.deviceinfo["arch"]
+    channel = pmb.config.pmaports.read_config(args)["channel"]
+    if os.path.exists(bundle) and os.listdir(bundle):
+        raise RuntimeError(f"Output folder is not empty: {bundle}")
+
+    # Packages to install for each architecture
+    base = ["alpine-base"] + pmb.config.build_packages
+    pkgnames = {arch_native: base + ["apk-tools-static"] +
+                pmb.config.install_native_packages}
+    pkgnames[arch_device] = pkgnames.get(arch_device, base) + \
+        device_packages(args) + (packages or [])
+
+    # Initialize the native chroot and the signing key
+    pmb.helpers.repo.update(args, arch_native)
+    pmb.helpers.repo.update(args, arch_device)
+    pmb.build.init(args)
+
+    # Copy or download all packages
+    for arch in sorted(pkgnames):
+        suffix = "native" if arch == arch_native else f"buildroot_{arch}"
+        logging.info(f"Calculate dependencies for {arch}")
+        depends = pmb.parse.depends.recurse(args, pkgnames[arch], suffix)
+        files = find_files(args, depends, arch)
+
+        logging.info(f"Copy {len(files)} package(s) for {arch}")
+        urls = [source for source in files.values() if "://" in source]
+        downloaded = pmb.helpers.http.download_many(args, urls,
+                                                    f"apk_{arch}",
+                                                    loglevel=logging.DEBUG)
+        os.makedirs(f"{bundle}/{arch}", exist_ok=True)
+        for filename, source in files.items():
+            pmb.helpers.shared_cache.clone(downloaded.get(source, source),
+                                           f"{bundle}/{arch}/{filename}")
+
+    # Create the APKINDEX files with only these packages and sign them
+    index_bundle(args, bundle, sorted(pkgnames))
+
+    os.makedirs(f"{bundle}/keys", exist_ok=True)
+    for key in glob.glob(f"{args.work}/config_abuild/*.pub"):
+        pmb.helpers.shared_cache.clone(key, f"{bundle}/keys/"
+                                       f"{os.path.basename(key)}")
+
+    cfg = configparser.ConfigParser()
+    cfg["mirror"] = {"channel": channel,
+                     "arches": ",".join(sorted(pkgnames)),
+                     "device": args.device,
+                     "date": str(datetime.date.today())}
+    with open(f"{bundle}/mirror.cfg", "w") as handle:
+        cfg.write(handle)
+    logging.info(f"Mirror exported to: {bundle}")
+
+
+def index_bundle(args, bundle, arches):
+    """Create and sign the APKINDEX files of a bundle in the native chroot,
+    with the same key as the local binary repository (see
+    pmb.build.index_repo())."""
+    chroot = f"{args.work}/chroot_native"
+    pmb.helpers.mount.bind(args, os.path.realpath(bundle),
+                           f"{chroot}{path_chroot_export}")
+    try:
+        for arch in arches:
+            logging.info(f"(native) index {arch} repository")
+            description = f"pmbootstrap mirror {datetime.datetime.now()}"
+            index = f"/tmp/mirror_APKINDEX_{arch}.tar.gz"
+            commands = [
+                ["sh", "-c", f"apk -q index --output {index}"
+                 f" --description {shlex.quote(description)}"
+                 f" --rewrite-arch {shlex.quote(arch)} *.apk"],
+                ["abuild-sign", index],
+            ]
+            for command in commands:
+                pmb.chroot.user(args, command, working_dir=f"{path_chroot_export}"
+                                f"/{arch}")
+            pmb.helpers.shared_cache.clone(f"{chroot}{index}",
+                                           f"{bundle}/{arch}/APKINDEX.tar.gz")
+            pmb.chroot.user(args, ["rm", index])
+    finally:
+        pmb.helpers.mount.umount_all(args, f"{chroot}{path_chroot_export}")
+
+
+def import_bundle(args, bundle):
+    """Install a bundle as offline mirror of the current channel, replacing
+    a previously imported one. Afterwards, use it with 'pmbootstrap
+    --offline'."""
+    cfg = read_config(bundle)
+    channel = pmb.config.pmaports.read_config(args)["channel"]
+    if cfg["channel"] != channel:
+        raise RuntimeError(f"The mirror was exported for the channel"
+                           f" '{cfg['channel']}', but pmaports is on the"
+                           f" channel '{channel}'")
+
+    # The old mirror is mounted in the chroots
+    pmb.chroot.shutdown(args)
+
+    target = f"{args.work}/mirror/{channel}"
+    logging.info(f"Import mirror ({cfg['arches']}, {cfg['date']}) to:"
+                 f" {target}")
+    commands = [["rm", "-rf", target],
+                ["mkdir", "-p", target],
+                ["cp", "-r", f"{bundle}/.", f"{target}/"],
+                ["mkdir", "-p", f"{args.work}/config_apk_keys"]]
+    for key in glob.glob(f"{bundle}/keys/*.pub"):
+        commands += [["cp", key, f"{args.work}/config_apk_keys/"]]
+    pmb.helpers.run.root_batch(args, commands)
+    for arch in cfg["arches"].split(","):
+        pmb.parse.apkindex.clear_cache(f"{target}/{arch}/APKINDEX.tar.gz")
+    logging.info("Use 'pmbootstrap --offline' to install and build packages"
+                 " without network access.")
@@ -1,23 +1,82 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
 import os
+import select
+import threading
+import pmb.helpers.other
 import pmb.helpers.run
 
 
+class MountTable:
+    """Parsed snapshot of /proc/mounts.
+
+    The file stays open, so poll() can tell when the kernel's mount table
+    has changed (POLLPRI, see proc(5)). Only then it gets parsed again,
+    instead of reading it for every ismount() call. Functions in this file
+    also call invalidate() after mounting or umounting.
+    """
+
+    def __init__(self, source="/proc/mounts"):
+        self.source = source
+        self.lock = threading.Lock()
+        self.handle = None
+        self.poll = None
+        self.outdated = True
+        self.entries = []
+        self.mountpoints = set()
+        self.sources = set()
+
+    def invalidate(self):
+        self.outdated = True
+
+    def parse(self, lines):
+        entries = []
+        for line in lines:
+            words = line.split()
+            if len(words) < 2:
+                raise RuntimeError("Failed to parse line in " + self.source +
+                                   ": " + line)
+            entries.append((words[0], words[1]))
+        self.entries = entries
+        self.sources = set(source for source, mountpoint in entries)
+        self.mountpoints = set(mountpoint for source, mountpoint in entries)
+
+    def refresh(self):
+        """Parse the source file again, if it may have changed."""
+        if self.handle is None:
+            self.handle = open(self.source, "r")
+            self.poll = select.poll()
+            self.poll.register(self.handle, select.POLLPRI | select.POLLERR)
+        elif self.poll.poll(0):
+            self.outdated = True
+        if self.outdated:
+            self.handle.seek(0)
+            self.parse(self.handle.read().splitlines())
+            self.outdated = False
+
+    def get(self):
+        """:returns: list of (source, mountpoint) tuples"""
+        with self.lock:
+            self.refresh()
+            return self.entries
+
+    def ismount(self, folder):
+        with self.lock:
+            self.refresh()
+            return folder in self.mountpoints or folder in self.sources
+
+
+# Mount table of pmbootstrap's mount namespace
+table = MountTable()
+
+
 def ismount(folder):
     """Ismount() implementation that works for mount --bind.
 
     Workaround for: https://bugs.python.org/issue29707
     """
     folder = os.path.realpath(os.path.realpath(folder))
-    with open("/proc/mounts", "r") as handle:
-        for line in handle:
-            words = line.split()
-            if len(words) >= 2 and words[1] == folder:
-                return True
-            if words[0] == folder:
-                return True
-    return False
+    return table.ismount(folder)
 
 
 def bind(args, source, destination, create_folders=True, umount=False):
@@ -33,17 +92,20 @@ def bind(args, source, destination, create_folders=True, umount=False):
             return
 
     # Check/create folders
+    cmds = []
     for path in [source, destination]:
         if os.path.exists(path):
             continue
         if create_folders:
-            pmb.helpers.run.root(args, ["mkdir", "-p", path])
+            cmds.append(["mkdir", "-p", path])
         else:
             raise RuntimeError("Mount failed, folder does not exist: " +
                                path)
 
     # Actually mount the folder
-    pmb.helpers.run.root(args, ["mount", "--bind", source, destination])
+    cmds.append(["mount", "--bind", source, destination])
+    pmb.helpers.run.root_batch(args, cmds)
+    table.invalidate()
 
     # Verify that it has worked
     if not ismount(destination):
@@ -68,6 +130,7 @@ def bind_file(args, source, destination, create_folders=False):
     # Mount
     pmb.helpers.run.root(args, ["mount", "--bind", source,
                                 destination])
+    table.invalidate()
 
 
 def umount_all_list(prefix, source="/proc/mounts"):
@@ -80,26 +143,54 @@ def umount_all_list(prefix, source="/proc/mounts"):
     """
     ret = []
     prefix = os.path.realpath(prefix)
-    with open(source, "r") as handle:
-        for line in handle:
-            words = line.split()
-            if len(words) < 2:
-                raise RuntimeError("Failed to parse line in " + source + ": " +
-                                   line)
-            mountpoint = words[1]
-            if mountpoint.startswith(prefix):
-                # Remove "\040(deleted)" suffix (#545)
-                deleted_str = r"\040(deleted)"
-                if mountpoint.endswith(deleted_str):
-                    mountpoint = mountpoint[:-len(deleted_str)]
-                ret.append(mountpoint)
+    if source == table.source:
+        entries = table.get()
+    else:
+        snapshot = MountTable(source)
+        with open(source, "r") as handle:
+            snapshot.parse(handle)
+        entries = snapshot.entries
+    for _, mountpoint in entries:
+        if mountpoint.startswith(prefix):
+            # Remove "\040(deleted)" suffix (#545)
+            deleted_str = r"\040(deleted)"
+            if mountpoint.endswith(deleted_str):
+                mountpoint = mountpoint[:-len(deleted_str)]
+            ret.append(mountpoint)
     ret.sort(reverse=True)
     return ret
 
 
 def umount_all(args, folder):
-    """Umount all folders that are mounted inside a given folder."""
-    for mountpoint in umount_all_list(folder):
-        pmb.helpers.run.root(args, ["umount", mountpoint])
+    """Umount all folders that are mounted inside a given folder, innermost
+    first (like "umount -R", which busybox doesn't have) with one privileged
+    call."""
+    mountpoints = umount_all_list(folder)
+    if not mountpoints:
+        return
+    pmb.helpers.run.root_batch(args, [["umount", mountpoint]
+                                      for mountpoint in mountpoints])
+    table.invalidate()
+    for mountpoint in mountpoints:
         if ismount(mountpoint):
             raise RuntimeError("Failed to umount: " + mountpoint)
+    chroot_ready_reset(args, folder)
+
+
+def chroot_ready_reset(args, folder):
+    """Let pmb.chroot.init() mount the chroots again, that are inside the
+    given folder or that the folder is part of."""
+    folder = os.path.realpath(folder)
+    ready = pmb.helpers.other.cache["chroot_ready"]
+    for suffix in list(ready):
+        chroot = os.path.realpath(f"{args.work}/chroot_{suffix}")
+        if os.path.commonpath([chroot, folder]) in [chroot, folder]:
+            del ready[suffix]
+
+
+def umounted(args, folder):
+    """Update the mount table and pmb.chroot.init()'s cache after something
+    in the folder was umounted without umount_all() (e.g. with 'umount'
+    running inside a chroot)."""
+    table.invalidate()
+    chroot_ready_reset(args, folder)
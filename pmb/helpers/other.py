@@ -1,9 +1,12 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
 import glob
+import hashlib
 import logging
 import os
+import pickle
 import re
+import threading
 import pmb.chroot
 import pmb.config
 import pmb.config.init
@@ -303,14 +306,106 @@ def init_cache():
     """Add a caching dict (caches parsing of files etc. for the current session)."""
     repo_update = {"404": [], "offline_msg_shown": False}
     cache = {"apkindex": {},
+             "apkindex_merged": {},
              "apkbuild": {},
              "apk_min_version_checked": [],
              "apk_repository_list_updated": [],
              "built": {},
+             "chroot_ready": {},
              "find_aport": {},
+             "pmb.helpers.package.depends_closures": {},
              "pmb.helpers.package.depends_recurse": {},
              "pmb.helpers.package.get": {},
+             "pmb.helpers.pmaports.provides_index": None,
              "pmb.helpers.repo.update": repo_update,
              "pmb.helpers.git.parse_channels_cfg": {},
              "pmb.config.pmaports.read_config": None,
              "pmb.config.pmaports.read_config_repos": None}
+
+
+"""
+Some results are expensive enough that it is worth keeping them across
+pmbootstrap invocations, e.g. the parsed APKINDEX files. They get stored as
+pickle files in $WORK/cache_$NAME and are only valid as long as the "stamp"
+(e.g. mtime and size of the source file) they were saved with still matches.
+The work folder gets set in pmb.helpers.args.init(), until then (and in code
+that runs without args) the persistent cache is disabled.
+"""
+persistent_cache_work = None
+persistent_cache_version = 1
+
+# Persistent caches of parsed files ($WORK/cache_$NAME), removed with
+# 'pmbootstrap zap -c' as they get created again when needed
+persistent_cache_names = ["apkbuild_parsed", "apkindex_parsed", "apkindex_raw",
+                          "apkindex_view", "pmaports_apkbuilds",
+                          "pmaports_provides"]
+
+# Persistent caches that can't be created again, never removed by zap
+persistent_cache_names_kept = ["build_duration"]
+
+
+def persistent_cache_path(name, key):
+    """Get the path to the file in which a persistent cache entry is stored.
+
+    :param name: name of the cache, e.g. "apkindex_parsed"
+    :param key: unique key inside the cache, e.g. the path of a parsed file
+    :returns: full path or None when the persistent cache is disabled
+    """
+    if not persistent_cache_work:
+        return None
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return f"{persistent_cache_work}/cache_{name}/{digest}"
+
+
+def persistent_cache_load(name, key, stamp):
+    """Load an entry of a persistent cache.
+
+    :param stamp: must be equal to the stamp the entry was saved with, e.g.
+                  (mtime, size) of the file that was parsed
+    :returns: the cached data, or None if it is missing or outdated
+    """
+    path = persistent_cache_path(name, key)
+    if not path or not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, "rb") as handle:
+            (version, key_saved, stamp_saved, data) = pickle.load(handle)
+    except Exception as e:
+        logging.verbose(f"Ignoring broken persistent cache file {path}: {e}")
+        return None
+
+    if (version, key_saved, stamp_saved) != (persistent_cache_version, key,
+                                             stamp):
+        return None
+    return data
+
+
+def persistent_cache_save(name, key, stamp, data):
+    """Save an entry of a persistent cache (see persistent_cache_load()).
+
+    The file is written to a temporary path first and then renamed, so
+    concurrent pmbootstrap processes never see half written entries.
+    """
+    path = persistent_cache_path(name, key)
+    if not path or not os.path.isdir(persistent_cache_work):
+        return
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    path_temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(path_temp, "wb") as handle:
+            pickle.dump((persistent_cache_version, key, stamp, data), handle,
+                        pickle.HIGHEST_PROTOCOL)
+        os.replace(path_temp, path)
+    except OSError as e:
+        logging.verbose(f"Failed to write persistent cache file {path}: {e}")
+        if os.path.exists(path_temp):
+            os.unlink(path_temp)
+
+
+def persistent_cache_delete(name, key):
+    """Remove an entry of a persistent cache, if it exists."""
+    path = persistent_cache_path(name, key)
+    if path and os.path.exists(path):
+        os.unlink(path)
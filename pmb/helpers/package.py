@@ -8,13 +8,66 @@ See also:
 
     - pmb/helpers/repo.py (work with binary package repos)
 """
-import copy
 import logging
 
 import pmb.helpers.pmaports
 import pmb.helpers.repo
 
 
+class Package:
+    """Package data as returned by get(), from pmaports or an APKINDEX.
+
+    Immutable (tuples instead of lists), so the same record can be cached
+    and shared between all callers without copying it. The values can be
+    read like with the dicts of the APKBUILD and APKINDEX parsers, e.g.
+    package["depends"], or as attributes, e.g. package.depends.
+    """
+    __slots__ = ("arch", "depends", "pkgname", "provides", "version")
+
+    def __init__(self, arch, depends, pkgname, provides, version):
+        """
+        :param arch: list of arches (APKBUILD) or one arch (APKINDEX)
+        :param depends: list of pkgnames
+        :param provides: list of provides
+        """
+        if isinstance(arch, str):
+            arch = [arch]
+        object.__setattr__(self, "arch", tuple(arch))
+        object.__setattr__(self, "depends", tuple(depends))
+        object.__setattr__(self, "pkgname", pkgname)
+        object.__setattr__(self, "provides", tuple(provides))
+        object.__setattr__(self, "version", version)
+
+    @classmethod
+    def from_apkindex(cls, block):
+        """:param block: from pmb.parse.apkindex.package()"""
+        return cls(block["arch"], block["depends"], block["pkgname"],
+                   block["provides"], block["version"])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"can't set {name}: Package is immutable")
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __eq__(self, other):
+        if not isinstance(other, Package):
+            return NotImplemented
+        return all(self[key] == other[key] for key in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(self[key] for key in self.__slots__))
+
+    def __repr__(self):
+        values = ", ".join(f"{key}={self[key]!r}" for key in self.__slots__)
+        return f"Package({values})"
+
+
 def remove_operators(package):
     for operator in [">", ">=", "<=", "=", "<", "~"]:
         if operator in package:
@@ -35,10 +88,11 @@ def get(args, pkgname, arch, replace_subpkgnames=False, must_exist=True):
         (see #1733)
     :param must_exist: raise an exception, if not found
 
-    :returns: * data from the parsed APKBUILD or APKINDEX in the following format:
-                    {"arch": ["noarch"], "depends": ["busybox-extras", "lddtree", ...],
-                    "pkgname": "postmarketos-mkinitfs", "provides": ["mkinitfs=0..1"],
-                    "version": "0.0.4-r10"}
+    :returns: * data from the parsed APKBUILD or APKINDEX as Package record
+                    (shared with the cache, it can't be modified):
+                    Package(arch=("noarch",), depends=("busybox-extras", "lddtree", ...),
+                    pkgname="postmarketos-mkinitfs", provides=("mkinitfs=0..1",),
+                    version="0.0.4-r10")
 
         * None if the package was not found
     """
@@ -59,11 +113,11 @@ def get(args, pkgname, arch, replace_subpkgnames=False, must_exist=True):
     ret = None
     pmaport = pmb.helpers.pmaports.get(args, pkgname, False)
     if pmaport:
-        ret = {"arch": pmaport["arch"],
-               "depends": pmb.build._package.get_depends(args, pmaport),
-               "pkgname": pmaport["pkgname"],
-               "provides": pmaport["provides"],
-               "version": pmaport["pkgver"] + "-r" + pmaport["pkgrel"]}
+        ret = Package(pmaport["arch"],
+                      pmb.build._package.get_depends(args, pmaport),
+                      pmaport["pkgname"],
+                      pmaport["provides"],
+                      pmaport["pkgver"] + "-r" + pmaport["pkgrel"])
 
     # Find in APKINDEX (given arch)
     if not ret or not pmb.helpers.pmaports.check_arches(ret["arch"], arch):
@@ -74,25 +128,18 @@ def get(args, pkgname, arch, replace_subpkgnames=False, must_exist=True):
         # built for the given arch, but there is a binary package for that arch
         # (e.g. temp/mesa can't be built for x86_64, but Alpine has it)
         if not ret or (ret_repo and ret_repo["arch"] == arch):
-            ret = ret_repo
+            ret = Package.from_apkindex(ret_repo) if ret_repo else None
 
     # Find in APKINDEX (other arches)
     if not ret:
         pmb.helpers.repo.update(args)
         for arch_i in pmb.config.build_device_architectures:
             if arch_i != arch:
-                ret = pmb.parse.apkindex.package(args, pkgname, arch_i, False)
-            if ret:
-                break
-
-    # Copy ret (it might have references to caches of the APKINDEX or APKBUILDs
-    # and we don't want to modify those!)
-    if ret:
-        ret = copy.deepcopy(ret)
-
-    # Make sure ret["arch"] is a list (APKINDEX code puts a string there)
-    if ret and isinstance(ret["arch"], str):
-        ret["arch"] = [ret["arch"]]
+                ret_repo = pmb.parse.apkindex.package(args, pkgname, arch_i,
+                                                      False)
+                if ret_repo:
+                    ret = Package.from_apkindex(ret_repo)
+                    break
 
     # Replace subpkgnames if desired
     if replace_subpkgnames:
@@ -109,7 +156,8 @@ def get(args, pkgname, arch, replace_subpkgnames=False, must_exist=True):
             depend_pkgname = depend_data["pkgname"]
             if depend_pkgname not in depends_new:
                 depends_new += [depend_pkgname]
-        ret["depends"] = depends_new
+        ret = Package(ret.arch, depends_new, ret.pkgname, ret.provides,
+                      ret.version)
 
     # Save to cache and return
     if ret:
@@ -129,6 +177,85 @@ def get(args, pkgname, arch, replace_subpkgnames=False, must_exist=True):
                        " could not find this package in any APKINDEX!")
 
 
+def depends_closures(args, pkgnames, arch):
+    """Get the transitive closures of the dependencies of multiple packages.
+
+    The dependency graph (package names, subpackage names and provides as
+    nodes, get() results as edges) gets walked iteratively, with Tarjan's
+    algorithm to find the strongly connected components, i.e. circular
+    dependencies. All packages of a component share one closure, which gets
+    built from the closures of the components it depends on. The closures
+    are cached for the session, so overlapping queries only resolve the
+    parts of the graph that were not visited before.
+
+    :param pkgnames: names of the packages (e.g. ["device-samsung-i9100"])
+    :param arch: preferred architecture for binary packages
+    :returns: dict of the closure of every visited package name, e.g.:
+        {"device-samsung-i9100": frozenset({"device-samsung-i9100",
+        "linux-samsung-i9100", ...}), ...}. The closure contains the pkgname
+        of the package itself (not a possible subpkgname) and the pkgnames
+        of all its dependencies.
+    """
+    cache_key = "pmb.helpers.package.depends_closures"
+    if arch not in pmb.helpers.other.cache[cache_key]:
+        pmb.helpers.other.cache[cache_key][arch] = {}
+    closures = pmb.helpers.other.cache[cache_key][arch]
+
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    for pkgname_start in pkgnames:
+        if pkgname_start in closures or pkgname_start in index:
+            continue
+
+        # Depth-first search, with a stack of (node, depends iterator)
+        index[pkgname_start] = lowlink[pkgname_start] = len(index)
+        stack.append(pkgname_start)
+        on_stack.add(pkgname_start)
+        work = [(pkgname_start, iter(get(args, pkgname_start, arch)["depends"]))]
+        while work:
+            node, depends = work[-1]
+            for depend in depends:
+                if depend in closures:
+                    continue
+                if depend not in index:
+                    index[depend] = lowlink[depend] = len(index)
+                    stack.append(depend)
+                    on_stack.add(depend)
+                    work.append((depend,
+                                 iter(get(args, depend, arch)["depends"])))
+                    break
+                if depend in on_stack:
+                    lowlink[node] = min(lowlink[node], index[depend])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] != index[node]:
+                    continue
+
+                # Node is the root of a component: all depends outside of
+                # the component have their closures already
+                component = set()
+                while node not in component:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.add(member)
+                closure = set()
+                for member in component:
+                    package = get(args, member, arch)
+                    closure.add(package["pkgname"])
+                    for depend in package["depends"]:
+                        if depend not in component:
+                            closure |= closures[depend]
+                closure = frozenset(closure)
+                for member in component:
+                    closures[member] = closure
+    return closures
+
+
 def depends_recurse(args, pkgname, arch):
     """Recursively resolve all of the package's dependencies.
 
@@ -144,22 +271,7 @@ def depends_recurse(args, pkgname, arch):
             pkgname in pmb.helpers.other.cache[cache_key][arch]):
         return pmb.helpers.other.cache[cache_key][arch][pkgname]
 
-    # Build ret (by iterating over the queue)
-    queue = [pkgname]
-    ret = []
-    while len(queue):
-        pkgname_queue = queue.pop()
-        package = get(args, pkgname_queue, arch)
-
-        # Add its depends to the queue
-        for depend in package["depends"]:
-            if depend not in ret:
-                queue += [depend]
-
-        # Add the pkgname (not possible subpkgname) to ret
-        if package["pkgname"] not in ret:
-            ret += [package["pkgname"]]
-    ret.sort()
+    ret = sorted(depends_closures(args, [pkgname], arch)[pkgname])
 
     # Save to cache and return
     if arch not in pmb.helpers.other.cache[cache_key]:
@@ -9,10 +9,76 @@ See also:
 import glob
 import logging
 import os
+import re
 
 import pmb.parse
 
 
+def _git_head(args):
+    """Get the git HEAD and the mtime of the git index of pmaports.
+
+    :returns: (HEAD commit, mtime of the git index) or None if pmaports is
+              not the top dir of a git checkout
+    """
+    if not os.path.isdir(args.aports):
+        return None
+    command = ["git", "rev-parse", "--show-prefix", "--git-path", "index",
+               "HEAD"]
+    output = pmb.helpers.run.user(args, command, args.aports,
+                                  output_return=True, check=False)
+    lines = output.splitlines()
+    if len(lines) != 3 or lines[0] or \
+            not re.fullmatch("[0-9a-f]{40}", lines[2]):
+        return None
+    (_, index, head) = lines
+    index = os.path.join(args.aports, index)
+    index_mtime = os.stat(index).st_mtime_ns if os.path.exists(index) else None
+    return (head, index_mtime)
+
+
+def _find_apkbuilds_git(args):
+    """Find all APKBUILDs in pmaports with git, instead of walking the whole
+    tree (including src/ and pkg/ dirs of previous builds).
+
+    The list of tracked APKBUILDs gets stored in the persistent cache, keyed
+    on the pmaports path and valid as long as the git HEAD and the git index
+    don't change. Untracked and deleted APKBUILDs are looked up on each run.
+
+    :returns: list of APKBUILD paths, relative to args.aports, or None if
+              pmaports is not a git checkout
+    """
+    stamp = _git_head(args)
+    if not stamp:
+        return None
+
+    pattern = "*/APKBUILD"
+    ret = pmb.helpers.other.persistent_cache_load("pmaports_apkbuilds",
+                                                  args.aports, stamp)
+    if ret is None:
+        output = pmb.helpers.run.user(args, ["git", "ls-files", "-z", "--",
+                                             pattern], args.aports,
+                                      output_return=True)
+        ret = output.split("\0")[:-1]
+        pmb.helpers.other.persistent_cache_save("pmaports_apkbuilds",
+                                                args.aports, stamp, ret)
+
+    # Status tags: "R" for deleted, "?" for untracked files
+    command = ["git", "ls-files", "-z", "-t", "--deleted", "--others",
+               "--exclude-standard", "--", pattern]
+    output = pmb.helpers.run.user(args, command, args.aports,
+                                  output_return=True)
+    deleted = set()
+    untracked = []
+    for entry in output.split("\0")[:-1]:
+        (tag, path) = entry.split(" ", 1)
+        if tag == "R":
+            deleted.add(path)
+        else:
+            untracked.append(path)
+
+    return [path for path in ret if path not in deleted] + untracked
+
+
 def _find_apkbuilds(args):
     # Try to get a cached result first (we assume that the aports don't change
     # in one pmbootstrap call)
@@ -20,8 +86,16 @@ def _find_apkbuilds(args):
     if apkbuilds is not None:
         return apkbuilds
 
+    paths = _find_apkbuilds_git(args)
+    if paths is None:
+        paths = glob.iglob(f"{args.aports}/**/*/APKBUILD", recursive=True)
+    else:
+        # Skip hidden dirs, like the glob does
+        paths = [f"{args.aports}/{path}" for path in paths
+                 if not re.search("(^|/)\\.", path)]
+
     apkbuilds = {}
-    for apkbuild in glob.iglob(f"{args.aports}/**/*/APKBUILD", recursive=True):
+    for apkbuild in paths:
         package = os.path.basename(os.path.dirname(apkbuild))
         if package in apkbuilds:
             raise RuntimeError(f"Package {package} found in multiple aports "
@@ -100,19 +174,14 @@ def guess_main(args, subpkgname):
             return os.path.dirname(path)
 
 
-def _find_package_in_apkbuild(package, path):
-    """Look through subpackages and all provides to see if the APKBUILD at the specified path
-    contains (or provides) the specified package.
+def _apkbuild_provides(apkbuild):
+    """Get the subpackages and versioned provides of an APKBUILD.
 
-    :param package: The package to search for
-    :param path: The path to the apkbuild
-    :return: True if the APKBUILD contains or provides the package
+    :param apkbuild: from pmb.parse.apkbuild()
+    :returns: list of package names, e.g. ["hello-world-doc", "mkbootimg"]
     """
-    apkbuild = pmb.parse.apkbuild(path)
-
     # Subpackages
-    if package in apkbuild["subpackages"]:
-        return True
+    ret = list(apkbuild["subpackages"].keys())
 
     # Search for provides in both package and subpackages
     apkbuild_pkgs = [apkbuild, *apkbuild["subpackages"].values()]
@@ -127,11 +196,95 @@ def _find_package_in_apkbuild(package, path):
             # automatically selected
             if "=" not in provides_i:
                 continue
+            ret.append(provides_i.split("=", 1)[0])
 
-            if package == provides_i.split("=", 1)[0]:
-                return True
+    return ret
 
-    return False
+
+def _find_package_in_apkbuild(package, path):
+    """Look through subpackages and all provides to see if the APKBUILD at the specified path
+    contains (or provides) the specified package.
+
+    :param package: The package to search for
+    :param path: The path to the apkbuild
+    :return: True if the APKBUILD contains or provides the package
+    """
+    return package in _apkbuild_provides(pmb.parse.apkbuild(path))
+
+
+def _git_stamp(args):
+    """Describe the state of the pmaports checkout with git.
+
+    :returns: (HEAD commit, mtime of the git index, ((path, mtime), ...) of
+              modified and untracked files) or None if pmaports is not a git
+              checkout
+    """
+    head = _git_head(args)
+    if not head:
+        return None
+
+    command = ["git", "ls-files", "-z", "--modified", "--others",
+               "--exclude-standard"]
+    files = []
+    output = pmb.helpers.run.user(args, command, args.aports,
+                                  output_return=True)
+    for file in sorted(set(output.split("\0")[:-1])):
+        path = f"{args.aports}/{file}"
+        mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        files.append((file, mtime))
+
+    return (*head, tuple(files))
+
+
+def _provides_index(args):
+    """Build a reverse index of all subpackages and versioned provides in
+    pmaports, so find() doesn't need to parse all APKBUILDs to find the
+    aport of a subpackage.
+
+    The index gets stored in the persistent cache, keyed on the pmaports
+    path and valid as long as the git HEAD, the git index, the modified and
+    untracked files and the APKBUILD parser don't change. APKBUILDs that
+    can't be parsed are left out of the index (with a warning), so they
+    don't break find() for all other aports.
+
+    :returns: { pkgname: [aport, ...], ... } with the full paths to all
+              aports providing pkgname, in the same order as
+              _find_apkbuilds()
+    """
+    cache_key = "pmb.helpers.pmaports.provides_index"
+    if pmb.helpers.other.cache[cache_key] is not None:
+        return pmb.helpers.other.cache[cache_key]
+
+    # Try to get the result of a previous pmbootstrap invocation
+    ret = None
+    stamp = _git_stamp(args)
+    if stamp:
+        stamp = (pmb.parse._apkbuild.parser_stamp(), *stamp)
+        ret = pmb.helpers.other.persistent_cache_load("pmaports_provides",
+                                                      args.aports, stamp)
+
+    if ret is None:
+        logging.verbose("Parse all APKBUILDs to index subpackages and"
+                        " provides (takes time!)")
+        ret = {}
+        for path in _find_apkbuilds(args).values():
+            aport = os.path.dirname(path)
+            try:
+                apkbuild = pmb.parse.apkbuild(path)
+            except RuntimeError as e:
+                logging.warning(f"WARNING: failed to parse {path}, its"
+                                f" subpackages can't be found: {e}")
+                continue
+            for package in _apkbuild_provides(apkbuild):
+                aports = ret.setdefault(package, [])
+                if aport not in aports:
+                    aports.append(aport)
+        if stamp:
+            pmb.helpers.other.persistent_cache_save("pmaports_provides",
+                                                    args.aports, stamp, ret)
+
+    pmb.helpers.other.cache[cache_key] = ret
+    return ret
 
 
 def find(args, package, must_exist=True):
@@ -165,12 +318,11 @@ def find(args, package, must_exist=True):
                 if _find_package_in_apkbuild(package, f'{guess}/APKBUILD'):
                     ret = guess
                 else:
-                    # Otherwise parse all APKBUILDs (takes time!), is the
-                    # package we are looking for a subpackage of any of those?
-                    for path_current in _find_apkbuilds(args).values():
-                        if _find_package_in_apkbuild(package, path_current):
-                            ret = os.path.dirname(path_current)
-                            break
+                    # Otherwise look it up in the index of the subpackages
+                    # and provides of all APKBUILDs
+                    aports = _provides_index(args).get(package)
+                    if aports:
+                        ret = aports[0]
 
                 # If we still didn't find anything, as last resort: assume our
                 # initial guess was right and the APKBUILD parser just didn't
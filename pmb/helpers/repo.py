@@ -42,10 +42,24 @@ def hash(url, length=8):
     return ret
 
 
+def mirror_path(args):
+    """Get the offline mirror of the current channel (see pmb.helpers.mirror).
+
+    :returns: path to the mirror, or None if no mirror was imported
+    """
+    channel = pmb.config.pmaports.read_config(args)["channel"]
+    ret = f"{args.work}/mirror/{channel}"
+    if not os.path.exists(f"{ret}/mirror.cfg"):
+        return None
+    return ret
+
+
 def urls(args, user_repository=True, postmarketos_mirror=True, alpine=True):
     """Get a list of repository URLs, as they are in /etc/apk/repositories.
 
-    :param user_repository: add /mnt/pmbootstrap/packages
+    :param user_repository: add /mnt/pmbootstrap/packages, and
+                            /mnt/pmbootstrap/mirror if an offline mirror was
+                            imported
     :param postmarketos_mirror: add postmarketos mirror URLs
     :param alpine: add alpine mirror URLs
     :returns: list of mirror strings, like ["/mnt/pmbootstrap/packages",
@@ -62,19 +76,21 @@ def urls(args, user_repository=True, postmarketos_mirror=True, alpine=True):
     # Local user repository (for packages compiled with pmbootstrap)
     if user_repository:
         ret.append("/mnt/pmbootstrap/packages")
+        if mirror_path(args):
+            ret.append("/mnt/pmbootstrap/mirror")
 
     # Upstream postmarketOS binary repository
     if postmarketos_mirror:
-        for mirror in args.mirrors_postmarketos:
+        for url_pmos in args.mirrors_postmarketos:
             # Remove "master" mirrordir to avoid breakage until bpo is adjusted
             # (build.postmarketos.org#63) and to give potential other users of
             # this flag a heads up.
-            if mirror.endswith("/master"):
+            if url_pmos.endswith("/master"):
                 logging.warning("WARNING: 'master' at the end of"
                                 " --mirror-pmOS is deprecated, the branch gets"
                                 " added automatically now!")
-                mirror = mirror[:-1 * len("master")]
-            ret.append(f"{mirror}{mirrordir_pmos}")
+                url_pmos = url_pmos[:-1 * len("master")]
+            ret.append(f"{url_pmos}{mirrordir_pmos}")
 
     # Upstream Alpine Linux repositories
     if alpine:
@@ -104,6 +120,9 @@ def apkindex_files(args, arch=None, user_repository=True, pmos=True,
     if user_repository:
         channel = pmb.config.pmaports.read_config(args)["channel"]
         ret = [f"{args.work}/packages/{channel}/{arch}/APKINDEX.tar.gz"]
+        path_mirror = mirror_path(args)
+        if path_mirror:
+            ret.append(f"{path_mirror}/{arch}/APKINDEX.tar.gz")
 
     # Resolve the APKINDEX.$HASH.tar.gz files
     for url in urls(args, False, pmos, alpine):
@@ -178,19 +197,28 @@ def update(args, arch=None, force=False, existing_only=False):
     logging.info("Update package index for " + ", ".join(outdated_arches) +
                  " (" + str(len(outdated)) + " file(s))")
 
-    # Download and move to right location
-    for (i, (url, target)) in enumerate(outdated.items()):
-        pmb.helpers.cli.progress_print(args, i / len(outdated))
-        temp = pmb.helpers.http.download(args, url, "APKINDEX", False,
-                                         logging.DEBUG, True)
+    # Download all files at once
+    temps = pmb.helpers.http.download_many(args, list(outdated.keys()),
+                                           "APKINDEX", False, logging.DEBUG,
+                                           True)
+
+    # Move to right location, with one privileged command
+    commands = []
+    for url, target in outdated.items():
+        temp = temps[url]
         if not temp:
             pmb.helpers.other.cache[cache_key]["404"].append(url)
             continue
         target_folder = os.path.dirname(target)
-        if not os.path.exists(target_folder):
-            pmb.helpers.run.root(args, ["mkdir", "-p", target_folder])
-        pmb.helpers.run.root(args, ["cp", temp, target])
-    pmb.helpers.cli.progress_flush(args)
+        if not os.path.exists(target_folder) and \
+                ["mkdir", "-p", target_folder] not in commands:
+            commands += [["mkdir", "-p", target_folder]]
+        # Replace atomically, the apk cache may be shared with other work
+        # dirs that read it at the same time (pmb.helpers.shared_cache)
+        commands += [["cp", temp, f"{target}.new"],
+                     ["mv", f"{target}.new", target]]
+    if commands:
+        pmb.helpers.run.root_batch(args, commands)
 
     return True
 
@@ -3,6 +3,7 @@
 import logging
 import glob
 
+import pmb.build.scheduler
 import pmb.config.pmaports
 import pmb.helpers.repo
 
@@ -134,11 +135,23 @@ def run_steps(args, steps, arch, suffix):
 
         log_progress(f"initializing {suffix} chroot (merge /usr: {usr_merge.name})")
         # Initialize without pmOS binary package repo
-        pmb.chroot.init(args, suffix, usr_merge, postmarketos_mirror=False)
+        jobs = int(args.parallel_builds)
+        for job in range(1, jobs + 1):
+            pmb.chroot.init(args, pmb.build.scheduler.suffix_job(suffix, job),
+                            usr_merge, postmarketos_mirror=False)
+
+        bootstrap_stage = int(step.split("bootstrap_", 1)[1])
+        if jobs > 1:
+            packages = get_packages(bootstrap_line)
+            pmb.build.scheduler.packages(args, [(package, arch)
+                                                for package in packages],
+                                         force=True, strict=True,
+                                         bootstrap_stage=bootstrap_stage,
+                                         progress=log_progress)
+            continue
 
         for package in get_packages(bootstrap_line):
             log_progress(f"building {package}")
-            bootstrap_stage = int(step.split("bootstrap_", 1)[1])
             pmb.build.package(args, package, arch, force=True,
                               strict=True, bootstrap_stage=bootstrap_stage)
 
@@ -108,7 +108,7 @@ def generate_output_format(args, arch, pkgnames):
         ret += [{"pkgname": entry["pkgname"],
                  "repo": pmb.helpers.pmaports.get_repo(args, pkgname),
                  "version": entry["version"],
-                 "depends": entry["depends"]}]
+                 "depends": list(entry["depends"])}]
     return ret
 
 
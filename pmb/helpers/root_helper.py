@@ -0,0 +1,98 @@
+# Copyright 2023 Oliver Smith
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Optional long-lived process that runs commands as root (--root-helper).
+
+Without it, each pmb.helpers.run.root() call runs a new sudo (or doas)
+process. With it, sudo only runs once to start pmb/data/root-helper.py,
+which then receives the commands over a pipe. Only quick filesystem
+commands (see commands below) get run by the helper, everything else still
+goes through pmb.helpers.run_core.core(), as the helper doesn't support
+the output timeout or writing the output to stdout while the command runs.
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+
+import pmb.config
+import pmb.helpers.logging
+import pmb.helpers.run_core
+
+# Commands that may get run by the helper
+commands = ["chmod", "chown", "cp", "ln", "mkdir", "mknod", "mount", "mv",
+            "rm", "rmdir", "touch", "umount"]
+
+# Running helper process (subprocess.Popen) and the lock for talking to it
+process = None
+lock = threading.Lock()
+
+
+def supported(args, cmd):
+    """:returns: True if the root helper is enabled and can run cmd"""
+    return bool(getattr(args, "root_helper", False)) and \
+        os.path.basename(cmd[0]) in commands
+
+
+def start():
+    """Start the helper process, unless it is running already."""
+    global process
+    if process and process.poll() is None:
+        return process
+
+    script = f"{pmb.config.pmb_src}/pmb/data/root-helper.py"
+    logging.debug("Start root helper")
+    process = subprocess.Popen(pmb.config.sudo([sys.executable, script]),
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=pmb.helpers.logging.logfd)
+    return process
+
+
+def run(cmds, working_dir=None):
+    """Run commands with the root helper, until one of them fails.
+
+    :param cmds: list of commands, e.g. [["mkdir", "-p", "/some/path"]]
+    :returns: list of (return code, output) of the commands that ran
+    """
+    request = json.dumps({"cmds": cmds, "cwd": working_dir}) + "\n"
+    with lock:
+        helper = start()
+        try:
+            helper.stdin.write(request.encode("utf-8"))
+            helper.stdin.flush()
+            line = helper.stdout.readline()
+        except BrokenPipeError:
+            line = b""
+    if not line:
+        raise RuntimeError("The root helper exited unexpectedly, see"
+                           " 'pmbootstrap log' for details")
+    return json.loads(line)["results"]
+
+
+def core(args, cmds, working_dir=None, output_return=False, check=None):
+    """Run commands with the root helper, like pmb.helpers.run_core.core()
+    with output="log".
+
+    :returns: * return code of the last command that ran (default)
+              * output of the last command that ran (output_return is True)
+    """
+    messages = []
+    for cmd in cmds:
+        message = "% "
+        if working_dir:
+            message += f"cd {working_dir}; "
+        messages.append(message + " ".join(pmb.config.sudo(cmd)))
+
+    results = run(cmds, working_dir)
+    for message, (code, output) in zip(messages, results):
+        logging.debug(message)
+        if output:
+            pmb.helpers.logging.logfd.write(output)
+    pmb.helpers.logging.logfd.flush()
+
+    code, output = results[-1]
+    if check is not False:
+        pmb.helpers.run_core.check_return_code(args, code,
+                                               messages[len(results) - 1])
+    return output if output_return else code
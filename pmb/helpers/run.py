@@ -1,5 +1,6 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
+import pmb.helpers.root_helper
 import pmb.helpers.run_core
 from argparse import Namespace
 from typing import Any, Dict, List, Optional
@@ -43,6 +44,11 @@ def root(args, cmd, working_dir=None, output="log", output_return=False,
     See pmb.helpers.run_core.core() for a detailed description of all other
     arguments and the return value.
     """
+    if not env and output == "log" and \
+            pmb.helpers.root_helper.supported(args, cmd):
+        return pmb.helpers.root_helper.core(args, [cmd], working_dir,
+                                            output_return, check)
+
     env = env.copy()
     pmb.helpers.run_core.add_proxy_env_vars(env)
 
@@ -52,3 +58,23 @@ def root(args, cmd, working_dir=None, output="log", output_return=False,
 
     return user(args, cmd, working_dir, output, output_return, check, env,
                 True)
+
+
+def root_batch(args, cmds, working_dir=None, check=None):
+    """Run multiple commands on the host system as root, stop at the first
+    one that fails. This only needs one sudo (or doas) call, or none if the
+    root helper is running (see pmb.helpers.root_helper).
+
+    :param cmds: list of commands, e.g. [["mkdir", "-p", path],
+                 ["mount", "--bind", source, path]]
+
+    See pmb.helpers.run_core.core() for a detailed description of all other
+    arguments and the return value.
+    """
+    if all(pmb.helpers.root_helper.supported(args, cmd) for cmd in cmds):
+        return pmb.helpers.root_helper.core(args, cmds, working_dir,
+                                            check=check)
+    if len(cmds) == 1:
+        return root(args, cmds[0], working_dir, check=check)
+    script = " && ".join(pmb.helpers.run_core.flat_cmd(cmd) for cmd in cmds)
+    return root(args, ["sh", "-c", script], working_dir, check=check)
@@ -1,10 +1,12 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
+import collections
 import fcntl
 import logging
 import os
 import selectors
 import shlex
+import signal
 import subprocess
 import sys
 import threading
@@ -80,78 +82,139 @@ def pipe(cmd, working_dir=None):
     return ret
 
 
+class OutputTail:
+    """Ring buffer with the last bytes of a command's output.
+
+    It has the same append() method as the list of output chunks that
+    pipe_read() fills otherwise, but drops the oldest chunks once it holds
+    more than size bytes.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.chunks = collections.deque()
+        self.length = 0
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+        self.length += len(chunk)
+        while self.length - len(self.chunks[0]) >= self.size:
+            self.length -= len(self.chunks.popleft())
+
+    def get(self):
+        """:returns: the last size bytes (or less), starting at a new line"""
+        ret = b"".join(self.chunks)
+        if len(ret) > self.size:
+            ret = ret[-self.size:]
+            ret = ret[ret.find(b"\n") + 1:]
+        return ret
+
+
 def pipe_read(process, output_to_stdout=False, output_return=False,
-              output_return_buffer=False):
-    """Read all output from a subprocess, copy it to the log and optionally stdout and a buffer variable.
+              output_return_buffer=False, stats=None):
+    """Read all currently available output from a subprocess, copy it to the log and optionally stdout and a buffer variable.
 
-    This is only meant to be called by foreground_pipe() below.
+    This is only meant to be called by foreground_pipe() below. The output
+    gets read in large chunks (pmb.config.run_output_chunk_size) and the log
+    file only gets flushed every pmb.config.run_output_flush_interval
+    seconds, so commands with lots of output don't keep pmbootstrap busy.
 
-    :param process: subprocess.Popen instance
+    :param process: subprocess.Popen instance with non-blocking stdout
     :param output_to_stdout: copy all output to pmbootstrap's stdout
     :param output_return: when set to True, output_return_buffer will be
                           extended
-    :param output_return_buffer: list of bytes that gets extended with the
-                                 current output in case output_return is True.
+    :param output_return_buffer: list of bytes (or OutputTail) that gets
+                                 extended with the current output in case
+                                 output_return is True.
+    :param stats: dict from foreground_pipe(), counts the bytes and lines of
+                  the output and keeps its tail
+    :returns: False if the end of the output was reached, True otherwise
     """
+    handle = process.stdout.fileno()
+    logfd = pmb.helpers.logging.logfd
+    eof = False
     while True:
         # Copy available output
-        out = process.stdout.readline()
-        if len(out):
-            pmb.helpers.logging.logfd.buffer.write(out)
-            if output_to_stdout:
-                sys.stdout.buffer.write(out)
-            if output_return:
-                output_return_buffer.append(out)
-            continue
-
-        # No more output (flush buffers)
-        pmb.helpers.logging.logfd.flush()
+        try:
+            out = os.read(handle, pmb.config.run_output_chunk_size)
+        except BlockingIOError:
+            break
+        if not out:
+            eof = True
+            break
+        logfd.buffer.write(out)
+        if output_to_stdout:
+            sys.stdout.buffer.write(out)
+        if output_return:
+            output_return_buffer.append(out)
+        if stats is not None:
+            stats["bytes"] += len(out)
+            stats["lines"] += out.count(b"\n")
+            stats["tail"].append(out)
+
+    # Flush buffers from time to time, and at the end
+    now = time.monotonic()
+    if eof or stats is None or \
+            now - stats["flushed"] >= pmb.config.run_output_flush_interval:
+        logfd.flush()
         if output_to_stdout:
             sys.stdout.flush()
-        return
+        if stats is not None:
+            stats["flushed"] = now
+    return not eof
 
 
-def kill_process_tree(args, pid, ppids, sudo):
-    """Recursively kill a pid and its child processes.
+def process_tree(pid, proc="/proc"):
+    """Get a process and all of its descendants from /proc/*/stat.
 
-    :param pid: process id that will be killed
-    :param ppids: list of process id and parent process id tuples (pid, ppid)
-    :param sudo: use sudo to kill the process
+    :param pid: process id of the root of the tree
+    :param proc: path to procfs (for testing)
+    :returns: list of process ids, parents before their children
     """
-    if sudo:
-        pmb.helpers.run.root(args, ["kill", "-9", str(pid)],
-                             check=False)
-    else:
-        pmb.helpers.run.user(args, ["kill", "-9", str(pid)],
-                             check=False)
-
-    for (child_pid, child_ppid) in ppids:
-        if child_ppid == str(pid):
-            kill_process_tree(args, child_pid, ppids, sudo)
+    children = {}
+    for entry in os.listdir(proc):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"{proc}/{entry}/stat", "rb") as handle:
+                stat = handle.read()
+        except OSError:
+            # Process exited in the meantime
+            continue
+        # The command name may contain spaces and parentheses:
+        # "pid (comm) state ppid ..."
+        ppid = int(stat[stat.rindex(b")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+
+    ret = [int(pid)]
+    for parent in ret:
+        ret += children.get(parent, [])
+    return ret
 
 
 def kill_command(args, pid, sudo):
-    """Kill a command process and recursively kill its child processes.
+    """Kill a command process and all its child processes.
 
     :param pid: process id that will be killed
     :param sudo: use sudo to kill the process
     """
-    cmd = ["ps", "-e", "-o", "pid,ppid"]
-    ret = subprocess.run(cmd, check=True, stdout=subprocess.PIPE)
-    ppids = []
-    proc_entries = ret.stdout.decode("utf-8").rstrip().split('\n')[1:]
-    for row in proc_entries:
-        items = row.split()
-        if len(items) != 2:
-            raise RuntimeError("Unexpected ps output: " + row)
-        ppids.append(items)
-
-    kill_process_tree(args, pid, ppids, sudo)
+    pids = process_tree(pid)
+    logging.debug(f"Kill process tree of {pid}: {len(pids)} processes")
+    if sudo:
+        pmb.helpers.run.root(args, ["kill", "-9"] + [str(child)
+                                                      for child in pids],
+                             check=False)
+        return
+    for child in pids:
+        try:
+            os.kill(child, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
 
 
 def foreground_pipe(args, cmd, working_dir=None, output_to_stdout=False,
                     output_return=False, output_timeout=True,
-                    sudo=False, stdin=None):
+                    sudo=False, stdin=None, output_tail=None, stats=None):
     """Run a subprocess in foreground with redirected output.
 
     Optionally kill it after being silent for too long.
@@ -164,6 +227,10 @@ def foreground_pipe(args, cmd, working_dir=None, output_to_stdout=False,
                            after a certain time (configured with --timeout)
                            and raise a RuntimeError exception
     :param sudo: use sudo to kill the process when it hits the timeout
+    :param output_tail: only keep the last output_tail bytes of the output
+                        for output_return (whole lines), instead of all of it
+    :param stats: dict that gets filled with counters of the output:
+                  {"bytes": 123, "lines": 4, "tail": OutputTail, ...}
     :returns: (code, output)
               * code: return code of the program
               * output: ""
@@ -180,7 +247,11 @@ def foreground_pipe(args, cmd, working_dir=None, output_to_stdout=False,
     fcntl.fcntl(handle, fcntl.F_SETFL, flags | os.O_NONBLOCK)
 
     # While process exists wait for output (with timeout)
-    output_buffer = []
+    output_buffer = OutputTail(output_tail) if output_tail else []
+    if stats is None:
+        stats = {}
+    stats.update({"bytes": 0, "lines": 0, "flushed": time.monotonic(),
+                  "tail": OutputTail(pmb.config.run_output_tail_size)})
     sel = selectors.DefaultSelector()
     sel.register(process.stdout, selectors.EVENT_READ)
     timeout = args.timeout if output_timeout else None
@@ -203,14 +274,22 @@ def foreground_pipe(args, cmd, working_dir=None, output_to_stdout=False,
 
         # Read all currently available output
         pipe_read(process, output_to_stdout, output_return,
-                  output_buffer)
+                  output_buffer, stats)
 
     # There may still be output after the process quit
-    pipe_read(process, output_to_stdout, output_return, output_buffer)
+    while pipe_read(process, output_to_stdout, output_return, output_buffer,
+                    stats):
+        if not sel.select(0):
+            break
+    pmb.helpers.logging.logfd.flush()
+    if output_to_stdout:
+        sys.stdout.flush()
 
     # Return the return code and output (the output gets built as list of
     # output chunks and combined at the end, this is faster than extending the
     # combined string with each new chunk)
+    if output_tail:
+        return (process.returncode, output_buffer.get().decode("utf-8"))
     return (process.returncode, b"".join(output_buffer).decode("utf-8"))
 
 
@@ -373,11 +452,22 @@ def core(args, log_message, cmd, working_dir=None, output="log",
 
         stdin = subprocess.DEVNULL if output in ["log", "stdout"] else None
 
+        stats = {}
         (code, output_after_run) = foreground_pipe(args, cmd, working_dir,
                                                    output_to_stdout,
                                                    output_return,
                                                    output_timeout,
-                                                   sudo, stdin)
+                                                   sudo, stdin, stats=stats)
+        logging.verbose(f"output: {stats['bytes']} bytes, {stats['lines']}"
+                        " lines")
+
+        # Repeat the end of the output right above the ^^^ line, as the
+        # output of commands running in parallel may be mixed in the log
+        if code and check is not False and not output_to_stdout and \
+                stats["bytes"]:
+            tail = stats["tail"].get().decode("utf-8", "replace")
+            logging.debug(f"(end of the output of: {log_message})\n"
+                          f"{tail.rstrip()}")
 
     # Check the return code
     if check is not False:
@@ -0,0 +1,173 @@
+# Copyright 2023 Oliver Smith
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Optional cache shared between multiple work dirs on the same host.
+
+Enable it by setting the shared_cache option to a path (e.g. with
+'pmbootstrap --shared-cache /var/cache/pmbootstrap'). It contains:
+
+- blobs/: files downloaded with pmb.helpers.http.download(), stored by their
+  sha256 checksum and hardlinked (or reflinked/copied, if hardlinking is not
+  possible) into the cache_http dir of each work dir
+- urls/: the checksum and HTTP validators of each downloaded URL, so other
+  work dirs don't need to download the same URL again
+- cache_apk_$ARCH/, cache_distfiles/: symlinked from each work dir. apk names
+  its cached packages after their checksum and abuild its distfiles after
+  their source URL, so they can be shared directly.
+
+Changes to blobs/ and urls/ are serialized with a lock file, so multiple
+pmbootstrap processes can use the shared cache at the same time.
+"""
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import pmb.config
+
+# ioctl to create a reflink copy of a file (linux/fs.h)
+FICLONE = 0x40049409
+
+
+def get_path(args):
+    """:returns: path to the shared cache, or None if it is disabled"""
+    path = getattr(args, "shared_cache", None)
+    if not path:
+        return None
+    return os.path.realpath(os.path.expanduser(path))
+
+
+@contextlib.contextmanager
+def lock(args):
+    """Hold the lock of the shared cache, to change blobs/ and urls/."""
+    path = get_path(args)
+    os.makedirs(path, exist_ok=True)
+    with open(f"{path}/lock", "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def sha256sum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def blob_path(args, sha256):
+    return f"{get_path(args)}/blobs/{sha256[:2]}/{sha256}"
+
+
+def clone(source, target):
+    """Make target a copy of source, without using additional disk space if
+    possible: hardlink, or reflink if the files are on different
+    filesystems (or hardlinking is not permitted), or a regular copy.
+
+    The target gets replaced atomically, if it exists already.
+    """
+    target_temp = f"{target}.{os.getpid()}.clone"
+    if os.path.lexists(target_temp):
+        os.unlink(target_temp)
+    try:
+        os.link(source, target_temp)
+    except OSError:
+        with open(source, "rb") as handle_source, \
+                open(target_temp, "wb") as handle_target:
+            try:
+                fcntl.ioctl(handle_target.fileno(), FICLONE,
+                            handle_source.fileno())
+            except OSError:
+                shutil.copyfileobj(handle_source, handle_target)
+    os.replace(target_temp, target)
+
+
+def insert(args, path):
+    """Add a file to blobs/. If the same content is stored already, replace
+    the file with a link to the existing blob.
+
+    :param path: file that doesn't get modified in place anymore
+    :returns: sha256 checksum of the file
+    """
+    sha256 = sha256sum(path)
+    blob = blob_path(args, sha256)
+    with lock(args):
+        if os.path.exists(blob):
+            if not os.path.samefile(blob, path):
+                clone(blob, path)
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            clone(path, blob)
+    return sha256
+
+
+def url_path(args, url):
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return f"{get_path(args)}/urls/{digest[:2]}/{digest}"
+
+
+def url_get(args, url):
+    """Get the blob of a URL that was downloaded before.
+
+    :returns: {"sha256": ..., "etag": ..., "last_modified": ..., "size": ...}
+              or None if the URL or its blob is not in the shared cache
+    """
+    try:
+        with open(url_path(args, url), encoding="utf-8") as handle:
+            ret = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(blob_path(args, ret["sha256"])):
+        return None
+    return ret
+
+
+def url_set(args, url, sha256, validators):
+    """Remember the blob and the HTTP validators of a downloaded URL.
+
+    :param validators: from pmb.helpers.http.validators_load(), or None
+    """
+    entry = {"sha256": sha256, "etag": None, "last_modified": None,
+             "size": os.path.getsize(blob_path(args, sha256))}
+    if validators:
+        entry["etag"] = validators["etag"]
+        entry["last_modified"] = validators["last_modified"]
+
+    path = url_path(args, url)
+    with lock(args):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as handle:
+            json.dump(entry, handle)
+        os.replace(f"{path}.tmp", path)
+
+
+def link_dirs(args):
+    """Symlink the apk and distfiles caches of the work dir to the shared
+    cache. Existing caches of the work dir are kept (with a note on how to
+    switch to the shared cache), as they are owned by root and may be bind
+    mounted into chroots.
+    """
+    path = get_path(args)
+    if not path:
+        return
+
+    arches = set(pmb.config.build_device_architectures +
+                 [pmb.config.arch_native])
+    for name in ["cache_distfiles"] + [f"cache_apk_{arch}"
+                                       for arch in sorted(arches)]:
+        link = f"{args.work}/{name}"
+        target = f"{path}/{name}"
+        if os.path.islink(link) and os.readlink(link) == target:
+            continue
+        if os.path.lexists(link):
+            logging.verbose(f"NOTE: {link} is not shared, remove it with"
+                            " 'pmbootstrap shutdown; sudo rm -r"
+                            f" {link}' to use {target} instead")
+            continue
+        os.makedirs(target, exist_ok=True)
+        os.symlink(target, link)
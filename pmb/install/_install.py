@@ -193,8 +193,8 @@ def configure_apk(args):
     for f in index_files:
         pmb.helpers.run.root(args, ["cp", f, rootfs + "/var/cache/apk/"])
 
-    # Disable pmbootstrap repository
-    pmb.helpers.run.root(args, ["sed", "-i", r"/\/mnt\/pmbootstrap\/packages/d",
+    # Disable pmbootstrap repositories (local packages, offline mirror)
+    pmb.helpers.run.root(args, ["sed", "-i", r"/^\/mnt\/pmbootstrap\//d",
                                 rootfs + "/etc/apk/repositories"])
     pmb.helpers.run.user(args, ["cat", rootfs + "/etc/apk/repositories"])
 
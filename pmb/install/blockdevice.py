@@ -35,6 +35,8 @@ def previous_install(args, path):
 
         pmb.helpers.run.root(args, ["umount", args.work + "/chroot_native" +
                                     blockdevice_inside])
+        pmb.helpers.mount.umounted(args, args.work + "/chroot_native" +
+                                   blockdevice_inside)
     return "pmOS_boot" in label
 
 
@@ -3,6 +3,7 @@
 import os
 import logging
 import pmb.chroot
+import pmb.helpers.mount
 
 
 def install_fsprogs(args, filesystem):
@@ -116,6 +117,7 @@ def prepare_btrfs_subvolumes(args, device, mountpoint):
 
     # Make directories to mount subvols onto
     pmb.chroot.root(args, ["umount", mountpoint])
+    pmb.helpers.mount.umounted(args, f"{args.work}/chroot_native{mountpoint}")
     pmb.chroot.root(args, ["mount", device, mountpoint])
     pmb.chroot.root(args, ["mkdir",
                             f"{mountpoint}/home",
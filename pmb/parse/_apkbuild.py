@@ -1,10 +1,12 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
 # mypy: disable-error-code="attr-defined"
+import hashlib
 import logging
 import os
 import re
 from collections import OrderedDict
+from functools import lru_cache
 
 import pmb.config
 import pmb.helpers.devices
@@ -310,6 +312,18 @@ def _parse_subpackage(path, lines, apkbuild, subpackages, subpkg):
     subpackages[subpkgname] = ret
 
 
+@lru_cache()
+def parser_stamp():
+    """
+    Parsed APKBUILDs in the persistent cache are only valid for the same
+    parser (this file and the attributes it parses out of APKBUILDs).
+
+    :returns: hash of this file's mtime and the parsed attributes
+    """
+    parser = f"{os.path.getmtime(__file__)} {pmb.config.apkbuild_attributes}"
+    return hashlib.sha1(parser.encode("utf-8")).hexdigest()
+
+
 def apkbuild(path, check_pkgver=True, check_pkgname=True):
     """
     Parse relevant information out of the APKBUILD file. This is not meant
@@ -332,9 +346,19 @@ def apkbuild(path, check_pkgver=True, check_pkgname=True):
     # Read the file and check line endings
     lines = read_file(path)
 
+    # Try to get the result of a previous pmbootstrap invocation (the stamp
+    # is a hash of the content, mtimes may not change with quick edits)
+    stamp = (hashlib.sha1("".join(lines).encode("utf-8")).hexdigest(),
+             parser_stamp())
+    ret = pmb.helpers.other.persistent_cache_load("apkbuild_parsed", path,
+                                                  stamp)
+
     # Parse all attributes from the config
-    ret = {key: "" for key in pmb.config.apkbuild_attributes.keys()}
-    _parse_attributes(path, lines, pmb.config.apkbuild_attributes, ret)
+    if ret is None:
+        ret = {key: "" for key in pmb.config.apkbuild_attributes.keys()}
+        _parse_attributes(path, lines, pmb.config.apkbuild_attributes, ret)
+        pmb.helpers.other.persistent_cache_save("apkbuild_parsed", path,
+                                                stamp, ret)
 
     # Sanity check: pkgname
     suffix = f"/{ret['pkgname']}/APKBUILD"
@@ -1,8 +1,14 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
 import collections
+import contextlib
+import glob
+import io
 import logging
+import mmap
 import os
+import re
+import shutil
 import tarfile
 import pmb.chroot.apk
 import pmb.helpers.package
@@ -10,6 +16,62 @@ import pmb.helpers.repo
 import pmb.parse.version
 
 
+# Keys of APKINDEX blocks that get parsed (all other keys, e.g. checksums or
+# sizes, get skipped). The line prefix is looked up directly in this table.
+apkindex_map = {
+    "A:": "arch",
+    "D:": "depends",
+    "o:": "origin",
+    "P:": "pkgname",
+    "p:": "provides",
+    "k:": "provider_priority",
+    "t:": "timestamp",
+    "V:": "version",
+}
+
+# Operators get stripped from "depends" and "provides" (checked in order)
+apkindex_operators = (">", "=", "<", "~")
+
+
+def parse_block_finalize(path, ret):
+    """Validate a block that has been read until its empty line and format
+    its list values.
+
+    :param path: to the APKINDEX.tar.gz (for error messages)
+    :param ret: dict with the raw string values of the block
+    :returns: ret, see parse_next_block()
+    """
+    # Check for required keys
+    for key in ["arch", "pkgname", "version"]:
+        if key not in ret:
+            raise RuntimeError(f"Missing required key '{key}' in block "
+                               f"{ret}, file: {path}")
+
+    # Format optional lists
+    for key in ["provides", "depends"]:
+        value_str = ret.get(key)
+        if not value_str:
+            ret[key] = []
+            continue
+        values = []
+        # Ignore all operators for now
+        for value in value_str.split(" "):
+            for operator in apkindex_operators:
+                if operator in value:
+                    value = value.split(operator, 1)[0]
+                    break
+            values.append(value)
+        ret[key] = values
+    return ret
+
+
+def parse_block_key_twice(path, ret, line):
+    """Raise the error for a key that is specified twice in one block."""
+    key = apkindex_map[line[:2]]
+    raise RuntimeError("Key " + key + " (" + line[:2] + ") specified twice"
+                       " in block: " + str(ret) + ", file: " + path)
+
+
 def parse_next_block(path, lines, start):
     """Parse the next block in an APKINDEX.
 
@@ -31,71 +93,79 @@ def parse_next_block(path, lines, start):
               NOTE: "timestamp" and "origin" are not set for virtual packages (#1273).
               We use that information to skip these virtual packages in parse().
     :returns: None, when there are no more blocks
+
+    Use parse_blocks_iter() to parse all blocks of a file in one pass.
     """
     # Parse until we hit an empty line or end of file
     ret = {}
-    mapping = {
-        "A": "arch",
-        "D": "depends",
-        "o": "origin",
-        "P": "pkgname",
-        "p": "provides",
-        "k": "provider_priority",
-        "t": "timestamp",
-        "V": "version",
-    }
-    end_of_block_found = False
     for i in range(start[0], len(lines)):
-        # Check for empty line
         start[0] = i + 1
         line = lines[i]
         if not isinstance(line, str):
             line = line.decode()
         if line == "\n":
-            end_of_block_found = True
-            break
-
-        # Parse keys from the mapping
-        for letter, key in mapping.items():
-            if line.startswith(letter + ":"):
-                if key in ret:
-                    raise RuntimeError(
-                        "Key " + key + " (" + letter + ":) specified twice"
-                        " in block: " + str(ret) + ", file: " + path)
-                ret[key] = line[2:-1]
-
-    # Format and return the block
-    if end_of_block_found:
-        # Check for required keys
-        for key in ["arch", "pkgname", "version"]:
-            if key not in ret:
-                raise RuntimeError(f"Missing required key '{key}' in block "
-                                   f"{ret}, file: {path}")
-
-        # Format optional lists
-        for key in ["provides", "depends"]:
-            if key in ret and ret[key] != "":
-                # Ignore all operators for now
-                values = ret[key].split(" ")
-                ret[key] = []
-                for value in values:
-                    for operator in [">", "=", "<", "~"]:
-                        if operator in value:
-                            value = value.split(operator)[0]
-                            break
-                    ret[key].append(value)
-            else:
-                ret[key] = []
-        return ret
+            return parse_block_finalize(path, ret)
+
+        key = apkindex_map.get(line[:2])
+        if key:
+            if key in ret:
+                parse_block_key_twice(path, ret, line)
+            ret[key] = line[2:-1]
 
     # No more blocks
-    elif ret != {}:
+    if ret != {}:
         raise RuntimeError("Last block in " + path + " does not end"
                            " with a new line! Delete the file and"
                            " try again. Last block: " + str(ret))
     return None
 
 
+def parse_blocks_iter(path, lines):
+    """Parse all blocks of an APKINDEX in a single pass.
+
+    :param path: to the APKINDEX.tar.gz (for error messages)
+    :param lines: iterable of the lines in the APKINDEX (str, including the
+                  trailing new line), e.g. a file handle opened in text mode
+    :returns: generator of blocks, see parse_next_block()
+    """
+    get_key = apkindex_map.get
+    ret = {}
+    for line in lines:
+        if line == "\n":
+            yield parse_block_finalize(path, ret)
+            ret = {}
+            continue
+
+        key = get_key(line[:2])
+        if key:
+            if key in ret:
+                parse_block_key_twice(path, ret, line)
+            ret[key] = line[2:-1]
+
+    if ret != {}:
+        raise RuntimeError("Last block in " + path + " does not end"
+                           " with a new line! Delete the file and"
+                           " try again. Last block: " + str(ret))
+
+
+@contextlib.contextmanager
+def open_lines(path):
+    """Open the APKINDEX inside an APKINDEX.tar.gz (or an uncompressed
+    APKINDEX / apk installed database) for reading it line by line.
+
+    :returns: context manager for a text mode file handle
+    """
+    if not tarfile.is_tarfile(path):
+        with open(path, "r", encoding="utf-8") as handle:
+            yield handle
+        return
+
+    with tarfile.open(path, "r:gz") as tar:
+        with tar.extractfile(tar.getmember("APKINDEX")) as handle:
+            # Only split at "\n", to get the same lines as bytes.readlines()
+            yield io.TextIOWrapper(handle, encoding="utf-8", newline="\n")
+
+
 def parse_add_block(ret, block, alias=None, multiple_providers=True):
     """Add one block to the return dictionary of parse().
 
@@ -173,48 +243,64 @@ def parse(path, multiple_providers=True):
     # Try to get a cached result first
     lastmod = os.path.getmtime(path)
     cache_key = "multiple" if multiple_providers else "single"
-    if path in pmb.helpers.other.cache["apkindex"]:
-        cache = pmb.helpers.other.cache["apkindex"][path]
-        if cache["lastmod"] == lastmod:
-            if cache_key in cache:
-                return cache[cache_key]
-        else:
-            clear_cache(path)
+    ret = cache_get(path, lastmod, cache_key)
+    if ret is not None:
+        return ret
 
-    # Read all lines
-    if tarfile.is_tarfile(path):
-        with tarfile.open(path, "r:gz") as tar:
-            with tar.extractfile(tar.getmember("APKINDEX")) as handle:
-                lines = handle.readlines()
-    else:
-        with open(path, "r", encoding="utf-8") as handle:
-            lines = handle.readlines()
+    # Try to get the result of a previous pmbootstrap invocation
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    persistent_key = f"{cache_key}:{path}"
+    ret = pmb.helpers.other.persistent_cache_load("apkindex_parsed",
+                                                  persistent_key, stamp)
+    if ret is not None:
+        cache_update(path, lastmod, cache_key, ret)
+        return ret
 
-    # Parse the whole APKINDEX file
+    # Parse the whole APKINDEX file while it gets decompressed
     ret = collections.OrderedDict()
-    start = [0]
-    while True:
-        block = parse_next_block(path, lines, start)
-        if not block:
-            break
-
-        # Skip virtual packages
-        if "timestamp" not in block:
-            logging.verbose("Skipped virtual package " + str(block) + " in"
-                            " file: " + path)
-            continue
-
-        # Add the next package and all aliases
-        parse_add_block(ret, block, None, multiple_providers)
-        if "provides" in block:
+    with open_lines(path) as handle:
+        for block in parse_blocks_iter(path, handle):
+            # Skip virtual packages
+            if "timestamp" not in block:
+                logging.verbose("Skipped virtual package " + str(block) +
+                                " in file: " + path)
+                continue
+
+            # Add the next package and all aliases
+            parse_add_block(ret, block, None, multiple_providers)
             for alias in block["provides"]:
                 parse_add_block(ret, block, alias, multiple_providers)
 
-    # Update the cache
+    # Update the caches
+    cache_update(path, lastmod, cache_key, ret)
+    pmb.helpers.other.persistent_cache_save("apkindex_parsed", persistent_key,
+                                            stamp, ret)
+    return ret
+
+
+def cache_get(path, lastmod, cache_key):
+    """Get a result from the cache for the current session.
+
+    :param lastmod: current mtime of path, the cache for path gets cleared
+                    if it was filled with a different version of the file
+    :param cache_key: "multiple", "single" or "view"
+    :returns: the cached result or None
+    """
+    if path not in pmb.helpers.other.cache["apkindex"]:
+        return None
+    cache = pmb.helpers.other.cache["apkindex"][path]
+    if cache["lastmod"] != lastmod:
+        clear_cache(path)
+        return None
+    return cache.get(cache_key)
+
+
+def cache_update(path, lastmod, cache_key, ret):
+    """Store a parse() result in the cache for the current session."""
     if path not in pmb.helpers.other.cache["apkindex"]:
         pmb.helpers.other.cache["apkindex"][path] = {"lastmod": lastmod}
     pmb.helpers.other.cache["apkindex"][path][cache_key] = ret
-    return ret
 
 
 def parse_blocks(path):
@@ -229,29 +315,190 @@ def parse_blocks(path):
 
     NOTE: "block" is the return value from parse_next_block() above.
     """
-    # Parse all lines
-    with tarfile.open(path, "r:gz") as tar:
-        with tar.extractfile(tar.getmember("APKINDEX")) as handle:
-            lines = handle.readlines()
+    with open_lines(path) as handle:
+        return list(parse_blocks_iter(path, handle))
+
+
+class View:
+    """Memory-mapped view of an APKINDEX, which only parses the blocks that
+    are actually looked at (see view()).
+
+    The decompressed APKINDEX is stored in $WORK/cache_apkindex_raw and
+    gets memory-mapped. An offset table maps each pkgname and provide to the
+    offsets of the blocks providing it. clear_cache() closes the mapping
+    (close() or a with statement do it too).
+    """
+
+    def __init__(self, path, path_raw, offsets):
+        """
+        :param path: to the APKINDEX.tar.gz (for error messages)
+        :param path_raw: to the decompressed APKINDEX
+        :param offsets: ``{ provide: [offset, ...], ... }``, with the byte
+                        offsets of the blocks in path_raw in file order
+        """
+        self.path = path
+        self.offsets = offsets
+        self.blocks = {}
+        self.provided = {}
+        self.data = b""
+        if os.path.getsize(path_raw):
+            with open(path_raw, "rb") as handle:
+                self.data = mmap.mmap(handle.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+
+    def close(self):
+        """Unmap the decompressed APKINDEX. Blocks that were parsed already
+        can still be looked up afterwards."""
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def block(self, offset):
+        """Parse the block at a byte offset (once).
+
+        :returns: block, see parse_next_block()
+        """
+        if offset not in self.blocks:
+            if self.data is None:
+                raise RuntimeError(f"APKINDEX view was closed: {self.path}")
+            end = self.data.find(b"\n\n", offset)
+            end = len(self.data) if end == -1 else end + 2
+            text = self.data[offset:end].decode()
+            lines = io.StringIO(text, newline="\n")
+            self.blocks[offset] = next(parse_blocks_iter(self.path, lines))
+        return self.blocks[offset]
+
+    def get(self, package):
+        """Get the providers of a package from this APKINDEX.
+
+        :returns: the same as parse(path)[package], or None if the package is
+                  not provided by this APKINDEX
+        """
+        if package in self.provided:
+            return self.provided[package]
+
+        ret = None
+        if package in self.offsets:
+            found = {}
+            for offset in self.offsets[package]:
+                parse_add_block(found, self.block(offset), package)
+            ret = found[package]
+        self.provided[package] = ret
+        return ret
+
+
+def view_scan(path, path_raw):
+    """Parse a decompressed APKINDEX once to create the offset table.
+
+    :returns: offsets, see View.__init__()
+    """
+    starts = []
+
+    def lines():
+        offset = 0
+        block_start = True
+        with open(path_raw, "rb") as handle:
+            for line in handle:
+                if block_start:
+                    starts.append(offset)
+                    block_start = False
+                offset += len(line)
+                block_start = line == b"\n"
+                yield line.decode()
+
+    ret = {}
+    for i, block in enumerate(parse_blocks_iter(path, lines())):
+        # Skip virtual packages
+        if "timestamp" not in block:
+            continue
+        for provide in [block["pkgname"]] + block["provides"]:
+            offsets = ret.setdefault(provide, [])
+            if not offsets or offsets[-1] != starts[i]:
+                offsets.append(starts[i])
+    return ret
+
+
+def view(path):
+    """Get a lazy, memory-mapped view of an APKINDEX (--lazy-apkindex).
+
+    Compared to parse(), this only creates an offset table for the whole
+    file and parses blocks on demand. The table gets stored in the
+    persistent cache, so later pmbootstrap invocations only need to load
+    the table and map the decompressed file.
+
+    :param path: path to an APKINDEX.tar.gz file or apk package database
+    :returns: View, or None when the file does not exist or the persistent
+              cache is disabled (use parse() in that case)
+    """
+    if not os.path.isfile(path) or not pmb.helpers.other.persistent_cache_work:
+        return None
+
+    # Try to get a cached result first
+    lastmod = os.path.getmtime(path)
+    ret = cache_get(path, lastmod, "view")
+    if ret is not None:
+        return ret
 
-    # Parse lines into blocks
-    ret = []
-    start = [0]
-    while True:
-        block = pmb.parse.apkindex.parse_next_block(path, lines, start)
-        if not block:
-            return ret
-        ret.append(block)
+    # Find the decompressed file with the offset table
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    raw_prefix = pmb.helpers.other.persistent_cache_path("apkindex_raw", path)
+    path_raw = f"{raw_prefix}_{stamp[0]}_{stamp[1]}"
+    offsets = pmb.helpers.other.persistent_cache_load("apkindex_view", path,
+                                                      stamp)
+    if not tarfile.is_tarfile(path):
+        path_raw = path
+    elif offsets is None or not os.path.exists(path_raw):
+        # Decompress, replacing files of older versions of the APKINDEX
+        # (but not the temp files of other pmbootstrap processes)
+        for path_old in glob.glob(f"{raw_prefix}_*"):
+            if re.fullmatch(r"_[0-9]+_[0-9]+", path_old[len(raw_prefix):]):
+                os.unlink(path_old)
+        os.makedirs(os.path.dirname(path_raw), exist_ok=True)
+        path_temp = f"{path_raw}.{os.getpid()}.tmp"
+        with tarfile.open(path, "r:gz") as tar:
+            with tar.extractfile(tar.getmember("APKINDEX")) as handle:
+                with open(path_temp, "wb") as handle_raw:
+                    shutil.copyfileobj(handle, handle_raw)
+        os.replace(path_temp, path_raw)
+        offsets = None
+
+    if offsets is None:
+        offsets = view_scan(path, path_raw)
+        pmb.helpers.other.persistent_cache_save("apkindex_view", path, stamp,
+                                                offsets)
+
+    ret = View(path, path_raw, offsets)
+    cache_update(path, lastmod, "view", ret)
+    return ret
 
 
 def clear_cache(path):
     """
-    Clear the APKINDEX parsing cache.
+    Clear the APKINDEX parsing cache, for the current session and the
+    persistent one in $WORK/cache_apkindex_parsed.
 
-    :returns: True on successful deletion, False otherwise
+    :returns: True on successful deletion (from the cache of the current
+              session), False otherwise
     """
     logging.verbose("Clear APKINDEX cache for: " + path)
+    for cache_key in ["multiple", "single"]:
+        pmb.helpers.other.persistent_cache_delete("apkindex_parsed",
+                                                  f"{cache_key}:{path}")
+    pmb.helpers.other.persistent_cache_delete("apkindex_view", path)
+    for key in list(pmb.helpers.other.cache["apkindex_merged"].keys()):
+        if path in key:
+            del pmb.helpers.other.cache["apkindex_merged"][key]
     if path in pmb.helpers.other.cache["apkindex"]:
+        view = pmb.helpers.other.cache["apkindex"][path].get("view")
+        if view:
+            view.close()
         del pmb.helpers.other.cache["apkindex"][path]
         return True
     else:
@@ -280,30 +527,14 @@ def providers(args, package, arch=None, must_exist=True, indexes=None):
 
     package = pmb.helpers.package.remove_operators(package)
 
-    ret = collections.OrderedDict()
-    for path in indexes:
-        # Skip indexes not providing the package
-        index_packages = parse(path)
-        if package not in index_packages:
-            continue
-
-        # Iterate over found providers
-        for provider_pkgname, provider in index_packages[package].items():
-            # Skip lower versions of providers we already found
-            version = provider["version"]
-            if provider_pkgname in ret:
-                version_last = ret[provider_pkgname]["version"]
-                if pmb.parse.version.compare(version, version_last) == -1:
-                    logging.verbose(package + ": provided by: " +
-                                    provider_pkgname + "-" + version + " in " +
-                                    path + " (but " + version_last + " is"
-                                    " higher)")
-                    continue
-
-            # Add the provider to ret
-            logging.verbose(package + ": provided by: " + provider_pkgname +
-                            "-" + version + " in " + path)
-            ret[provider_pkgname] = provider
+    if getattr(args, "lazy_apkindex", False):
+        ret = providers_lazy(package, indexes)
+    else:
+        ret = collections.OrderedDict(merged(indexes).get(package, {}))
+        if ret:
+            logging.verbose(f"{package}: provided by: " +
+                            ", ".join(f"{pkgname}-{block['version']}"
+                                      for pkgname, block in ret.items()))
 
     if ret == {} and must_exist:
         logging.debug("Searched in APKINDEX files: " + ", ".join(indexes))
@@ -312,6 +543,77 @@ def providers(args, package, arch=None, must_exist=True, indexes=None):
     return ret
 
 
+def providers_merge(ret, index_providers):
+    """Merge the providers of one package from an APKINDEX into the providers
+    found in previous APKINDEX files.
+
+    :param ret: providers found so far, gets modified
+    :param index_providers: providers from the current APKINDEX, like
+                            ``parse(path)[package]``
+    """
+    for provider_pkgname, provider in index_providers.items():
+        # Skip lower versions of providers we already found
+        if provider_pkgname in ret:
+            version_last = ret[provider_pkgname]["version"]
+            if pmb.parse.version.compare(provider["version"],
+                                         version_last) == -1:
+                continue
+        ret[provider_pkgname] = provider
+
+
+def merged(indexes):
+    """Merge the parsed APKINDEX files of all repositories into one provider
+    index, with only the highest version of each provider.
+
+    The result gets cached for the current session, until any of the
+    APKINDEX files changes or clear_cache() gets called for one of them.
+
+    :param indexes: list of APKINDEX.tar.gz paths
+    :returns: ``{ provide: { pkgname: block, ... }, ... }``, like parse().
+              The provider dicts may be shared with the cache of parse(),
+              don't modify them.
+    """
+    key = tuple(indexes)
+    lastmods = tuple(os.path.getmtime(path) if os.path.isfile(path) else None
+                     for path in indexes)
+    cache = pmb.helpers.other.cache["apkindex_merged"]
+    if key in cache and cache[key]["lastmods"] == lastmods:
+        return cache[key]["merged"]
+
+    ret = {}
+    copied = set()
+    for path in indexes:
+        for package, index_providers in parse(path).items():
+            if package not in ret:
+                # Share the dict until another index provides the package
+                ret[package] = index_providers
+                continue
+            if package not in copied:
+                ret[package] = collections.OrderedDict(ret[package])
+                copied.add(package)
+            providers_merge(ret[package], index_providers)
+
+    cache[key] = {"lastmods": lastmods, "merged": ret}
+    return ret
+
+
+def providers_lazy(package, indexes):
+    """Get the providers of a package with view() (--lazy-apkindex).
+
+    :returns: see providers()
+    """
+    ret = collections.OrderedDict()
+    for path in indexes:
+        index_view = view(path)
+        if index_view:
+            index_providers = index_view.get(package)
+        else:
+            index_providers = parse(path).get(package)
+        if index_providers:
+            providers_merge(ret, index_providers)
+    return ret
+
+
 def provider_highest_priority(providers, pkgname):
     """Get the provider(s) with the highest provider_priority and log a message.
 
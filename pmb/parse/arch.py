@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 import fnmatch
 import platform
+import re
 import pmb.config
 
 
@@ -12,6 +13,14 @@ def alpine_native():
 
 
 def from_chroot_suffix(args, suffix):
+    # Additional build chroots of parallel builds, e.g. "native_2" or
+    # "buildroot_x86_64_2" (see pmb.build.scheduler.suffix_job())
+    arches = pmb.config.build_device_architectures + [pmb.config.arch_native]
+    if re.fullmatch("native_[0-9]+", suffix) or \
+            (re.fullmatch("buildroot_.*_[0-9]+", suffix) and
+             suffix.split("_", 1)[1] not in arches):
+        suffix = suffix.rsplit("_", 1)[0]
+
     if suffix == "native":
         return pmb.config.arch_native
     if suffix in [f"rootfs_{args.device}", f"installer_{args.device}"]:
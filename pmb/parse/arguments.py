@@ -574,6 +574,32 @@ def arguments_netboot(subparser):
     return ret
 
 
+def arguments_mirror(subparser):
+    ret = subparser.add_parser("mirror", help="offline mirror with all"
+                               " packages needed to install a device and to"
+                               " build packages for it")
+    sub = ret.add_subparsers(dest="action_mirror")
+    sub.required = True
+
+    export = sub.add_parser("export", help="write the packages to a bundle")
+    export.add_argument("bundle", help="output folder")
+    export.add_argument("--device", dest="mirror_device",
+                        help="device to export the packages for (default:"
+                             " device from 'pmbootstrap init')")
+    export.add_argument("--no-recommends", dest="install_recommends",
+                        help="do not add packages listed in _pmb_recommends"
+                             " of the UI pmaports",
+                        action="store_false")
+    add_packages_arg(export, nargs="*",
+                     help="additional packages to add to the bundle")
+
+    import_ = sub.add_parser("import", help="use a bundle as offline mirror"
+                             " (replacing the previously imported one)")
+    import_.add_argument("bundle", help="folder created by 'pmbootstrap"
+                                        " mirror export'")
+    return ret
+
+
 def arguments_ci(subparser):
     ret = subparser.add_parser("ci", help="run continuous integration scripts"
                                           " locally of git repo in current"
@@ -656,6 +682,20 @@ def get_parser():
                              pmb.config.defaults["mirror_alpine"],
                         metavar="URL")
     parser.add_argument("-j", "--jobs", help="parallel jobs when compiling")
+    parser.add_argument("--parallel-builds", dest="parallel_builds",
+                        help="amount of packages to build at the same time,"
+                             " each in its own build chroot (default: 1)",
+                        metavar="N")
+    parser.add_argument("--root-helper", dest="root_helper",
+                        action="store_true", default=None,
+                        help="run quick commands as root (mkdir, mount, cp,"
+                             " ...) in one long-running process, instead of"
+                             " running sudo or doas for each of them")
+    parser.add_argument("--shared-cache", dest="shared_cache",
+                        help="cache downloads, apk packages and distfiles in"
+                             " this folder, to share them with other work"
+                             " folders (default: disabled)",
+                        metavar="PATH")
     parser.add_argument("-E", "--extra-space",
                         help="specify an integer with the amount of additional"
                              "space to allocate to the image in MB (default"
@@ -682,6 +722,11 @@ def get_parser():
                         action="store_true")
     parser.add_argument("-o", "--offline", help="Do not attempt to update"
                         " the package index files", action="store_true")
+    parser.add_argument("--lazy-apkindex", dest="lazy_apkindex",
+                        help="memory-map the package index files and only"
+                             " parse the packages that are looked up (lower"
+                             " memory usage with many architectures)",
+                        action="store_true")
 
     # Compiler
     parser.add_argument("--no-ccache", action="store_false",
@@ -726,6 +771,7 @@ def get_parser():
     arguments_newapkbuild(sub)
     arguments_lint(sub)
     arguments_status(sub)
+    arguments_mirror(sub)
     arguments_ci(sub)
 
     # Action: log
@@ -759,10 +805,16 @@ def get_parser():
                      " (that have been downloaded to the apk cache)")
     zap.add_argument("-r", "--rust", action="store_true",
                      help="also delete rust related caches")
+    zap.add_argument("-c", "--parse-cache", action="store_true",
+                     dest="parse_cache",
+                     help="also delete the caches of parsed APKBUILD and"
+                     " APKINDEX files, APKINDEX views and the pmaports"
+                     " APKBUILD and provides indexes (they get created again"
+                     " when needed)")
 
     zap_all_delete_args = ["http", "distfiles", "pkgs_local",
                            "pkgs_local_mismatch", "netboot", "pkgs_online_mismatch",
-                           "rust"]
+                           "rust", "parse_cache"]
     zap_all_delete_args_print = [arg.replace("_", "-")
                                  for arg in zap_all_delete_args]
     zap.add_argument("-a", "--all",
@@ -890,6 +942,11 @@ def get_parser():
     build.add_argument("--envkernel", action="store_true",
                        help="Create an apk package from the build output of"
                        " a kernel compiled locally on the host or with envkernel.sh.")
+    build.add_argument("--plan", action="store_true",
+                       help="don't build anything, only print the packages"
+                       " that would be built (including dependencies) in"
+                       " build order as JSON, with the reason and the"
+                       " duration of the previous build in seconds")
     add_packages_arg(build, nargs="+")
 
     # Action: deviceinfo_parse
@@ -1,5 +1,6 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
+import collections
 import logging
 import pmb.chroot
 import pmb.chroot.apk
@@ -31,6 +32,31 @@ def package_from_aports(args, pkgname_depend):
             "version": version}
 
 
+class PkgnamesInstall:
+    """
+    The packages to be installed while recurse() is running: the ones found
+    so far and the ones still to be resolved. Only supports "in", which is
+    all package_provider() needs, without building a new list for each
+    resolved package.
+
+    The queried attribute is set when "in" was used, i.e. when the result
+    of package_provider() depends on the packages to be installed.
+    """
+
+    def __init__(self, found, todo_count):
+        """
+        :param found: set of pkgnames found so far
+        :param todo_count: collections.Counter of the pkgnames to resolve
+        """
+        self.found = found
+        self.todo_count = todo_count
+        self.queried = False
+
+    def __contains__(self, pkgname):
+        self.queried = True
+        return pkgname in self.found or self.todo_count[pkgname] > 0
+
+
 def package_provider(args, pkgname, pkgnames_install, suffix="native"):
     """
     :param pkgnames_install: packages to be installed
@@ -130,13 +156,22 @@ def recurse(args, pkgnames, suffix="native"):
                   "(pmbootstrap -v for details)")
 
     # Iterate over todo-list until is is empty
-    todo = list(pkgnames)
+    todo = collections.deque(pkgnames)
+    todo_count = collections.Counter(pkgnames)
     required_by = {}
     ret = []
+    ret_set = set()
+    pkgnames_install = PkgnamesInstall(ret_set, todo_count)
+
+    # Packages of dependencies whose provider doesn't depend on the other
+    # packages to be installed (see PkgnamesInstall)
+    resolved = {}
+
     while len(todo):
         # Skip already passed entries
-        pkgname_depend = todo.pop(0)
-        if pkgname_depend in ret:
+        pkgname_depend = todo.popleft()
+        todo_count[pkgname_depend] -= 1
+        if pkgname_depend in ret_set:
             continue
 
         # Check if the dependency is explicitly marked as conflicting
@@ -144,10 +179,15 @@ def recurse(args, pkgnames, suffix="native"):
         pkgname_depend = pkgname_depend.lstrip("!")
 
         # Get depends and pkgname from aports
-        pkgnames_install = list(ret) + todo
-        package = package_from_aports(args, pkgname_depend)
-        package = package_from_index(args, pkgname_depend, pkgnames_install,
-                                     package, suffix)
+        if pkgname_depend in resolved:
+            package = resolved[pkgname_depend]
+        else:
+            pkgnames_install.queried = False
+            package = package_from_aports(args, pkgname_depend)
+            package = package_from_index(args, pkgname_depend,
+                                         pkgnames_install, package, suffix)
+            if not pkgnames_install.queried:
+                resolved[pkgname_depend] = package
 
         # Nothing found
         if not package:
@@ -170,17 +210,19 @@ def recurse(args, pkgnames, suffix="native"):
             pkgname = f"!{pkgname}"
 
         # Append to todo/ret (unless it is a duplicate)
-        if pkgname in ret:
+        if pkgname in ret_set:
             logging.verbose(f"{pkgname}: already found")
         else:
             if not is_conflict:
                 depends = package["depends"]
                 logging.verbose(f"{pkgname}: depends on: {','.join(depends)}")
                 if depends:
-                    todo += depends
+                    todo.extend(depends)
+                    todo_count.update(depends)
                     for dep in depends:
                         if dep not in required_by:
                             required_by[dep] = set()
                         required_by[dep].add(pkgname_depend)
             ret.append(pkgname)
+            ret_set.add(pkgname)
     return ret
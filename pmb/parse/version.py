@@ -1,6 +1,7 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
 import collections
+from functools import lru_cache
 
 """
 In order to stay as compatible to Alpine's apk as possible, this code
@@ -185,6 +186,66 @@ def get_token(previous, rest):
     return (next, value, rest)
 
 
+# Values of the token strings, see token_value()
+TOKEN_DIGIT = token_value("digit")
+TOKEN_SUFFIX = token_value("suffix")
+TOKEN_INVALID = token_value("invalid")
+TOKEN_END = token_value("end")
+
+
+class VersionKey:
+    """
+    A version string, parsed once into its tokens so it can be compared
+    over and over without parsing it again. Get instances with key(), and
+    use them as sort key: ``sorted(versions, key=pmb.parse.version.key)``.
+
+    tokens is a tuple of (token_value, value) pairs in the order they are
+    returned by get_token() when parsing through the version string,
+    ending with the "end" or "invalid" token.
+    """
+    __slots__ = ("version", "tokens")
+
+    def __init__(self, version):
+        self.version = version
+        tokens = []
+        current = "digit"
+        rest = version
+        while current not in ["end", "invalid"]:
+            (current, value, rest) = get_token(current, rest)
+            tokens.append((token_value(current), value))
+        self.tokens = tuple(tokens)
+
+    def __repr__(self):
+        return f"VersionKey({self.version!r})"
+
+    def __eq__(self, other):
+        return compare_keys(self, other) == 0
+
+    def __lt__(self, other):
+        return compare_keys(self, other) == -1
+
+    def __le__(self, other):
+        return compare_keys(self, other) != 1
+
+    def __gt__(self, other):
+        return compare_keys(self, other) == 1
+
+    def __ge__(self, other):
+        return compare_keys(self, other) != -1
+
+
+@lru_cache(maxsize=32768)
+def key(version):
+    """
+    Get the parsed VersionKey of a version string (cached, so parsing the
+    same version string again is free).
+
+    :param version: full version string
+    :returns: VersionKey
+    """
+    return VersionKey(version)
+
+
 def validate(version):
     """
     Check whether one version string is valid.
@@ -194,47 +255,34 @@ def validate(version):
 
     C equivalent: apk_version_validate()
     """
-    current = "digit"
-    rest = version
-    while current != "end":
-        (current, value, rest) = get_token(current, rest)
-        if current == "invalid":
-            return False
-    return True
+    return key(version).tokens[-1][0] != TOKEN_INVALID
 
 
-def compare(a_version, b_version, fuzzy=False):
+def compare_keys(a_key, b_key, fuzzy=False):
     """
-    Compare two versions A and B to find out which one is higher, or if
-    both are equal.
+    Compare two parsed versions A and B, see compare().
 
-    :param a_version: full version string A
-    :param b_version: full version string B
+    :param a_key: VersionKey of A
+    :param b_key: VersionKey of B
     :param fuzzy: treat version strings, which end in different token
                   types as equal
-
-    :returns:
-        (a <  b): -1
-        (a == b):  0
-        (a >  b):  1
-
-    C equivalent: apk_version_compare_blob_fuzzy()
+    :returns: -1, 0 or 1 (see compare())
     """
+    a_tokens = a_key.tokens
+    b_tokens = b_key.tokens
 
-    # Defaults
-    a_token = "digit"
-    b_token = "digit"
+    # Walk through the tokens of A and B, until one string ends, or the
+    # current token has a different type/value
+    a_token = TOKEN_DIGIT
+    b_token = TOKEN_DIGIT
     a_value = 0
     b_value = 0
-    a_rest = a_version
-    b_rest = b_version
-
-    # Parse A and B one token at a time, until one string ends, or the
-    # current token has a different type/value
-    while (a_token == b_token and a_token not in ["end", "invalid"] and
-           a_value == b_value):
-        (a_token, a_value, a_rest) = get_token(a_token, a_rest)
-        (b_token, b_value, b_rest) = get_token(b_token, b_rest)
+    i = 0
+    while (a_token == b_token and a_token != TOKEN_END and
+           a_token != TOKEN_INVALID and a_value == b_value):
+        (a_token, a_value) = a_tokens[i]
+        (b_token, b_value) = b_tokens[i]
+        i += 1
 
     # Compare the values inside the last tokens
     if a_value < b_value:
@@ -250,19 +298,19 @@ def compare(a_version, b_version, fuzzy=False):
     # Leading version components and their values are equal, now the
     # non-terminating version is greater unless it's a suffix
     # indicating pre-release
-    if a_token == "suffix":
-        (a_token, a_value, a_rest) = get_token(a_token, a_rest)
+    if a_token == TOKEN_SUFFIX:
+        (a_token, a_value) = a_tokens[i]
         if a_value < 0:
             return -1
-    if b_token == "suffix":
-        (b_token, b_value, b_rest) = get_token(b_token, b_rest)
+    if b_token == TOKEN_SUFFIX:
+        (b_token, b_value) = b_tokens[i]
         if b_value < 0:
             return 1
 
     # Compare the token value (e.g. digit < letter)
-    if token_value(a_token) > token_value(b_token):
+    if a_token > b_token:
         return -1
-    if token_value(a_token) < token_value(b_token):
+    if a_token < b_token:
         return 1
 
     # The tokens are not the same, but previous checks revealed that it
@@ -270,6 +318,26 @@ def compare(a_version, b_version, fuzzy=False):
     return 0
 
 
+def compare(a_version, b_version, fuzzy=False):
+    """
+    Compare two versions A and B to find out which one is higher, or if
+    both are equal.
+
+    :param a_version: full version string A
+    :param b_version: full version string B
+    :param fuzzy: treat version strings, which end in different token
+                  types as equal
+
+    :returns:
+        (a <  b): -1
+        (a == b):  0
+        (a >  b):  1
+
+    C equivalent: apk_version_compare_blob_fuzzy()
+    """
+    return compare_keys(key(a_version), key(b_version), fuzzy)
+
+
 """
 Convenience functions below are not modeled after apk's version.c.
 """
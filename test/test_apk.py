@@ -59,6 +59,60 @@ def test_install_build(monkeypatch, args):
     assert func(args, package, arch) == "build-pkg"
 
 
+def test_install_build_all(monkeypatch, args):
+    func = pmb.chroot.apk.install_build_all
+    arch = "x86_64"
+    aports = {"hello-world": {"pkgname": "hello-world"},
+              "hello-world-doc": {"pkgname": "hello-world"},
+              "postmarketos-base": {"pkgname": "postmarketos-base"},
+              "device-ppp": {"pkgname": "device-ppp"}}
+    outdated = ["hello-world", "device-ppp"]
+    built = []
+    scheduled = []
+
+    monkeypatch.setattr(pmb.helpers.repo, "update", lambda args, arch: None)
+    monkeypatch.setattr(pmb.helpers.pmaports, "get",
+                        lambda args, pkgname, must_exist: aports.get(pkgname))
+    monkeypatch.setattr(pmb.build, "is_necessary",
+                        lambda args, arch, apkbuild:
+                        apkbuild["pkgname"] in outdated)
+    monkeypatch.setattr(pmb.build, "package",
+                        lambda args, package, arch: built.append(package))
+    monkeypatch.setattr(pmb.build.scheduler, "packages",
+                        lambda args, packages, job:
+                        scheduled.append((packages, job)))
+
+    # Only build outdated pmaports, once per aport
+    args.action = "chroot"
+    args.parallel_builds = "1"
+    pmb.helpers.other.cache["built"] = {}
+    packages = ["musl", "hello-world-doc", "hello-world", "postmarketos-base",
+                "device-ppp"]
+    func(args, packages, arch)
+    assert built == ["hello-world-doc", "device-ppp"]
+
+    # Skip packages that were checked in this session already
+    built.clear()
+    pmb.helpers.other.cache["built"] = {arch: ["device-ppp"]}
+    func(args, packages, arch)
+    assert built == ["hello-world-doc"]
+
+    # Parallel builds
+    built.clear()
+    args.parallel_builds = "4"
+    func(args, packages, arch)
+    assert built == []
+    assert scheduled == [([("hello-world-doc", arch)], None)]
+
+    # Started by a parallel build: build in the chroots of its job
+    scheduled.clear()
+    args.parallel_builds = "1"
+    monkeypatch.setitem(pmb.build.scheduler.jobs_setup, "native_2", 2)
+    func(args, packages, arch, "native_2")
+    assert built == []
+    assert scheduled == [([("hello-world-doc", arch)], 2)]
+
+
 def test_packages_split_to_add_del():
     packages = ["hello", "!test", "hello2", "test2", "!test3"]
 
@@ -0,0 +1,189 @@
+# Copyright 2023 Oliver Smith
+# SPDX-License-Identifier: GPL-3.0-or-later
+""" Test pmb.build.scheduler """
+import copy
+import sys
+import threading
+import time
+import pytest
+
+import pmb_test  # noqa
+import pmb.build.scheduler
+import pmb.config
+import pmb.helpers.other
+import pmb.helpers.logging
+
+
+@pytest.fixture
+def args(request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(pmb.helpers.logging.logfd.close)
+    return args
+
+
+def test_suffix_job():
+    func = pmb.build.scheduler.suffix_job
+    assert func("native", 1) == "native"
+    assert func("native", 2) == "native_2"
+    assert func("buildroot_armhf", 3) == "buildroot_armhf_3"
+
+
+def fake_aports(monkeypatch, aports):
+    """ Let the scheduler see fake aports instead of the real pmaports.
+
+        :param aports: {pkgname: (depends, necessary), ...}, packages not in
+                       this dict only exist as binary packages """
+    def get_apkbuild(args, pkgname, arch):
+        if pkgname.endswith("-dev"):
+            pkgname = pkgname[:-4]
+        if pkgname not in aports:
+            return None
+        return {"pkgname": pkgname,
+                "pkgver": "1",
+                "pkgrel": "0",
+                "depends": aports[pkgname][0],
+                "makedepends": [],
+                "checkdepends": [],
+                "options": [],
+                "subpackages": {f"{pkgname}-dev": None}}
+
+    def is_necessary(args, arch, apkbuild):
+        return aports[apkbuild["pkgname"]][1]
+
+    monkeypatch.setattr(pmb.build._package, "get_apkbuild", get_apkbuild)
+    monkeypatch.setattr(pmb.build._package, "check_build_for_arch",
+                        lambda *args: True)
+    monkeypatch.setattr(pmb.build, "is_necessary", is_necessary)
+
+
+def test_resolve(args, monkeypatch):
+    # a -> b -> c -> a (circular), b -> d-dev (subpackage), e: binary only
+    fake_aports(monkeypatch, {"a": (["b", "e"], True),
+                              "b": (["c", "d-dev"], False),
+                              "c": (["a"], True),
+                              "d": ([], True)})
+    depends_built = {}
+
+    def is_necessary_warn_depends(args, apkbuild, arch, force, built):
+        depends_built[apkbuild["pkgname"]] = built
+        return pmb.build.is_necessary(args, arch, apkbuild)
+    monkeypatch.setattr(pmb.build._package, "is_necessary_warn_depends",
+                        is_necessary_warn_depends)
+
+    nodes = {}
+    aliases = {}
+    key = pmb.build.scheduler.resolve(args, nodes, aliases, "a")
+
+    arch = pmb.config.arch_native
+    assert key == ("a", arch)
+    assert list(nodes.keys()) == [("a", arch), ("b", arch), ("c", arch),
+                                  ("d", arch)]
+    assert nodes[("a", arch)]["depends_nodes"] == [("b", arch)]
+    assert nodes[("b", arch)]["depends_nodes"] == [("c", arch), ("d", arch)]
+    assert nodes[("c", arch)]["depends_nodes"] == []
+    assert [node["necessary"] for node in nodes.values()] == [True, False,
+                                                              True, True]
+    assert aliases[("d-dev", arch)] == ("d", arch)
+    assert aliases[("e", arch)] is None
+
+    # Dependencies that get built are passed for the "bump pkgrel" warning
+    assert depends_built == {"a": [], "b": ["c", "d-dev"], "c": [], "d": []}
+
+
+def test_packages(args, monkeypatch):
+    # top1 -> mid (not necessary) -> leaf1, leaf2; top2 -> leaf2
+    fake_aports(monkeypatch, {"top1": (["mid"], True),
+                              "top2": (["leaf2"], True),
+                              "mid": (["leaf1", "leaf2"], False),
+                              "leaf1": ([], True),
+                              "leaf2": ([], True),
+                              "uptodate": ([], False)})
+
+    lock = threading.Lock()
+    events = []
+    running = []
+    max_running = [0]
+
+    def build_node(args, node, job, strict, bootstrap_stage, build_lock):
+        pkgname = node["apkbuild"]["pkgname"]
+        with lock:
+            running.append(job)
+            max_running[0] = max(max_running[0], len(running))
+            events.append(("start", pkgname))
+        assert job not in running[:-1]
+        time.sleep(0.1)
+        with lock:
+            running.remove(job)
+            events.append(("done", pkgname))
+        return f"{node['arch']}/{pkgname}-1-r0.apk"
+
+    monkeypatch.setattr(pmb.build.scheduler, "build_node", build_node)
+
+    arch = pmb.config.arch_native
+    func = pmb.build.scheduler.packages
+    progress = []
+    ret = func(args, [("top1", arch), ("top2", arch), ("uptodate", arch)],
+               jobs=3, progress=progress.append)
+    assert ret == {("top1", arch): f"{arch}/top1-1-r0.apk",
+                   ("top2", arch): f"{arch}/top2-1-r0.apk",
+                   ("uptodate", arch): None}
+
+    # Everything necessary got built once, dependencies first
+    built = [pkgname for event, pkgname in events if event == "done"]
+    assert sorted(built) == ["leaf1", "leaf2", "top1", "top2"]
+    assert sorted(progress) == [f"building {pkgname}"
+                                for pkgname in sorted(built)]
+    for pkgname, depends in [("top1", ["leaf1", "leaf2"]),
+                             ("top2", ["leaf2"])]:
+        start = events.index(("start", pkgname))
+        for depend in depends:
+            assert events.index(("done", depend)) < start
+
+    # Independent packages got built at the same time
+    assert max_running[0] > 1
+
+
+def test_packages_job(args, monkeypatch):
+    # Dependencies of a running job get built in its chroots, one at a time
+    fake_aports(monkeypatch, {"top": (["leaf1", "leaf2"], True),
+                              "leaf1": ([], True),
+                              "leaf2": ([], True)})
+    jobs = []
+
+    def build_node(args, node, job, strict, bootstrap_stage, build_lock):
+        jobs.append(job)
+        return f"{node['arch']}/{node['apkbuild']['pkgname']}-1-r0.apk"
+    monkeypatch.setattr(pmb.build.scheduler, "build_node", build_node)
+
+    arch = pmb.config.arch_native
+    pmb.build.scheduler.packages(args, [("top", arch)], jobs=3, job=2)
+    assert jobs == [2, 2, 2]
+
+def test_plan(args, monkeypatch):
+    # top -> mid (not necessary) -> leaf
+    fake_aports(monkeypatch, {"top": (["mid"], True),
+                              "mid": (["leaf"], False),
+                              "leaf": ([], True),
+                              "uptodate": ([], False)})
+    monkeypatch.setattr(pmb.build.other, "is_necessary_reason",
+                        lambda *args: "No binary package available")
+
+    arch = pmb.config.arch_native
+    built = copy.deepcopy(pmb.helpers.other.cache["built"])
+    ret = pmb.build.scheduler.plan(args, [("top", arch), ("uptodate", arch)])
+    assert [build["pkgname"] for build in ret] == ["leaf", "top"]
+    assert ret[1]["depends"] == [f"{arch}/leaf"]
+    assert ret[1]["reason"] == "No binary package available"
+    assert ret[1]["suffix"] == "native"
+
+    # Nothing was marked as built
+    assert pmb.helpers.other.cache["built"] == built
+
+    # Forced
+    ret = pmb.build.scheduler.plan(args, [("uptodate", arch)], force=True)
+    assert [(build["pkgname"], build["reason"]) for build in ret] == [
+        ("uptodate", "Forced")]
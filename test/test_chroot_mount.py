@@ -38,3 +38,63 @@ def test_chroot_mount(args):
 
     # Run again: it should not crash
     pmb.chroot.remove_mnt_pmbootstrap(args, suffix)
+
+
+def test_chroot_init_ready(args, monkeypatch):
+    calls = []
+
+    def fake_mount(args, suffix):
+        calls.append(suffix)
+        raise RuntimeError("mount called")
+    monkeypatch.setattr(pmb.chroot, "mount", fake_mount)
+
+    # Prepared already: return without mounting
+    usr_merge = pmb.chroot.UsrMerge.OFF
+    pmb.helpers.other.cache["chroot_ready"] = {"native": (usr_merge, False)}
+    pmb.chroot.init(args, "native", usr_merge, postmarketos_mirror=False)
+    pmb.chroot.init(args, "native")
+    assert calls == []
+
+    # Prepared with other arguments: prepare again
+    with pytest.raises(RuntimeError, match="mount called"):
+        pmb.chroot.init(args, "native", usr_merge)
+    assert calls == ["native"]
+    calls.clear()
+
+    # Not prepared, or reset by umount_all(): mount again
+    with pytest.raises(RuntimeError, match="mount called"):
+        pmb.chroot.init(args, "buildroot_armhf")
+    monkeypatch.setattr(pmb.helpers.mount, "umount_all_list",
+                        lambda folder: [f"{folder}/proc"])
+    monkeypatch.setattr(pmb.helpers.mount, "ismount", lambda folder: False)
+    monkeypatch.setattr(pmb.helpers.run, "root_batch", lambda args, cmds: 0)
+    pmb.helpers.mount.umount_all(args, f"{args.work}/chroot_native")
+    with pytest.raises(RuntimeError, match="mount called"):
+        pmb.chroot.init(args, "native")
+    assert calls == ["buildroot_armhf", "native"]
+
+
+def test_chroot_mount_mirror(args, monkeypatch):
+    binds = {}
+    mirror = {"path": None}
+    # pmb.chroot.mount is the function, not the module
+    module = sys.modules["pmb.chroot.mount"]
+    monkeypatch.setattr(module, "mount_dev_tmpfs", lambda args, suffix: None)
+    monkeypatch.setattr(pmb.config.pmaports, "read_config",
+                        lambda args: {"channel": "edge"})
+    monkeypatch.setattr(pmb.helpers.repo, "mirror_path",
+                        lambda args: mirror["path"])
+    monkeypatch.setattr(pmb.helpers.mount, "bind",
+                        lambda args, source, target: binds.update(
+                            {target: source}))
+    target = f"{args.work}/chroot_native/mnt/pmbootstrap/mirror"
+
+    # No offline mirror imported: don't create and mount the folder
+    pmb.chroot.mount(args, "native")
+    assert f"{args.work}/chroot_native/mnt/pmbootstrap/packages" in binds
+    assert target not in binds
+
+    # Imported offline mirror
+    mirror["path"] = f"{args.work}/mirror/edge"
+    pmb.chroot.mount(args, "native")
+    assert binds[target] == f"{args.work}/mirror/edge"
@@ -0,0 +1,66 @@
+# Copyright 2023 Oliver Smith
+# SPDX-License-Identifier: GPL-3.0-or-later
+""" Test pmb/chroot/zap.py """
+import glob
+import os
+import re
+import shutil
+import sys
+import pytest
+
+import pmb_test  # noqa
+import pmb.chroot
+import pmb.config
+import pmb.helpers.other
+
+
+@pytest.fixture
+def args(tmpdir, request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(pmb.helpers.logging.logfd.close)
+    args.work = str(tmpdir)
+    return args
+
+
+def test_persistent_cache_names():
+    # All persistent caches used in pmb are either removed with zap or kept
+    names = set()
+    for path in glob.glob(f"{pmb.config.pmb_src}/pmb/**/*.py", recursive=True):
+        with open(path) as handle:
+            names.update(re.findall(r'persistent_cache_[a-z]+\(\s*"([a-z_]+)"',
+                                    handle.read()))
+    assert names
+    parsed = set(pmb.helpers.other.persistent_cache_names)
+    kept = set(pmb.helpers.other.persistent_cache_names_kept)
+    assert not parsed & kept
+    assert names <= parsed | kept
+
+
+def test_zap_parse_cache(args, monkeypatch):
+    def root(args, cmd):
+        assert cmd[:2] == ["rm", "-rf"]
+        shutil.rmtree(cmd[2])
+    monkeypatch.setattr(pmb.chroot, "shutdown", lambda args: None)
+    monkeypatch.setattr(pmb.helpers.other, "folder_size",
+                        lambda args, path: 0)
+    monkeypatch.setattr(pmb.config.workdir, "clean", lambda args: None)
+    monkeypatch.setattr(pmb.helpers.run, "root", root)
+
+    for name in ["cache_apkindex_parsed", "cache_build_duration",
+                 "cache_http"]:
+        os.makedirs(f"{args.work}/{name}")
+
+    # Kept by default
+    pmb.chroot.zap(args, confirm=False)
+    assert sorted(os.listdir(args.work)) == ["cache_apkindex_parsed",
+                                             "cache_build_duration",
+                                             "cache_http"]
+
+    # Build durations can't be created again, they are always kept
+    pmb.chroot.zap(args, confirm=False, parse_cache=True)
+    assert sorted(os.listdir(args.work)) == ["cache_build_duration",
+                                             "cache_http"]
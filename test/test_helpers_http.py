@@ -0,0 +1,313 @@
+# Copyright 2023 Oliver Smith
+# SPDX-License-Identifier: GPL-3.0-or-later
+""" Test pmb.helpers.http """
+import functools
+import hashlib
+import http.server
+import os
+import sys
+import threading
+import urllib.error
+import pytest
+
+import pmb_test  # noqa
+import pmb.helpers.cli
+import pmb.helpers.http
+import pmb.helpers.logging
+
+
+@pytest.fixture
+def args(tmpdir, request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(pmb.helpers.logging.logfd.close)
+    args.work = str(tmpdir)
+    return args
+
+
+@pytest.fixture
+def server(tmpdir, request):
+    """ Local HTTP server with keep-alive, serving files from tmpdir/srv.
+        :returns: (base URL, srv dir, list of client ports of all
+                  connections, list of all response status codes) """
+    srv = f"{tmpdir}/srv"
+    os.makedirs(srv)
+    ports = []
+    statuses = []
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            ports.append(self.client_address[1])
+            super().setup()
+
+        def send_response(self, code, message=None):
+            statuses.append(code)
+            super().send_response(code, message)
+
+        def log_message(self, *args):
+            pass
+
+    handler = functools.partial(Handler, directory=srv)
+    return (start_server(request, handler), srv, ports, statuses)
+
+
+def start_server(request, handler):
+    """ Run a local HTTP server until the test is done.
+        :returns: base URL """
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    def shutdown():
+        httpd.shutdown()
+        httpd.server_close()
+    request.addfinalizer(shutdown)
+    return f"http://127.0.0.1:{httpd.server_address[1]}"
+
+
+def test_download(args, server):
+    url, srv, ports, statuses = server
+    with open(f"{srv}/file", "w") as handle:
+        handle.write("content")
+
+    func = pmb.helpers.http.download
+    path = func(args, f"{url}/file", "prefix")
+    with open(path) as handle:
+        assert handle.read() == "content"
+
+    # 404
+    assert func(args, f"{url}/missing", "prefix", allow_404=True) is None
+    with pytest.raises(urllib.error.HTTPError):
+        func(args, f"{url}/missing", "prefix")
+
+
+def test_download_many(args, server, monkeypatch):
+    url, srv, ports, statuses = server
+    monkeypatch.setattr(pmb.config, "http_download_jobs", 4)
+    urls = []
+    for i in range(40):
+        os.makedirs(f"{srv}/{i}")
+        with open(f"{srv}/{i}/APKINDEX.tar.gz", "w") as handle:
+            handle.write(f"index {i}")
+        urls.append(f"{url}/{i}/APKINDEX.tar.gz")
+    urls.append(f"{url}/missing/APKINDEX.tar.gz")
+
+    func = pmb.helpers.http.download_many
+    ret = func(args, urls, "APKINDEX", False, allow_404=True, progress=False)
+    assert list(ret.keys()) == urls
+    assert ret[urls[-1]] is None
+    for i in range(40):
+        with open(ret[urls[i]]) as handle:
+            assert handle.read() == f"index {i}"
+
+    # Connections were reused (at most one per thread, plus reconnects)
+    assert len(ports) < len(urls)
+
+    # Progress gets printed after each download, up to 100%
+    printed = []
+    monkeypatch.setattr(pmb.helpers.cli, "progress_print",
+                        lambda args, progress: printed.append(progress))
+    monkeypatch.setattr(pmb.helpers.cli, "progress_flush", lambda args: None)
+    func(args, urls[:4], "APKINDEX", False)
+    assert printed == [0.25, 0.5, 0.75, 1.0]
+
+
+def test_download_revalidate(args, server):
+    url, srv, ports, statuses = server
+    with open(f"{srv}/APKINDEX.tar.gz", "w") as handle:
+        handle.write("old")
+    os.utime(f"{srv}/APKINDEX.tar.gz", (1000000000, 1000000000))
+
+    func = pmb.helpers.http.download
+    path = func(args, f"{url}/APKINDEX.tar.gz", "APKINDEX")
+    assert os.path.exists(f"{path}.validators")
+    assert statuses == [200]
+
+    # Not modified: keep the file and update its mtime
+    os.utime(path, (0, 0))
+    assert func(args, f"{url}/APKINDEX.tar.gz", "APKINDEX", False) == path
+    assert statuses == [200, 304]
+    assert os.path.getmtime(path) > 0
+    with open(path) as handle:
+        assert handle.read() == "old"
+
+    # Modified
+    with open(f"{srv}/APKINDEX.tar.gz", "w") as handle:
+        handle.write("new")
+    func(args, f"{url}/APKINDEX.tar.gz", "APKINDEX", False)
+    assert statuses == [200, 304, 200]
+    with open(path) as handle:
+        assert handle.read() == "new"
+
+    # File in the cache has a different size: don't revalidate
+    with open(path, "w") as handle:
+        handle.write("broken")
+    func(args, f"{url}/APKINDEX.tar.gz", "APKINDEX", False)
+    assert statuses == [200, 304, 200, 200]
+    with open(path) as handle:
+        assert handle.read() == "new"
+
+
+def test_download_resume(args, request):
+    content = {"data": b"0123456789" * 1000}
+    requests = []
+
+    class RangeHandler(http.server.BaseHTTPRequestHandler):
+        """ Serve content["data"], with support for Range and If-Range """
+        def do_GET(self):
+            data = content["data"]
+            etag = '"' + hashlib.sha256(data).hexdigest() + '"'
+            start = 0
+            range_header = self.headers.get("Range")
+            requests.append(range_header)
+            if range_header and self.headers.get("If-Range") == etag:
+                start = int(range_header.split("=")[1].split("-")[0])
+            self.send_response(206 if start else 200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(data) - start))
+            self.end_headers()
+            self.wfile.write(data[start:])
+
+        def log_message(self, *args):
+            pass
+
+    url = start_server(request, RangeHandler) + "/file"
+    func = pmb.helpers.http.download
+    sha256 = hashlib.sha256(content["data"]).hexdigest()
+    path = func(args, url, "prefix", sha256=sha256, progress=True)
+    assert not os.path.exists(f"{path}.part")
+    assert requests == [None]
+
+    # Interrupted download: resume at the end of the .part file
+    os.rename(path, f"{path}.part")
+    os.rename(f"{path}.validators", f"{path}.part.validators")
+    with open(f"{path}.part", "r+b") as handle:
+        handle.truncate(1234)
+    assert func(args, url, "prefix", size=10000, sha256=sha256) == path
+    assert requests == [None, "bytes=1234-"]
+    with open(path, "rb") as handle:
+        assert handle.read() == content["data"]
+
+    # Cached file with wrong size gets downloaded again
+    with open(path, "r+b") as handle:
+        handle.truncate(10)
+    func(args, url, "prefix", size=10000)
+    assert requests == [None, "bytes=1234-", None]
+
+    # File changed on the server: start from the beginning
+    os.rename(path, f"{path}.part")
+    os.rename(f"{path}.validators", f"{path}.part.validators")
+    content["data"] = b"changed" * 100
+    func(args, url, "prefix", cache=False)
+    assert requests[-1] == "bytes=10000-"
+    with open(path, "rb") as handle:
+        assert handle.read() == content["data"]
+
+    # Checksum mismatch
+    os.remove(path)
+    with pytest.raises(RuntimeError) as e:
+        func(args, url, "prefix", sha256=sha256)
+    assert "expected sha256" in str(e.value)
+    assert not os.path.exists(path)
+    assert not os.path.exists(f"{path}.part")
+
+
+def test_download_resume_complete(args, request):
+    data = b"0123456789" * 1000
+    etag = '"' + hashlib.sha256(data).hexdigest() + '"'
+    requests = []
+    fail = {"code": None}
+
+    class RangeHandler(http.server.BaseHTTPRequestHandler):
+        """ Serve data, respond with 416 for ranges after its end and with
+            fail["code"] for all ranges if it is set """
+        def do_GET(self):
+            start = 0
+            range_header = self.headers.get("Range")
+            requests.append(range_header)
+            if range_header and self.headers.get("If-Range") == etag:
+                start = int(range_header.split("=")[1].split("-")[0])
+                if fail["code"] or start >= len(data):
+                    self.send_response(fail["code"] or 416)
+                    self.send_header("Content-Range", f"bytes */{len(data)}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+            self.send_response(206 if start else 200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(data) - start))
+            self.end_headers()
+            self.wfile.write(data[start:])
+
+        def log_message(self, *args):
+            pass
+
+    url = start_server(request, RangeHandler) + "/file"
+    func = pmb.helpers.http.download
+    path = func(args, url, "prefix")
+    assert requests == [None]
+
+    def interrupt(length):
+        """ Like an interrupted download, that wrote length bytes """
+        if os.path.exists(path):
+            os.rename(path, f"{path}.part")
+            os.rename(f"{path}.validators", f"{path}.part.validators")
+        with open(f"{path}.part", "r+b") as handle:
+            handle.truncate(length)
+
+    # Complete .part file with known size: no request
+    interrupt(len(data))
+    assert func(args, url, "prefix", size=len(data)) == path
+    assert requests == [None]
+    assert not os.path.exists(f"{path}.part")
+
+    # Complete .part file with unknown size: 416, use the .part file
+    interrupt(len(data))
+    assert func(args, url, "prefix") == path
+    assert requests == [None, f"bytes={len(data)}-"]
+    assert not os.path.exists(f"{path}.part")
+    with open(path, "rb") as handle:
+        assert handle.read() == data
+
+    # Other errors while resuming: start from the beginning
+    interrupt(1234)
+    fail["code"] = 500
+    assert func(args, url, "prefix") == path
+    assert requests[2:] == ["bytes=1234-", None]
+    assert not os.path.exists(f"{path}.part")
+    assert not os.path.exists(f"{path}.part.validators")
+    with open(path, "rb") as handle:
+        assert handle.read() == data
+
+
+def test_download_shared_cache(args, server, tmpdir):
+    url, srv, ports, statuses = server
+    with open(f"{srv}/file", "w") as handle:
+        handle.write("content")
+    args.shared_cache = f"{tmpdir}/shared"
+    work_1 = f"{tmpdir}/work_1"
+    work_2 = f"{tmpdir}/work_2"
+
+    # First work dir downloads the file
+    func = pmb.helpers.http.download
+    args.work = work_1
+    path_1 = func(args, f"{url}/file", "prefix")
+    assert statuses == [200]
+
+    # Second work dir gets it from the shared cache
+    args.work = work_2
+    path_2 = func(args, f"{url}/file", "prefix")
+    assert statuses == [200]
+    assert os.path.samefile(path_1, path_2)
+    with open(path_2) as handle:
+        assert handle.read() == "content"
+
+    # Revalidate with the validators from the shared cache
+    os.remove(path_2)
+    assert func(args, f"{url}/file", "prefix", False) == path_2
+    assert statuses == [200, 304]
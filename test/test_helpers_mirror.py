@@ -0,0 +1,72 @@
+# Copyright 2023 Oliver Smith
+# SPDX-License-Identifier: GPL-3.0-or-later
+""" Test pmb.helpers.mirror """
+import os
+import sys
+import pytest
+
+import pmb_test  # noqa
+import pmb.config.pmaports
+import pmb.helpers.logging
+import pmb.helpers.mirror
+import pmb.helpers.repo
+
+
+@pytest.fixture
+def args(tmpdir, request, monkeypatch):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(pmb.helpers.logging.logfd.close)
+    args.work = str(tmpdir)
+
+    # Fake channel and remote repositories
+    monkeypatch.setattr(pmb.config.pmaports, "read_config",
+                        lambda args: {"channel": "edge"})
+    monkeypatch.setattr(pmb.helpers.repo, "urls", lambda args, *_:
+                        ["http://localhost/pmos", "http://localhost/alpine"])
+    return args
+
+
+def write_index(path, packages):
+    """ :param packages: [(pkgname, version, provides), ...] """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as handle:
+        for pkgname, version, provides in packages:
+            handle.write(f"P:{pkgname}\nV:{version}\nA:x86_64\nt:1\n"
+                         f"p:{provides}\n\n")
+
+
+def test_find_files(args):
+    work = args.work
+    hash_pmos = pmb.helpers.repo.hash("http://localhost/pmos")
+    hash_alpine = pmb.helpers.repo.hash("http://localhost/alpine")
+    write_index(f"{work}/packages/edge/x86_64/APKINDEX.tar.gz",
+                [("a", "2-r0", "")])
+    write_index(f"{work}/cache_apk_x86_64/APKINDEX.{hash_pmos}.tar.gz",
+                [("a", "1-r0", ""), ("b", "1-r0", "so:libb.so.1")])
+    write_index(f"{work}/cache_apk_x86_64/APKINDEX.{hash_alpine}.tar.gz",
+                [("b", "1-r1", ""), ("c", "1-r0", "")])
+
+    # Highest version, from the local repository or a remote one
+    func = pmb.helpers.mirror.find_files
+    assert func(args, ["a", "b", "!c"], "x86_64") == {
+        "a-2-r0.apk": f"{work}/packages/edge/x86_64/a-2-r0.apk",
+        "b-1-r1.apk": "http://localhost/alpine/x86_64/b-1-r1.apk",
+    }
+    with pytest.raises(RuntimeError) as e:
+        func(args, ["a", "d"], "x86_64")
+    assert "No binary packages found for x86_64: d." in str(e.value)
+
+    # Imported offline mirror
+    assert pmb.helpers.repo.mirror_path(args) is None
+    mirror = f"{work}/mirror/edge"
+    write_index(f"{mirror}/x86_64/APKINDEX.tar.gz", [("d", "1-r0", "")])
+    open(f"{mirror}/mirror.cfg", "w").close()
+    assert pmb.helpers.repo.mirror_path(args) == mirror
+    assert f"{mirror}/x86_64/APKINDEX.tar.gz" in \
+        pmb.helpers.repo.apkindex_files(args, "x86_64")
+    assert func(args, ["d"], "x86_64") == {
+        "d-1-r0.apk": f"{mirror}/x86_64/d-1-r0.apk"}
@@ -36,11 +36,9 @@ def test_helpers_package_get_pmaports_and_cache(args, monkeypatch):
                 "pkgrel": "1"}
     monkeypatch.setattr(pmb.helpers.pmaports, "get", stub)
 
-    package = {"arch": ["armv7"],
-               "depends": ["testdepend"],
-               "pkgname": "testpkgname",
-               "provides": ["testprovide"],
-               "version": "1.0-r1"}
+    package = pmb.helpers.package.Package(["armv7"], ["testdepend"],
+                                          "testpkgname", ["testprovide"],
+                                          "1.0-r1")
     func = pmb.helpers.package.get
     assert func(args, "testpkgname", "armv7") == package
 
@@ -66,11 +64,9 @@ def test_helpers_package_get_apkindex(args, monkeypatch):
     monkeypatch.setattr(pmb.parse.apkindex, "package", stub)
 
     # Given arch
-    package = {"arch": ["armv7"],
-               "depends": ["testdepend"],
-               "pkgname": "testpkgname",
-               "provides": ["testprovide"],
-               "version": "1.0-r1"}
+    package = pmb.helpers.package.Package(["armv7"], ["testdepend"],
+                                          "testpkgname", ["testprovide"],
+                                          "1.0-r1")
     func = pmb.helpers.package.get
     assert func(args, "testpkgname", "armv7") == package
 
@@ -78,6 +74,30 @@ def test_helpers_package_get_apkindex(args, monkeypatch):
     assert func(args, "testpkgname", "x86_64") == package
 
 
+def test_helpers_package_get_shared(args, monkeypatch):
+    """ Test pmb.helpers.package.get(): the cached record gets shared """
+    def stub(args, pkgname, arch, must_exist):
+        return {"arch": "armv7", "depends": ["testdepend"],
+                "pkgname": pkgname, "provides": [], "version": "1.0-r1",
+                "origin": pkgname}
+    monkeypatch.setattr(pmb.parse.apkindex, "package", stub)
+    monkeypatch.setattr(pmb.helpers.pmaports, "get",
+                        lambda args, pkgname, must_exist: None)
+    monkeypatch.setattr(pmb.helpers.repo, "update", lambda args, arch=None: None)
+
+    func = pmb.helpers.package.get
+    package = func(args, "testshared", "armv7")
+    assert package is func(args, "testshared", "armv7")
+    assert package["depends"] == package.depends == ("testdepend",)
+    assert package["arch"] == ("armv7",)
+
+    # Immutable: callers can't modify the cache by accident
+    with pytest.raises(AttributeError):
+        package.depends = []
+    with pytest.raises(KeyError):
+        package["origin"]
+
+
 def test_helpers_package_depends_recurse(args):
     """ Test pmb.helpers.package.depends_recurse() """
 
@@ -98,6 +118,35 @@ def test_helpers_package_depends_recurse(args):
     assert func(args, "d", "armhf") == ["b", "d"]
 
 
+def test_helpers_package_depends_closures(args):
+    """ Test pmb.helpers.package.depends_closures() with circular depends """
+
+    # Put fake data into the pmb.helpers.package.get() cache: a and c depend
+    # on each other through the subpackage c-dev, e provides so:libe.so.1
+    cache = {"a": {"pkgname": "a", "depends": ["b", "c-dev"]},
+             "b": {"pkgname": "b", "depends": []},
+             "c": {"pkgname": "c", "depends": ["a", "so:libe.so.1"]},
+             "c-dev": {"pkgname": "c", "depends": ["a", "so:libe.so.1"]},
+             "d": {"pkgname": "d", "depends": ["c"]},
+             "e": {"pkgname": "e", "depends": ["b"]},
+             "so:libe.so.1": {"pkgname": "e", "depends": ["b"]}}
+    pmb.helpers.other.cache["pmb.helpers.package.get"]["armhf"] = {
+        pkgname: {False: package} for pkgname, package in cache.items()}
+
+    func = pmb.helpers.package.depends_closures
+    closures = func(args, ["a"], "armhf")
+    assert closures["a"] == {"a", "b", "c", "e"}
+    assert closures["c-dev"] is closures["a"]
+    assert closures["so:libe.so.1"] == {"b", "e"}
+    assert "d" not in closures
+
+    # Reuse the closures of the previous query
+    del pmb.helpers.other.cache["pmb.helpers.package.get"]["armhf"]["a"]
+    assert func(args, ["d"], "armhf")["d"] == {"a", "b", "c", "d", "e"}
+    assert pmb.helpers.package.depends_recurse(args, "c", "armhf") == \
+        ["a", "b", "c", "e"]
+
+
 def test_helpers_package_check_arch_package(args):
     """ Test pmb.helpers.package.check_arch(): binary = True """
     # Put fake data into the pmb.helpers.package.get() cache
@@ -50,3 +50,98 @@ def test_guess_main_dev(args, tmpdir):
     func = pmb.helpers.pmaports.guess_main
     assert func(args, "plasma-framework-dev") is None
     assert func(args, "plasma-randomsubpkg") == tmpdir + "/temp/plasma"
+
+
+def test_find_provides_index(args, tmpdir):
+    # Fake pmaports folder (not a git repository)
+    tmpdir = str(tmpdir)
+    args.aports = tmpdir
+    apkbuilds = {"main/bar": "",
+                 "main/zzz": 'subpackages="bar-sub"\n'
+                             'provides="bar-virtual=1 bar-unversioned"\n'}
+    for aport, extra in apkbuilds.items():
+        pkgname = os.path.basename(aport)
+        os.makedirs(f"{tmpdir}/{aport}")
+        with open(f"{tmpdir}/{aport}/APKBUILD", "w") as handle:
+            handle.write(f"pkgname={pkgname}\npkgver=1\npkgrel=0\n"
+                         f"arch=\"all\"\n{extra}")
+
+    # APKBUILD that can't be parsed: left out of the index
+    os.makedirs(f"{tmpdir}/main/broken")
+    with open(f"{tmpdir}/main/broken/APKBUILD", "w") as handle:
+        handle.write('pkgname="broken\n')
+
+    assert pmb.helpers.pmaports._git_stamp(args) is None
+    assert pmb.helpers.pmaports._provides_index(args) == {
+        "bar-sub": [f"{tmpdir}/main/zzz"],
+        "bar-virtual": [f"{tmpdir}/main/zzz"],
+    }
+
+    # Guessed main package "bar" doesn't have the subpackages, use the index
+    func = pmb.helpers.pmaports.find
+    assert func(args, "bar-sub") == f"{tmpdir}/main/zzz"
+    assert func(args, "bar-virtual") == f"{tmpdir}/main/zzz"
+
+    # Not in the index: assume that the guess was right
+    assert func(args, "bar-unversioned") == f"{tmpdir}/main/bar"
+
+
+def test_find_apkbuilds_git(args, tmpdir):
+    # Fake pmaports git repository
+    tmpdir = str(tmpdir)
+    args.aports = tmpdir
+    run = pmb.helpers.run.user
+    for aport in ["main/tracked", "main/deleted", "temp/tracked-2"]:
+        os.makedirs(f"{tmpdir}/{aport}")
+        open(f"{tmpdir}/{aport}/APKBUILD", "w").close()
+    run(args, ["git", "init", "-q"], tmpdir)
+    run(args, ["git", "add", "."], tmpdir)
+    run(args, ["git", "-c", "user.name=test", "-c", "user.email=test@test",
+               "commit", "-qm", "init"], tmpdir)
+    pmb.helpers.other.cache.pop("pmb.helpers.pmaports.apkbuilds", None)
+
+    func = pmb.helpers.pmaports._find_apkbuilds
+    assert pmb.helpers.pmaports._git_head(args)
+    assert list(func(args).keys()) == ["deleted", "tracked", "tracked-2"]
+
+    # Untracked, deleted, ignored and hidden APKBUILDs
+    os.unlink(f"{tmpdir}/main/deleted/APKBUILD")
+    for aport in ["main/untracked", "main/tracked/src/ignored",
+                  ".hidden/untracked-hidden"]:
+        os.makedirs(f"{tmpdir}/{aport}")
+        open(f"{tmpdir}/{aport}/APKBUILD", "w").close()
+    with open(f"{tmpdir}/.gitignore", "w") as handle:
+        handle.write("src/\n")
+    pmb.helpers.other.cache.pop("pmb.helpers.pmaports.apkbuilds", None)
+    assert func(args) == {
+        "tracked": f"{tmpdir}/main/tracked/APKBUILD",
+        "tracked-2": f"{tmpdir}/temp/tracked-2/APKBUILD",
+        "untracked": f"{tmpdir}/main/untracked/APKBUILD",
+    }
+
+    # Not a git repository: walk the tree
+    run(args, ["rm", "-rf", f"{tmpdir}/.git"])
+    pmb.helpers.other.cache.pop("pmb.helpers.pmaports.apkbuilds", None)
+    assert pmb.helpers.pmaports._git_head(args) is None
+    assert list(func(args).keys()) == ["ignored", "tracked", "tracked-2",
+                                       "untracked"]
+
+
+def test_provides_index_parser_stamp(args, tmpdir, monkeypatch):
+    # The persistent index is only valid for the same APKBUILD parser
+    args.aports = str(tmpdir)
+    stamps = []
+
+    def persistent_cache_load(name, key, stamp):
+        stamps.append(stamp)
+        return {}
+    monkeypatch.setattr(pmb.helpers.pmaports, "_git_stamp",
+                        lambda args: ("head", "index", ()))
+    monkeypatch.setattr(pmb.helpers.other, "persistent_cache_load",
+                        persistent_cache_load)
+    pmb.helpers.other.cache["pmb.helpers.pmaports.provides_index"] = None
+
+    assert pmb.helpers.pmaports._provides_index(args) == {}
+    assert stamps == [(pmb.parse._apkbuild.parser_stamp(), "head", "index",
+                       ())]
+    pmb.helpers.other.cache["pmb.helpers.pmaports.provides_index"] = None
@@ -1,6 +1,7 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
 """ Test pmb.helpers.repo """
+import os
 import pytest
 import sys
 
@@ -34,8 +35,9 @@ def test_alpine_apkindex_path(args):
     assert func(args, "testing", "armhf") == ret
 
 
-def test_urls(args, monkeypatch):
+def test_urls(args, monkeypatch, tmpdir):
     func = pmb.helpers.repo.urls
+    args.work = str(tmpdir)
     channel = "v20.05"
     args.mirror_alpine = "http://localhost/alpine/"
 
@@ -71,3 +73,15 @@ def test_urls(args, monkeypatch):
            "http://localhost/alpine/edge/community",
            "http://localhost/alpine/edge/testing"]
     assert func(args, False, False) == exp
+
+    # Imported offline mirror
+    os.makedirs(f"{args.work}/mirror/edge")
+    open(f"{args.work}/mirror/edge/mirror.cfg", "w").close()
+    assert func(args, postmarketos_mirror=False, alpine=False) == [
+        "/mnt/pmbootstrap/packages",
+        "/mnt/pmbootstrap/mirror"]
+
+    # Mirror of another channel
+    channel = "v20.05"
+    assert func(args, postmarketos_mirror=False, alpine=False) == [
+        "/mnt/pmbootstrap/packages"]
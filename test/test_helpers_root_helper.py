@@ -0,0 +1,96 @@
+# Copyright 2023 Oliver Smith
+# SPDX-License-Identifier: GPL-3.0-or-later
+""" Test pmb.helpers.root_helper """
+import os
+import sys
+import pytest
+
+import pmb_test  # noqa
+import pmb.config
+import pmb.helpers.logging
+import pmb.helpers.root_helper
+import pmb.helpers.run
+
+
+@pytest.fixture
+def args(request, monkeypatch):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(pmb.helpers.logging.logfd.close)
+
+    # Run the helper (and the fallback commands) as user
+    monkeypatch.setattr(pmb.config, "sudo", lambda cmd: cmd)
+    args.root_helper = True
+    request.addfinalizer(stop_helper)
+    return args
+
+
+def stop_helper():
+    process = pmb.helpers.root_helper.process
+    if process:
+        process.stdin.close()
+        process.wait()
+        process.stdout.close()
+    pmb.helpers.root_helper.process = None
+
+
+def test_supported(args):
+    func = pmb.helpers.root_helper.supported
+    assert func(args, ["mkdir", "-p", "/tmp/test"])
+    assert func(args, ["/bin/mount", "--bind", "/a", "/b"])
+    assert not func(args, ["sh", "-c", "mkdir /tmp/test"])
+    args.root_helper = False
+    assert not func(args, ["mkdir", "-p", "/tmp/test"])
+
+
+def test_root_batch(args, tmpdir):
+    path = f"{tmpdir}/a/b"
+    pmb.helpers.run.root_batch(args, [["mkdir", "-p", path],
+                                      ["touch", f"{path}/file"]])
+    assert os.path.exists(f"{path}/file")
+
+    # Same helper process for the next command
+    process = pmb.helpers.root_helper.process
+    assert process.poll() is None
+    assert pmb.helpers.run.root(args, ["rm", f"{path}/file"]) == 0
+    assert not os.path.exists(f"{path}/file")
+    assert pmb.helpers.root_helper.process is process
+
+
+def test_root_batch_failure(args, tmpdir):
+    cmds = [["mkdir", f"{tmpdir}/a"],
+            ["mkdir", f"{tmpdir}/a"],
+            ["touch", f"{tmpdir}/file"]]
+
+    # Stop at the first failing command
+    results = pmb.helpers.root_helper.run(cmds)
+    assert [code for code, output in results] == [0, 1]
+    assert "File exists" in results[1][1]
+    assert not os.path.exists(f"{tmpdir}/file")
+
+    with pytest.raises(RuntimeError) as e:
+        pmb.helpers.run.root_batch(args, cmds[1:])
+    assert str(e.value).startswith("Command failed")
+    assert pmb.helpers.run.root_batch(args, cmds[1:], check=False) == 1
+
+    # Return the output of the last command
+    output = pmb.helpers.run.root(args, ["mkdir", "-v", f"{tmpdir}/b"],
+                                  output_return=True)
+    assert f"{tmpdir}/b" in output
+
+
+def test_root_batch_without_helper(args, tmpdir):
+    args.root_helper = False
+    path = f"{tmpdir}/dir with spaces"
+    pmb.helpers.run.root_batch(args, [["mkdir", "-p", path],
+                                      ["touch", f"{path}/file"]])
+    assert os.path.exists(f"{path}/file")
+    assert pmb.helpers.root_helper.process is None
+
+    with pytest.raises(RuntimeError):
+        pmb.helpers.run.root_batch(args, [["mkdir", path],
+                                          ["touch", f"{tmpdir}/file"]])
+    assert not os.path.exists(f"{tmpdir}/file")
@@ -0,0 +1,68 @@
+# Copyright 2023 Oliver Smith
+# SPDX-License-Identifier: GPL-3.0-or-later
+""" Test pmb.helpers.shared_cache """
+import os
+import sys
+import pytest
+
+import pmb_test  # noqa
+import pmb.config
+import pmb.helpers.logging
+import pmb.helpers.shared_cache
+
+
+@pytest.fixture
+def args(tmpdir, request):
+    import pmb.parse
+    sys.argv = ["pmbootstrap", "init"]
+    args = pmb.parse.arguments()
+    args.log = args.work + "/log_testsuite.txt"
+    pmb.helpers.logging.init(args)
+    request.addfinalizer(pmb.helpers.logging.logfd.close)
+    args.work = f"{tmpdir}/work"
+    args.shared_cache = f"{tmpdir}/shared"
+    os.makedirs(args.work)
+    return args
+
+
+def test_insert(args, tmpdir):
+    func = pmb.helpers.shared_cache.insert
+    paths = [f"{tmpdir}/a", f"{tmpdir}/b", f"{tmpdir}/c"]
+    for path, content in zip(paths, ["same", "same", "different"]):
+        with open(path, "w") as handle:
+            handle.write(content)
+
+    # Same content gets deduplicated
+    sha256 = func(args, paths[0])
+    assert os.path.samefile(paths[0],
+                            pmb.helpers.shared_cache.blob_path(args, sha256))
+    assert func(args, paths[1]) == sha256
+    assert os.path.samefile(paths[0], paths[1])
+    assert func(args, paths[2]) != sha256
+    assert not os.path.samefile(paths[0], paths[2])
+
+    # URL index
+    assert pmb.helpers.shared_cache.url_get(args, "https://a") is None
+    pmb.helpers.shared_cache.url_set(args, "https://a", sha256,
+                                     {"etag": '"1"', "last_modified": None})
+    assert pmb.helpers.shared_cache.url_get(args, "https://a") == {
+        "sha256": sha256, "etag": '"1"', "last_modified": None, "size": 4}
+
+
+def test_link_dirs(args):
+    shared = os.path.realpath(args.shared_cache)
+    os.makedirs(f"{args.work}/cache_apk_{pmb.config.arch_native}")
+    pmb.helpers.shared_cache.link_dirs(args)
+
+    # Existing caches are kept
+    assert not os.path.islink(f"{args.work}/cache_apk_"
+                              f"{pmb.config.arch_native}")
+    assert os.readlink(f"{args.work}/cache_distfiles") == \
+        f"{shared}/cache_distfiles"
+    assert os.path.isdir(f"{shared}/cache_distfiles")
+
+    # Disabled
+    args.shared_cache = ""
+    os.unlink(f"{args.work}/cache_distfiles")
+    pmb.helpers.shared_cache.link_dirs(args)
+    assert not os.path.lexists(f"{args.work}/cache_distfiles")
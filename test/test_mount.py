@@ -1,7 +1,10 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
+from argparse import Namespace
+
 import pmb_test  # noqa
 import pmb.helpers.mount
+import pmb.helpers.other
 
 
 def test_umount_all_list(tmpdir):
@@ -23,3 +26,45 @@ def test_umount_all_list(tmpdir):
     ret = pmb.helpers.mount.umount_all_list("/test", fake_mounts)
     assert ret == ["/test/var/cache", "/test/proc", "/test/home/pmos/packages",
                    "/test/dev/loop0p2", "/test"]
+
+
+def test_mount_table(tmpdir):
+    fake_mounts = str(tmpdir + "/mounts")
+    with open(fake_mounts, "w") as handle:
+        handle.write("/dev/sda1 / ext4 rw 0 0\n")
+        handle.write("tmpfs /test/dev tmpfs rw 0 0\n")
+
+    table = pmb.helpers.mount.MountTable(fake_mounts)
+    assert table.ismount("/test/dev")
+    assert table.ismount("/dev/sda1")
+    assert not table.ismount("/test")
+    assert table.get() == [("/dev/sda1", "/"), ("tmpfs", "/test/dev")]
+
+    # Parsed once, until it gets invalidated
+    with open(fake_mounts, "a") as handle:
+        handle.write("/test/a /test/b none rw,bind 0 0\n")
+    assert not table.ismount("/test/b")
+    table.invalidate()
+    assert table.ismount("/test/b")
+    assert table.ismount("/test/a")
+    table.handle.close()
+
+
+def test_chroot_ready_reset():
+    args = Namespace(work="/work")
+    ready = {suffix: None for suffix in ["native", "buildroot_armhf",
+                                         "buildroot_armv7", "rootfs_qemu"]}
+    pmb.helpers.other.init_cache()
+    pmb.helpers.other.cache["chroot_ready"] = ready
+
+    pmb.helpers.mount.chroot_ready_reset(args, "/work/chroot_native/mnt")
+    assert list(ready) == ["buildroot_armhf", "buildroot_armv7", "rootfs_qemu"]
+
+    pmb.helpers.mount.chroot_ready_reset(args, "/work/chroot_buildroot_arm")
+    assert list(ready) == ["buildroot_armhf", "buildroot_armv7", "rootfs_qemu"]
+
+    pmb.helpers.mount.chroot_ready_reset(args, "/work/chroot_buildroot_armv7")
+    assert list(ready) == ["buildroot_armhf", "rootfs_qemu"]
+
+    pmb.helpers.mount.chroot_ready_reset(args, "/work")
+    assert list(ready) == []
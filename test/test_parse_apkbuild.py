@@ -1,5 +1,6 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
+import os
 import pytest
 import sys
 
@@ -166,3 +167,34 @@ def test_weird_pkgver(args):
         "/APKBUILD.weird-pkgver")
     apkbuild = pmb.parse.apkbuild(path, check_pkgname=False, check_pkgver=True)
     assert apkbuild["pkgver"] == "3.0.0_alpha369-r0"
+
+
+def test_persistent_cache(args, monkeypatch, tmpdir):
+    work = str(tmpdir)
+    monkeypatch.setattr(pmb.helpers.other, "persistent_cache_work", work)
+    path = f"{work}/APKBUILD"
+    source = pmb_test.const.testdata + "/apkbuild/APKBUILD.variable-replacements"
+    with open(source) as handle:
+        content = handle.read()
+    with open(path, "w") as handle:
+        handle.write(content)
+
+    # First parse fills the persistent cache
+    pmb.helpers.other.init_cache()
+    apkbuild = pmb.parse.apkbuild(path, check_pkgname=False)
+    assert len(os.listdir(f"{work}/cache_apkbuild_parsed")) == 1
+
+    # Next session: use the persistent cache (don't parse again)
+    pmb.helpers.other.init_cache()
+    monkeypatch.setattr(pmb.parse._apkbuild, "_parse_attributes", None)
+    assert pmb.parse.apkbuild(path, check_pkgname=False) == apkbuild
+
+    # Changed content, even with the same mtime: parse again
+    monkeypatch.undo()
+    monkeypatch.setattr(pmb.helpers.other, "persistent_cache_work", work)
+    pmb.helpers.other.init_cache()
+    mtime = os.path.getmtime(path)
+    with open(path, "w") as handle:
+        handle.write(content.replace("pkgrel=0", "pkgrel=1"))
+    os.utime(path, (mtime, mtime))
+    assert pmb.parse.apkbuild(path, check_pkgname=False)["pkgrel"] == "1"
@@ -5,6 +5,7 @@ import collections
 import os
 import pytest
 import sys
+import tarfile
 
 import pmb_test  # noqa
 import pmb.parse.apkindex
@@ -143,6 +144,57 @@ def test_parse_next_block_conflict():
     assert start == [20]
 
 
+def test_parse_blocks_iter():
+    """
+    The single pass parser must return the same blocks and raise the same
+    errors as parse_next_block() for all test APKINDEX files.
+    """
+    folder = pmb.config.pmb_src + "/test/testdata/apkindex"
+    for file in sorted(os.listdir(folder)):
+        path = f"{folder}/{file}"
+        with open(path, "r", encoding="utf-8") as handle:
+            lines = handle.readlines()
+
+        # Expected result from parse_next_block()
+        expected = []
+        error = None
+        start = [0]
+        try:
+            while True:
+                block = pmb.parse.apkindex.parse_next_block(path, lines,
+                                                            start)
+                if not block:
+                    break
+                expected.append(block)
+        except RuntimeError as e:
+            error = str(e)
+
+        # Compare with parse_blocks_iter()
+        ret = []
+        try:
+            for block in pmb.parse.apkindex.parse_blocks_iter(path, lines):
+                ret.append(block)
+            assert error is None
+        except RuntimeError as e:
+            assert str(e) == error
+        assert ret == expected
+
+
+def test_parse_blocks_tar(tmpdir):
+    # Pack an APKINDEX into an APKINDEX.tar.gz
+    source = pmb.config.pmb_src + "/test/testdata/apkindex/no_error"
+    path = str(tmpdir) + "/APKINDEX.tar.gz"
+    with tarfile.open(path, "w:gz") as tar:
+        tar.add(source, "APKINDEX")
+
+    blocks = pmb.parse.apkindex.parse_blocks(path)
+    assert [block["pkgname"] for block in blocks] == ["musl", "curl"]
+    assert blocks[1]["depends"] == ["ca-certificates",
+                                    "so:libc.musl-x86_64.so.1",
+                                    "so:libcurl.so.4",
+                                    "so:libz.so.1"]
+
+
 def test_parse_add_block(args):
     func = pmb.parse.apkindex.parse_add_block
     multiple_providers = False
@@ -275,6 +327,106 @@ def test_parse():
     )
 
 
+def test_parse_persistent_cache(monkeypatch, tmpdir):
+    # Copy an APKINDEX, so we can modify it
+    work = str(tmpdir)
+    path = f"{work}/APKINDEX"
+    with open(f"{pmb.config.pmb_src}/test/testdata/apkindex/no_error") as h:
+        content = h.read()
+    with open(path, "w") as handle:
+        handle.write(content)
+    monkeypatch.setattr(pmb.helpers.other, "persistent_cache_work", work)
+    pmb.helpers.other.init_cache()
+
+    # First parse: fills the persistent cache
+    func = pmb.parse.apkindex.parse
+    ret = func(path)
+    assert "curl" in ret
+    assert len(os.listdir(f"{work}/cache_apkindex_parsed")) == 1
+
+    # New session: the persistent cache gets used (fake its content to
+    # verify that the file does not get parsed again)
+    pmb.helpers.other.init_cache()
+    stat = os.stat(path)
+    pmb.helpers.other.persistent_cache_save("apkindex_parsed",
+                                            f"multiple:{path}",
+                                            (stat.st_mtime_ns, stat.st_size),
+                                            {"cached": {}})
+    assert func(path) == {"cached": {}}
+
+    # Modified file: the persistent cache entry is outdated
+    pmb.helpers.other.init_cache()
+    with open(path, "w") as handle:
+        handle.write(content.split("\n\n")[0] + "\n\n")
+    assert list(func(path).keys()) == ["musl", "so:libc.musl-x86_64.so.1"]
+
+    # clear_cache() removes the persistent cache entries
+    pmb.parse.apkindex.clear_cache(path)
+    assert os.listdir(f"{work}/cache_apkindex_parsed") == []
+
+
+def test_view(monkeypatch, tmpdir):
+    work = str(tmpdir)
+    monkeypatch.setattr(pmb.helpers.other, "persistent_cache_work", work)
+    pmb.helpers.other.init_cache()
+
+    # Pack an APKINDEX with a virtual package into an APKINDEX.tar.gz
+    source = pmb.config.pmb_src + "/test/testdata/apkindex/virtual_package"
+    path = f"{work}/APKINDEX.tar.gz"
+    with tarfile.open(path, "w:gz") as tar:
+        tar.add(source, "APKINDEX")
+
+    # Same providers as with parse(), for compressed and uncompressed files
+    for path_index in [path, source]:
+        view = pmb.parse.apkindex.view(path_index)
+        ret = pmb.parse.apkindex.parse(path_index)
+        assert sorted(view.offsets.keys()) == sorted(ret.keys())
+        for package in ret.keys():
+            assert view.get(package) == ret[package]
+        assert view.get(".pmbootstrap") is None
+        assert view.blocks
+
+    # Decompressed file and offset table are kept for the next session
+    pmb.helpers.other.init_cache()
+    assert len(os.listdir(f"{work}/cache_apkindex_raw")) == 1
+    view = pmb.parse.apkindex.view(path)
+    assert view.blocks == {}
+    assert view.get("cmd:hello-world")["hello-world"]["version"] == "2-r0"
+
+    # clear_cache() unmaps the file, parsed blocks stay available
+    data = view.data
+    assert pmb.parse.apkindex.clear_cache(path)
+    assert data.closed
+    assert view.get("cmd:hello-world")["hello-world"]["version"] == "2-r0"
+    view.blocks.clear()
+    view.provided.clear()
+    with pytest.raises(RuntimeError, match="view was closed"):
+        view.get("hello-world")
+    with pmb.parse.apkindex.view(path) as view:
+        data = view.data
+        assert view.get("hello-world")
+    assert data.closed
+
+    # New version of the APKINDEX: only the outdated decompressed file gets
+    # removed, not the temp files of other processes
+    raw = f"{work}/cache_apkindex_raw"
+    path_raw = os.listdir(raw)[0]
+    path_temp = f"{raw}/{path_raw}_1_2.1234.tmp"
+    open(path_temp, "w").close()
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    pmb.helpers.other.init_cache()
+    pmb.parse.apkindex.view(path)
+    assert path_raw not in os.listdir(raw)
+    assert len(os.listdir(raw)) == 2
+    assert os.path.exists(path_temp)
+
+    # Disabled without persistent cache
+    monkeypatch.setattr(pmb.helpers.other, "persistent_cache_work", None)
+    pmb.helpers.other.init_cache()
+    assert pmb.parse.apkindex.view(path) is None
+
+
 def test_parse_virtual():
     """
     This APKINDEX contains a virtual package .pbmootstrap. It must not be part
@@ -330,6 +482,35 @@ def test_providers_highest_version(args, monkeypatch):
     assert providers["test"]["version"] == "3"
 
 
+def test_merged(args, monkeypatch):
+    # Fake parse function: "i1" has a newer "test", "i2" adds a provider
+    parsed = []
+
+    def return_fake_parse(path):
+        parsed.append(path)
+        block_old = {"pkgname": "test", "version": "1"}
+        block_new = {"pkgname": "test", "version": "2"}
+        block_other = {"pkgname": "other", "version": "1"}
+        return {"i0": {"test": {"test": block_old}},
+                "i1": {"test": {"test": block_new}},
+                "i2": {"test": {"other": block_other},
+                       "other": {"other": block_other}}}[path]
+    monkeypatch.setattr(pmb.parse.apkindex, "parse", return_fake_parse)
+
+    func = pmb.parse.apkindex.merged
+    ret = func(["i0", "i1", "i2"])
+    assert ret["test"]["test"]["version"] == "2"
+    assert list(ret["test"].keys()) == ["test", "other"]
+    assert ret["other"] == {"other": {"pkgname": "other", "version": "1"}}
+
+    # Cached for the session, until the cache of one index is cleared
+    assert func(["i0", "i1", "i2"]) is ret
+    assert len(parsed) == 3
+    pmb.parse.apkindex.clear_cache("i1")
+    assert func(["i0", "i1", "i2"]) is not ret
+    assert len(parsed) == 6
+
+
 def test_provider_highest_priority(args, monkeypatch):
     # Verify that it picks the provider with highest priority
     func = pmb.parse.apkindex.provider_highest_priority
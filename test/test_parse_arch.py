@@ -1,7 +1,9 @@
 # Copyright 2024 Stefan "Newbyte" Hansson
 # SPDX-License-Identifier: GPL-3.0-or-later
 import pytest
+from argparse import Namespace
 
+import pmb.config
 import pmb.parse.arch
 
 
@@ -13,3 +15,17 @@ def test_machine_type_to_alpine() -> None:
         assert e == f"Can not map machine type {fake_machine_type} to the right Alpine Linux architecture"
 
     assert pmb.parse.arch.machine_type_to_alpine("armv7l") == "armv7"
+
+
+def test_from_chroot_suffix() -> None:
+    args = Namespace(device="qemu-amd64")
+    func = pmb.parse.arch.from_chroot_suffix
+
+    assert func(args, "native") == pmb.config.arch_native
+    assert func(args, "native_2") == pmb.config.arch_native
+    assert func(args, "buildroot_x86_64") == "x86_64"
+    assert func(args, "buildroot_x86_64_3") == "x86_64"
+    assert func(args, "buildroot_x86") == "x86"
+    assert func(args, "buildroot_x86_2") == "x86"
+    with pytest.raises(ValueError):
+        func(args, "native_invalid")
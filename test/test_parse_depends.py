@@ -2,8 +2,11 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 """ Test pmb.parse.depends """
 import collections
+import logging
+import random
 import pytest
 import sys
+import time
 
 import pmb_test  # noqa
 import pmb.config
@@ -165,3 +168,114 @@ def test_recurse(args, monkeypatch):
     result = ["test", "so:libtest.so.1", "libtest", "libtest_depend",
               "!libtest_conflict"]
     assert func(args, pkgnames) == result
+
+
+def recurse_reference(args, pkgnames, suffix="native"):
+    """ pmb.parse.depends.recurse() before it was optimized, with lists """
+    todo = list(pkgnames)
+    ret = []
+    while len(todo):
+        pkgname_depend = todo.pop(0)
+        if pkgname_depend in ret:
+            continue
+        is_conflict = pkgname_depend.startswith("!")
+        pkgname_depend = pkgname_depend.lstrip("!")
+        pkgnames_install = list(ret) + todo
+        package = pmb.parse.depends.package_from_aports(args, pkgname_depend)
+        package = pmb.parse.depends.package_from_index(args, pkgname_depend,
+                                                       pkgnames_install,
+                                                       package, suffix)
+        if not package:
+            if is_conflict:
+                continue
+            raise RuntimeError(f"Could not find dependency '{pkgname_depend}'")
+        pkgname = package["pkgname"]
+        if is_conflict:
+            pkgname = f"!{pkgname}"
+        if pkgname not in ret:
+            if not is_conflict:
+                todo += package["depends"]
+            ret.append(pkgname)
+    return ret
+
+
+def synthetic_repo(args, monkeypatch, count, seed=1):
+    """
+    Replace the APKINDEX files and pmaports with a random repository of
+    count packages (pkg0, pkg1, ...), with:
+    - so:/cmd: dependencies with one or more providers (some with
+      provider_priority)
+    - conflicting dependencies (!pkg42), some of them missing
+    - some packages that are also in pmaports, with an older or newer version
+    - some packages that are installed already
+
+    :returns: list of pkgnames
+    """
+    rand = random.Random(seed)
+    pkgnames = [f"pkg{i}" for i in range(count)]
+    blocks = {pkgname: {"pkgname": pkgname, "version": "1-r0",
+                        "depends": [], "provides": []}
+              for pkgname in pkgnames}
+    provides = [f"so:lib{i}.so.1" for i in range(count // 5)] + \
+        [f"cmd:tool{i}" for i in range(count // 20)]
+    providers = collections.defaultdict(collections.OrderedDict)
+    for pkgname, block in blocks.items():
+        providers[pkgname][pkgname] = block
+    for provide in provides:
+        for pkgname in rand.sample(pkgnames, rand.choice([1, 1, 1, 2, 3])):
+            blocks[pkgname]["provides"].append(provide)
+            if rand.random() < 0.2:
+                blocks[pkgname]["provider_priority"] = rand.choice([10, 100])
+            providers[provide][pkgname] = blocks[pkgname]
+    # Packages of the same name aren't the only provider of their name
+    for pkgname in rand.sample(pkgnames, count // 50):
+        other = rand.choice(pkgnames)
+        providers[pkgname][other] = blocks[other]
+
+    choices = pkgnames + provides
+    for block in blocks.values():
+        block["depends"] = rand.sample(choices, rand.randint(0, 6))
+        if rand.random() < 0.05:
+            block["depends"].append(f"!{rand.choice(pkgnames + ['gone'])}")
+
+    aports = {}
+    for pkgname in rand.sample(pkgnames, count // 20):
+        aports[pkgname] = {"pkgname": pkgname,
+                           "depends": rand.sample(choices, 3),
+                           "version": rand.choice(["0-r0", "2-r0"])}
+    installed = {pkgname: blocks[pkgname]
+                 for pkgname in rand.sample(pkgnames, count // 10)}
+    args.selected_providers = {provide: rand.choice(list(providers[provide]))
+                               for provide in rand.sample(provides, 10)}
+
+    monkeypatch.setattr(pmb.parse.apkindex, "providers",
+                        lambda args, pkgname, arch, must_exist:
+                        providers.get(pkgname, {}))
+    monkeypatch.setattr(pmb.parse.depends, "package_from_aports",
+                        lambda args, pkgname: aports.get(pkgname))
+    monkeypatch.setattr(pmb.chroot.apk, "installed",
+                        lambda args, suffix: installed)
+    return pkgnames
+
+
+def test_recurse_equivalence(args, monkeypatch):
+    for seed in range(5):
+        pkgnames = synthetic_repo(args, monkeypatch, 500, seed)
+        world = pkgnames[:10]
+        assert pmb.parse.depends.recurse(args, world) == \
+            recurse_reference(args, world)
+
+
+@pytest.mark.benchmark
+def test_recurse_benchmark(args, monkeypatch):
+    """ Resolve 5000 packages, run with: pytest -m benchmark -s """
+    monkeypatch.setattr(logging, "verbose", lambda *args, **kwargs: None)
+    pkgnames = synthetic_repo(args, monkeypatch, 5000)
+    world = pkgnames[:20]
+    results = []
+    for func in [recurse_reference, pmb.parse.depends.recurse]:
+        time_start = time.monotonic()
+        results.append(func(args, world))
+        print(f"\n{func.__name__}: {len(results[-1])} packages in"
+              f" {time.monotonic() - time_start:.2f}s")
+    assert results[0] == results[1]
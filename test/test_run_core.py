@@ -1,8 +1,10 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
 """ Test pmb.helpers.run_core """
+import os
 import pytest
 import re
+import resource
 import subprocess
 import sys
 import time
@@ -122,6 +124,100 @@ def test_foreground_pipe(args):
     assert len(child_procs) == 0
 
 
+def test_foreground_pipe_stats(args):
+    func = pmb.helpers.run_core.foreground_pipe
+    cmd = ["sh", "-c", "yes 0123456789abcdefghi | head -n 100000"]
+    stats = {}
+    code, output = func(args, cmd, output_return=True, stats=stats)
+    assert code == 0
+    assert output == "0123456789abcdefghi\n" * 100000
+    assert stats["bytes"] == 2000000
+    assert stats["lines"] == 100000
+
+    # Only keep the tail (whole lines)
+    code, output = func(args, cmd, output_return=True, output_tail=50)
+    assert output == "0123456789abcdefghi\n" * 2
+
+
+def test_output_tail():
+    tail = pmb.helpers.run_core.OutputTail(10)
+    for chunk in [b"first\n", b"second\nth", b"ird\n", b"fourth\n"]:
+        tail.append(chunk)
+    assert list(tail.chunks) == [b"ird\n", b"fourth\n"]
+    assert tail.get() == b"fourth\n"
+
+
+@pytest.mark.benchmark
+def test_foreground_pipe_benchmark(args, monkeypatch):
+    """ Read 1 GiB of output, run with: pytest -m benchmark -s """
+    monkeypatch.setattr(pmb.helpers.logging, "logfd", open(os.devnull, "w"))
+    size = 1024 ** 3
+    line = "  CC      drivers/gpu/drm/msm/adreno/a6xx_gpu.o\n"
+    cmd = ["sh", "-c", f"yes '{line[:-1]}' | head -c {size}"]
+    stats = {}
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    time_start = time.monotonic()
+    pmb.helpers.run_core.foreground_pipe(args, cmd, output_timeout=False,
+                                         stats=stats)
+    duration = time.monotonic() - time_start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (usage.ru_utime - usage_start.ru_utime +
+           usage.ru_stime - usage_start.ru_stime)
+    print(f"\n{size / 1024 ** 2 / duration:.0f} MiB/s, pmbootstrap CPU time:"
+          f" {cpu:.2f}s of {duration:.2f}s")
+    assert stats["bytes"] == size
+    assert stats["lines"] == size // len(line)
+
+
+def test_process_tree(tmpdir):
+    # Fake /proc, command names may contain spaces and parentheses
+    stats = {"1": "1 (init) S 0 1 1",
+             "20": "20 (a (b) c) S 1 20 20",
+             "21": "21 (sleep) S 20 20 20",
+             "22": "22 (other) S 1 22 22",
+             "30": "30 (sleep) S 21 20 20"}
+    for pid, stat in stats.items():
+        os.makedirs(f"{tmpdir}/{pid}")
+        with open(f"{tmpdir}/{pid}/stat", "w") as handle:
+            handle.write(stat + " 0 0 0\n")
+    os.makedirs(f"{tmpdir}/self")
+
+    func = pmb.helpers.run_core.process_tree
+    assert func(20, str(tmpdir)) == [20, 21, 30]
+    assert sorted(func(1, str(tmpdir))) == [1, 20, 21, 22, 30]
+    assert func(30, str(tmpdir)) == [30]
+
+
+def test_kill_command_deep_tree(tmpdir):
+    """ Spawn a process tree with one shell and one sleep per level """
+    depth = 100
+    script = f"{tmpdir}/tree.sh"
+    with open(script, "w") as handle:
+        handle.write('if [ "$1" -gt 0 ]; then sh "$0" $(($1 - 1)) & fi\n'
+                     "sleep 60 &\n"
+                     "wait\n")
+    process = subprocess.Popen(["sh", script, str(depth)])
+
+    func = pmb.helpers.run_core.process_tree
+    pids = []
+    for i in range(100):
+        pids = func(process.pid)
+        if len(pids) == 2 * (depth + 1):
+            break
+        time.sleep(0.1)
+    assert len(pids) == 2 * (depth + 1)
+
+    pmb.helpers.run_core.kill_command(None, process.pid, False)
+    assert process.wait() == -9
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as handle:
+                # Killed, but not reaped yet by the init process
+                assert handle.read().rsplit(")", 1)[1].split()[0] in "ZX"
+        except FileNotFoundError:
+            pass
+
+
 def test_foreground_tui():
     func = pmb.helpers.run_core.foreground_tui
     assert func(["echo", "test"]) == 0
@@ -0,0 +1,110 @@
+# Copyright 2023 Oliver Smith
+# SPDX-License-Identifier: GPL-3.0-or-later
+""" Test pmb/data/sync-aport.py """
+import importlib.util
+import os
+import pytest
+
+import pmb_test  # noqa
+import pmb.config
+
+
+@pytest.fixture
+def sync_aport():
+    path = f"{pmb.config.pmb_src}/pmb/data/sync-aport.py"
+    spec = importlib.util.spec_from_file_location("sync_aport", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as handle:
+        handle.write(content)
+
+
+def read(path):
+    with open(path) as handle:
+        return handle.read()
+
+
+def test_sync(sync_aport, tmpdir):
+    aport = f"{tmpdir}/aport"
+    build = f"{tmpdir}/build"
+    uid = os.getuid()
+    gid = os.getgid()
+    write(f"{aport}/APKBUILD", "pkgname=hello-world\n")
+    write(f"{aport}/patches/fix.patch", "patch\n")
+    write(f"{aport}/src/leftover", "from abuild\n")
+    write(f"{tmpdir}/shared/config", "config\n")
+    os.symlink("../shared/config", f"{aport}/config")
+    os.symlink("../shared", f"{aport}/shared")
+
+    # Initial copy with resolved symlinks
+    assert sync_aport.sync(aport, build, uid, gid, ["src"]) == 4
+    assert sorted(os.listdir(build)) == ["APKBUILD", "config", "patches",
+                                         "shared"]
+    assert not os.path.islink(f"{build}/config")
+    assert not os.path.islink(f"{build}/shared")
+    assert read(f"{build}/config") == "config\n"
+    assert read(f"{build}/shared/config") == "config\n"
+
+    # Leftovers from the previous build get removed, unchanged files stay
+    inode = os.stat(f"{build}/patches/fix.patch").st_ino
+    write(f"{build}/src/hello.c", "generated\n")
+    write(f"{build}/APKBUILD", "changed during the build\n")
+    os.unlink(f"{aport}/config")
+    assert sync_aport.sync(aport, build, uid, gid, ["src"]) == 1
+    assert sorted(os.listdir(build)) == ["APKBUILD", "patches", "shared"]
+    assert read(f"{build}/APKBUILD") == "pkgname=hello-world\n"
+    assert os.stat(f"{build}/patches/fix.patch").st_ino == inode
+
+
+def test_sync_target_symlinks(sync_aport, tmpdir):
+    aport = f"{tmpdir}/aport"
+    build = f"{tmpdir}/build"
+    outside = f"{tmpdir}/outside"
+    write(f"{aport}/patches/fix.patch", "patch\n")
+    write(f"{outside}/fix.patch", "outside\n")
+    os.makedirs(build)
+    os.symlink(outside, f"{build}/patches")
+
+    # Symlinks in the target get replaced, not followed
+    sync_aport.sync(aport, build, os.getuid(), os.getgid())
+    assert not os.path.islink(f"{build}/patches")
+    assert read(f"{build}/patches/fix.patch") == "patch\n"
+    assert read(f"{outside}/fix.patch") == "outside\n"
+
+
+def test_sync_temp_symlink(sync_aport, tmpdir):
+    aport = f"{tmpdir}/aport"
+    build = f"{tmpdir}/build"
+    outside = f"{tmpdir}/outside"
+    write(f"{aport}/APKBUILD", "pkgname=hello-world\n")
+    write(outside, "outside\n")
+    os.chmod(outside, 0o600)
+    os.makedirs(build)
+    os.symlink(outside, f"{build}/.APKBUILD.sync-aport")
+
+    # A symlink planted at the temp name doesn't redirect the write
+    sync_aport.sync(aport, build, os.getuid(), os.getgid())
+    assert sorted(os.listdir(build)) == ["APKBUILD"]
+    assert not os.path.islink(f"{build}/APKBUILD")
+    assert read(f"{build}/APKBUILD") == "pkgname=hello-world\n"
+    assert read(outside) == "outside\n"
+    assert os.stat(outside).st_mode & 0o777 == 0o600
+
+    # Also when it gets planted after the cleanup (e.g. by a process that is
+    # still running in the chroot)
+    os.symlink(outside, f"{build}/.APKBUILD.sync-aport")
+    st_source = os.stat(f"{aport}/APKBUILD")
+    fd = os.open(build, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        sync_aport.copy(f"{aport}/APKBUILD", st_source, fd, "APKBUILD",
+                        os.getuid(), os.getgid())
+    finally:
+        os.close(fd)
+    assert sorted(os.listdir(build)) == ["APKBUILD"]
+    assert read(outside) == "outside\n"
+    assert os.stat(outside).st_mode & 0o777 == 0o600
@@ -1,6 +1,7 @@
 # Copyright 2023 Oliver Smith
 # SPDX-License-Identifier: GPL-3.0-or-later
 import sys
+import time
 import pytest
 
 import pmb_test
@@ -68,3 +69,85 @@ def test_version_check_string():
 
     assert func("5.2.0_rc3", "<5.2.0") is False
     assert func("5.2.0_rc3", ">=5.2.0") is True
+
+
+def compare_reference(a_version, b_version, fuzzy=False):
+    """
+    Compare two versions by parsing both strings one token at a time, like
+    apk-tools does it. This is how pmb.parse.version.compare() worked before
+    it got the cached VersionKey objects, test_version_benchmark() uses it
+    to verify the results and to measure the speedup.
+    """
+    get_token = pmb.parse.version.get_token
+    token_value = pmb.parse.version.token_value
+    a_token = b_token = "digit"
+    a_value = b_value = 0
+    a_rest = a_version
+    b_rest = b_version
+    while (a_token == b_token and a_token not in ["end", "invalid"] and
+           a_value == b_value):
+        (a_token, a_value, a_rest) = get_token(a_token, a_rest)
+        (b_token, b_value, b_rest) = get_token(b_token, b_rest)
+    if a_value != b_value:
+        return -1 if a_value < b_value else 1
+    if a_token == b_token or fuzzy:
+        return 0
+    if a_token == "suffix":
+        (a_token, a_value, a_rest) = get_token(a_token, a_rest)
+        if a_value < 0:
+            return -1
+    if b_token == "suffix":
+        (b_token, b_value, b_rest) = get_token(b_token, b_rest)
+        if b_value < 0:
+            return 1
+    if token_value(a_token) > token_value(b_token):
+        return -1
+    if token_value(a_token) < token_value(b_token):
+        return 1
+    return 0
+
+
+def version_pairs():
+    """ :returns: pairs of all version strings from the apk-tools tests """
+    versions = []
+    with open(pmb_test.const.testdata + "/version/version.data") as handle:
+        for line in handle:
+            split = line.split(" ")
+            versions += [split[0], split[2].split("#")[0].rstrip()]
+    return list(zip(versions, versions[1:]))
+
+
+def test_version_compare_reference():
+    # Same results as the reference, also with fuzzy
+    for a, b in version_pairs():
+        for fuzzy in [False, True]:
+            expected = compare_reference(a, b, fuzzy)
+            assert pmb.parse.version.compare(a, b, fuzzy) == expected
+
+
+@pytest.mark.benchmark
+def test_version_benchmark():
+    pairs = version_pairs() * 10
+
+    # Print the speedup (pytest -m benchmark -s)
+    begin = time.perf_counter()
+    for a, b in pairs:
+        compare_reference(a, b)
+    time_reference = time.perf_counter() - begin
+    begin = time.perf_counter()
+    for a, b in pairs:
+        pmb.parse.version.compare(a, b)
+    time_key = time.perf_counter() - begin
+    print(f"{len(pairs)} comparisons: {time_reference:.4f}s (reference),"
+          f" {time_key:.4f}s (VersionKey)")
+
+
+def test_version_key():
+    func = pmb.parse.version.key
+    assert func("1.0-r1") is func("1.0-r1")
+    assert func("1.0-r0") == func("1.0-r0")
+    assert func("1.0") > func("1")
+    assert func("1.0") < func("1.0-r1") < func("1.0a") <= func("1.0a")
+    versions = ["2.0", "1.0a", "1.0", "10", "1.0-r3"]
+    assert sorted(versions, key=func) == ["1.0", "1.0-r3", "1.0a", "2.0",
+                                          "10"]